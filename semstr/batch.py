@@ -0,0 +1,145 @@
+#!/usr/bin/env python3
+
+import os
+import runpy
+import shlex
+import sys
+import time
+import traceback
+import warnings
+from multiprocessing import Pool
+
+import configargparse
+
+description = """Runs many semstr commands in one process (or a few), so that the interpreter, imported modules and
+loaded resources (e.g. spaCy models, AMR resources) are reused rather than loaded again for every command.
+Each line of the job files is a command in the usual syntax, e.g. `python -m semstr.convert a.sdp -f conllu`,
+`semstr.evaluate guessed ref` or `semstr/scripts/validate.py a.xml`. Empty lines and lines starting with # are ignored.
+The status of each job is printed to stderr after it finishes."""
+
+STATUS_TITLES = ("job", "status", "seconds", "command")
+
+
+def read_jobs(filenames):
+    """
+    :param filenames: job files, where "-" means standard input
+    :return: generator of command lines
+    """
+    for filename in filenames:
+        if filename == "-":
+            yield from filter_jobs(sys.stdin)
+        else:
+            with open(filename, encoding="utf-8") as f:
+                yield from filter_jobs(f)
+
+
+def filter_jobs(lines):
+    for line in lines:
+        line = line.strip()
+        if line and not line.startswith("#"):
+            yield line
+
+
+def parse_command(line):
+    """
+    :param line: command line to run a semstr module or script, optionally starting with "python -m"
+    :return: pair of (module name or script path, list of arguments)
+    """
+    argv = shlex.split(line)
+    if argv and os.path.basename(argv[0]).startswith("python"):
+        argv = argv[1:]
+        if argv[:1] == ["-m"]:
+            argv = argv[1:]
+    if not argv:
+        raise ValueError("No module or script to run: '%s'" % line)
+    return argv[0], argv[1:]
+
+
+def run_job(job):
+    """
+    Run one command as if it was the main module, restoring the arguments and working directory afterwards
+    :param job: pair of (index, command line)
+    :return: tuple of (index, exit status, seconds, command line)
+    """
+    i, line = job
+    prev_argv, prev_dir = sys.argv, os.getcwd()
+    start = time.perf_counter()
+    status = 0
+    try:
+        target, args = parse_command(line)
+        if target.endswith(".py"):
+            sys.argv = [target] + args
+            runpy.run_path(target, run_name="__main__")
+        else:
+            sys.argv = [target] + args  # runpy replaces the first item by the module's file name
+            with warnings.catch_warnings():  # the module may have been imported already, by previous jobs
+                warnings.filterwarnings("ignore", category=RuntimeWarning, module="runpy")
+                runpy.run_module(target, run_name="__main__", alter_sys=True)
+    except SystemExit as e:
+        if e.code is None or isinstance(e.code, int):
+            status = e.code or 0
+        else:  # sys.exit with a message
+            print(e.code, file=sys.stderr)
+            status = 1
+    except Exception:
+        traceback.print_exc()
+        status = 1
+    finally:
+        sys.argv = prev_argv
+        os.chdir(prev_dir)
+        sys.stdout.flush()
+        sys.stderr.flush()
+    return i, status, time.perf_counter() - start, line
+
+
+def run_jobs(lines, workers=1):
+    """
+    :param lines: iterable of command lines
+    :param workers: number of processes to run jobs in (each keeps its loaded resources across jobs)
+    :return: generator of (index, exit status, seconds, command line) tuples, in the order of the jobs
+    """
+    jobs = enumerate(lines, start=1)
+    if workers > 1:
+        with Pool(workers) as pool:
+            yield from pool.imap(run_job, jobs)
+    else:
+        yield from map(run_job, jobs)
+
+
+def main(args):
+    failed = 0
+    status_file = open(args.status_file, "w", encoding="utf-8") if args.status_file else None
+    try:
+        if status_file:
+            print(*STATUS_TITLES, sep="\t", file=status_file)
+        for i, status, seconds, line in run_jobs(read_jobs(args.filenames), workers=args.workers):
+            failed += bool(status)
+            print("[%s] job %d (%.3fs): %s" % ("FAILED %s" % status if status else "OK", i, seconds, line),
+                  file=sys.stderr)
+            if status_file:
+                print(i, status, "%.3f" % seconds, line, sep="\t", file=status_file, flush=True)
+            if status and args.strict:
+                break
+    finally:
+        if status_file:
+            status_file.close()
+    if failed:
+        print("%d job(s) failed" % failed, file=sys.stderr)
+        sys.exit(1)
+
+
+def check_args(parser, args):
+    if args.workers < 1:
+        parser.error("--workers must be positive")
+    return args
+
+
+if __name__ == '__main__':
+    argparser = configargparse.ArgParser(description=description)
+    argparser.add_argument("filenames", nargs="*", default=["-"], help="job files, one command per line (default: "
+                                                                       "read from standard input)")
+    argparser.add_argument("-w", "--workers", type=int, default=1, help="number of processes to run jobs in")
+    argparser.add_argument("-s", "--status-file", help="file to write the status of each job to, in TSV format")
+    argparser.add_argument("-S", "--strict", action="store_true", help="stop after the first failed job")
+    main(check_args(argparser, argparser.parse_args()))
+    sys.exit(0)
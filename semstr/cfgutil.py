@@ -92,5 +92,7 @@ def add_specs_args(p):
     group.add_argument("-u", "--udpipe", help="use specified UDPipe model, not spaCy, for syntactic annotation")
     group.add_argument("-s", "--stanfordnlp", help="use specified StanfordNLP model for syntactic annotation")
     group.add_argument("-c", "--conllu", help="copy syntactic annotation from specified CoNLL-U files instead of spaCy")
+    p.add_argument("--batch-size", type=int, default=1000, help="number of sentences to parse at a time with UDPipe or "
+                                                                "StanfordNLP (0 for all at once)")
     p.add_argument("-j", "--join", help="concatenate all output files to a file with this name")
     p.add_argument("-b", "--binary", action="store_true", help="write in binary format (.pickle)")
@@ -1,6 +1,9 @@
+import numpy as np
+
 from ..constraints import Constraints
 from ..util.amr import TERMINAL_DEP, WIKI, POLARITY, CENTURY, DECADE, TERMINAL_TAGS, PREFIXED_RELATION_ENUM, \
-    get_node_attr, LABEL_ATTRIB, is_concept, is_valid_arg
+    get_node_attr, LABEL_ATTRIB, LABEL_SEPARATOR, NUM, is_concept, is_valid_arg, is_valid_resolved_arg, \
+    resolve_label, get_terminals, lemmatize, read_resources
 
 
 class AmrConstraints(Constraints):
@@ -9,6 +12,7 @@ class AmrConstraints(Constraints):
                          allow_root_terminal_children=True, possible_multiple_incoming={TERMINAL_DEP},
                          childless_incoming_trigger={WIKI, POLARITY, CENTURY, DECADE, "polite", "li"},
                          childless_outgoing_allowed=TERMINAL_TAGS, **kwargs)
+        self.label_vocabulary = None
 
     def allow_action(self, action, history):
         return True
@@ -25,8 +29,122 @@ class AmrConstraints(Constraints):
     def allow_child(self, node, tag):
         return not tag or is_valid_arg(node, get_node_attr(node, LABEL_ATTRIB), tag, is_parent=False)
 
+    def allow_edge_mask(self, parent, child, tags):
+        existing = {e.tag for e in parent.outgoing if e.child == child}
+        return np.array([tag in PREFIXED_RELATION_ENUM or tag not in existing for tag in tags], dtype=bool)
+
+    def allow_parent_mask(self, node, tags):
+        label = get_node_attr(node, LABEL_ATTRIB)
+        implicit = get_node_attr(node, "implicit")
+        concept = label is None or is_concept(label)
+        valid_arg = ValidArgs(node, label)
+        return np.array([(not implicit or tag not in TERMINAL_TAGS) and (concept or tag in TERMINAL_TAGS) and
+                         (not tag or valid_arg(tag)) for tag in tags], dtype=bool)
+
+    def allow_child_mask(self, node, tags):
+        valid_arg = ValidArgs(node, get_node_attr(node, LABEL_ATTRIB), is_parent=False)
+        return np.array([not tag or valid_arg(tag) for tag in tags], dtype=bool)
+
+    def allow_label_mask(self, node, labels):
+        """
+        Vectorized allow_label: which labels in a vocabulary are allowed for the node
+        :param node: node to label
+        :param labels: AmrLabelVocabulary, or sequence of labels (its vocabulary is cached until another one is given)
+        :return: NumPy boolean array, with True for each allowed label
+        """
+        if not isinstance(labels, AmrLabelVocabulary):
+            if self.label_vocabulary is None or self.label_vocabulary.labels is not labels:
+                self.label_vocabulary = AmrLabelVocabulary(labels)
+            labels = self.label_vocabulary
+        mask = labels.is_concept | (node.outgoing_tags <= TERMINAL_TAGS and not node.is_root)
+        if node.parents:
+            mask = mask & labels.valid_arg_mask(node, node.outgoing_tags) & \
+                   labels.valid_arg_mask(node, node.incoming_tags, is_parent=False)
+        return mask
+
     def allow_label(self, node, label):
         return (is_concept(label) or node.outgoing_tags <= TERMINAL_TAGS and not node.is_root) and \
                (not node.parents or
                 is_valid_arg(node, label, *node.outgoing_tags) and
                 is_valid_arg(node, label, *node.incoming_tags, is_parent=False))
+
+
+class ValidArgs:
+    """
+    is_valid_arg for a fixed node and label, with the label resolved only once, for checking many single edge tags
+    """
+    def __init__(self, node, label, is_parent=True):
+        self.node = node
+        self.label = label
+        self.is_parent = is_parent
+        self.resolved = None
+
+    def __call__(self, tag):
+        if self.label is None or tag in TERMINAL_TAGS:  # Not labeled yet or unlabeled parsing
+            return True
+        if self.resolved is None:
+            self.resolved = resolve_label(self.node, self.label, conservative=True, wikification=False)
+        return bool(is_valid_resolved_arg(self.resolved, (tag,), self.is_parent))
+
+
+class AmrLabelVocabulary:
+    """
+    Node label vocabulary with label properties precomputed for allowed-label masks (see AmrConstraints).
+    Labels without placeholders are resolved once, and their validity is cached per set of edge tags, since it does not
+    depend on the node otherwise. Labels with placeholders (or numbers) depend on the node's terminals, so they are
+    resolved per set of terminals, and checked one by one.
+    """
+    MAX_CACHED = 10000
+
+    def __init__(self, labels):
+        """
+        :param labels: sequence of node labels (strings, possibly None)
+        """
+        read_resources()
+        self.labels = labels
+        self.is_concept = np.array([is_concept(label) for label in labels], dtype=bool)
+        self.resolved = [None if label is None else label.partition(LABEL_SEPARATOR)[0] for label in labels]
+        self.dynamic = np.array([label is not None and ("<" in label or label.startswith(NUM))
+                                 for label in self.resolved], dtype=bool)
+        self.dynamic_indices = np.flatnonzero(self.dynamic)
+        self.static_masks = {}  # (tags, is_parent) -> mask of valid labels, for labels resolved without the node
+        self.dynamic_resolved = {}  # terminals -> labels with placeholders resolved for them, for dynamic labels
+
+    def valid_arg_mask(self, node, tags, is_parent=True):
+        """
+        Vectorized is_valid_arg
+        :param node: node to label
+        :param tags: edge tags of the node
+        :param is_parent: whether the node is the parent (rather than the child) of the edges
+        :return: NumPy boolean array, with True for each label that is valid with the edge tags
+        """
+        tags = tuple(tags)
+        if tags and TERMINAL_TAGS.issuperset(filter(None, tags)):  # Not labeled yet or unlabeled parsing
+            return np.ones(len(self.labels), dtype=bool)
+        key = (frozenset(tags), is_parent)
+        mask = self.static_masks.get(key)
+        if mask is None:
+            if len(self.static_masks) >= self.MAX_CACHED:
+                self.static_masks.clear()
+            mask = self.static_masks[key] = np.array([
+                label is None or dynamic or bool(is_valid_resolved_arg(label, tags, is_parent))
+                for label, dynamic in zip(self.resolved, self.dynamic)], dtype=bool)
+        if not len(self.dynamic_indices):
+            return mask
+        mask = mask.copy()
+        mask[self.dynamic_indices] = [bool(is_valid_resolved_arg(label, tags, is_parent))
+                                      for label in self.resolve_dynamic(node)]
+        return mask
+
+    def resolve_dynamic(self, node):
+        """
+        :return: list of resolved labels for the node, for labels that depend on the node's terminals
+        """
+        key = tuple((t.text, lemmatize(t)) for t in get_terminals(node))
+        resolved = self.dynamic_resolved.get(key)
+        if resolved is None:
+            if len(self.dynamic_resolved) >= self.MAX_CACHED:
+                self.dynamic_resolved.clear()
+            resolved = self.dynamic_resolved[key] = [resolve_label(node, self.labels[i], conservative=True,
+                                                                   wikification=False) for i in self.dynamic_indices]
+        return resolved
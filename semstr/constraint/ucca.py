@@ -1,3 +1,4 @@
+import numpy as np
 from ucca import layer0
 from ucca.layer1 import EdgeTags
 
@@ -31,3 +32,8 @@ class UccaConstraints(Constraints):
             return Valid(tag == EdgeTags.Punctuation, message="%s must only be %s child, but got %s edge" % (
                 node, EdgeTags.Punctuation, tag))
         return True
+
+    def allow_child_mask(self, node, tags):
+        if node.children and all(e.child.tag == layer0.NodeTags.Punct for e in node):
+            return np.array([tag == EdgeTags.Punctuation for tag in tags], dtype=bool)
+        return np.ones(len(tags), dtype=bool)
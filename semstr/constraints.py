@@ -1,5 +1,8 @@
+from collections import Counter, namedtuple
 from enum import Enum
 
+import numpy as np
+
 
 class Direction(Enum):
     incoming = 0
@@ -58,12 +61,149 @@ class TagRule:
         return None
 
 
+class CompiledTagRules:
+    """
+    Tag rules compiled against a tag vocabulary, for checking many tags quickly (e.g., at every parser action).
+    Each tag gets a bit, so that the tags a node has are represented by an integer mask per direction (see TagMasks).
+    The rules each tag may violate in each direction are precomputed, and checking them takes a few bitwise operations.
+    Tags not in the initial vocabulary are added to it when first seen.
+    """
+    def __init__(self, rules, tags=()):
+        """
+        :param rules: list of TagRule objects
+        :param tags: vocabulary of edge tags to compile the rules for in advance
+        """
+        self.rules = list(rules)
+        self.bits = {}
+        self.triggers = [[0, 0] for _ in self.rules]  # rule index -> direction value -> mask of trigger tags
+        self.allowed = [[None if rule.allowed is None or rule.allowed.get(d) is None else 0 for d in Direction]
+                        for rule in self.rules]  # None means anything is allowed
+        self.disallowed = [[0, 0] for _ in self.rules]
+        self.dispatch = {}  # (direction, tag) -> (indices of rules rejecting tag if triggered, of rules tag triggers)
+        for tag in tags:
+            self.bit(tag)
+
+    def bit(self, tag):
+        """
+        :param tag: edge tag
+        :return: integer with the single bit representing the tag set
+        """
+        bit = self.bits.get(tag)
+        if bit is None:
+            bit = self.bits[tag] = 1 << len(self.bits)
+            for i, rule in enumerate(self.rules):
+                for d in Direction:
+                    if contains(rule.trigger.get(d), tag):
+                        self.triggers[i][d.value] |= bit
+                    if self.allowed[i][d.value] is not None and contains(rule.allowed.get(d), tag):
+                        self.allowed[i][d.value] |= bit
+                    if rule.disallowed is not None and contains(rule.disallowed.get(d), tag):
+                        self.disallowed[i][d.value] |= bit
+        return bit
+
+    def mask(self, tags):
+        mask = 0
+        for tag in tags:
+            mask |= self.bit(tag)
+        return mask
+
+    def rules_for(self, direction, tag):
+        """
+        :return: pair of lists of rule indices: rules that reject the tag in this direction if triggered by existing
+                 edges, and rules triggered by the tag itself in this direction
+        """
+        key = (direction, tag)
+        entry = self.dispatch.get(key)
+        if entry is None:
+            bit, d = self.bit(tag), direction.value
+            entry = self.dispatch[key] = (
+                [i for i, (allowed, disallowed) in enumerate(zip(self.allowed, self.disallowed))
+                 if allowed[d] is not None and not allowed[d] & bit or disallowed[d] & bit],
+                [i for i, trigger in enumerate(self.triggers) if trigger[d] & bit])
+        return entry
+
+    def violations(self, masks, tag, direction, existing=False):
+        """
+        Find which rules an edge violates, equivalently to calling TagRule.violation for each rule
+        :param masks: TagMasks for the node (the checked edge is not counted if it already exists)
+        :param tag: edge tag
+        :param direction: direction of the edge with respect to the node
+        :param existing: whether the edge already exists, rather than being checked before it is added
+        :return: list of violated rule indices, in increasing order (use message() to describe them)
+        """
+        incoming, outgoing = masks.without(direction, tag) if existing else masks.masks
+        rejected, triggered = self.rules_for(direction, tag)
+        violated = [i for i in rejected if incoming & self.triggers[i][0] or outgoing & self.triggers[i][1]]
+        if not existing:
+            for i in triggered:
+                masks = zip((incoming, outgoing), self.allowed[i], self.disallowed[i])
+                if i not in violated and any(mask & disallowed or allowed is not None and mask & ~allowed
+                                             for mask, allowed, disallowed in masks):
+                    violated.append(i)
+            violated.sort()
+        return violated
+
+    def message(self, i, node, tag, direction):
+        """
+        :param i: index of violated rule, as returned by violations()
+        :param node: node to describe, which has the edges the masks passed to violations() were created from
+        :param tag: edge tag or Edge (if it already exists)
+        :param direction: direction of the edge with respect to the node
+        :return: message describing the violation
+        """
+        return self.rules[i].violation(node, tag, direction, message=True)
+
+
+class TagMasks:
+    """
+    Bitmasks of the tags of the incoming and outgoing edges of one node, updated incrementally as edges are added
+    """
+    def __init__(self, compiled, node=None):
+        """
+        :param compiled: CompiledTagRules object, to get tag bits from
+        :param node: node to initialize the masks by the existing edges of
+        """
+        self.compiled = compiled
+        self.counts = (Counter(), Counter())  # direction value -> tag -> number of edges
+        self.masks = [0, 0]
+        if node is not None:
+            for edge in node.incoming:
+                self.add(Direction.incoming, edge.tag)
+            for edge in node:
+                self.add(Direction.outgoing, edge.tag)
+
+    def add(self, direction, tag):
+        counts = self.counts[direction.value]
+        counts[tag] += 1
+        if counts[tag] == 1:
+            self.masks[direction.value] |= self.compiled.bit(tag)
+
+    def remove(self, direction, tag):
+        counts = self.counts[direction.value]
+        counts[tag] -= 1
+        if counts[tag] <= 0:
+            del counts[tag]
+            self.masks[direction.value] &= ~self.compiled.bit(tag)
+
+    def without(self, direction, tag):
+        """
+        :return: pair of (incoming, outgoing) masks, without counting one edge with the given tag and direction
+        """
+        masks = list(self.masks)
+        if self.counts[direction.value][tag] <= 1:
+            masks[direction.value] &= ~self.compiled.bit(tag)
+        return masks
+
+
 def set_prod(set1, set2=None):
     for x in set1:
         for y in set1 if set2 is None else set2:
             yield x, y
 
 
+CandidateEdge = namedtuple("CandidateEdge", ("parent", "child", "tag"))  # Edge that does not exist yet
+
+
 class Valid:
     def __init__(self, valid=True, message=""):
         self.valid = valid
@@ -107,6 +247,13 @@ class Constraints:
             [TagRule(trigger={Direction.outgoing: t1}, disallowed={Direction.outgoing: t2})
              for t1, t2 in set_prod(mutually_exclusive_outgoing)]
 
+    def compile_tag_rules(self, tags=()):
+        """
+        :param tags: vocabulary of edge tags
+        :return: CompiledTagRules for this object's tag rules
+        """
+        return CompiledTagRules(self.tag_rules, tags)
+
     def allow_action(self, action, history):
         return self.implicit or history or action.tag is None  # First action must not create nodes/edges
 
@@ -121,3 +268,42 @@ class Constraints:
 
     def allow_label(self, node, label):
         return True
+
+    def allow_edge_mask(self, parent, child, tags):
+        """
+        :param parent: parent node of the edge
+        :param child: child node of the edge
+        :param tags: sequence of edge tags
+        :return: NumPy boolean array, with True for each tag allow_edge allows for an edge between the nodes
+        """
+        if type(self).allow_edge is Constraints.allow_edge:
+            return np.ones(len(tags), dtype=bool)
+        return np.array([bool(self.allow_edge(CandidateEdge(parent, child, tag))) for tag in tags], dtype=bool)
+
+    def allow_parent_mask(self, node, tags):
+        """
+        :param node: node to be the parent of an edge
+        :param tags: sequence of edge tags
+        :return: NumPy boolean array, with True for each tag allow_parent allows for the node
+        """
+        if type(self).allow_parent is Constraints.allow_parent:
+            return np.ones(len(tags), dtype=bool)
+        return np.array([bool(self.allow_parent(node, tag)) for tag in tags], dtype=bool)
+
+    def allow_child_mask(self, node, tags):
+        """
+        :param node: node to be the child of an edge
+        :param tags: sequence of edge tags
+        :return: NumPy boolean array, with True for each tag allow_child allows for the node
+        """
+        if type(self).allow_child is Constraints.allow_child:
+            return np.ones(len(tags), dtype=bool)
+        return np.array([bool(self.allow_child(node, tag)) for tag in tags], dtype=bool)
+
+    def allow_label_mask(self, node, labels):
+        """
+        :param node: node to label
+        :param labels: sequence of labels
+        :return: NumPy boolean array, with True for each label allow_label allows for the node
+        """
+        return np.array([bool(self.allow_label(node, label)) for label in labels], dtype=bool)
@@ -8,7 +8,7 @@ from operator import attrgetter
 from ucca import layer0, layer1, convert, textutil
 
 from .format import FormatConverter
-from ..util.amr import parse, amr_lib, resolve_label, EXTENSIONS, COMMENT_PREFIX, DEP_PREFIX, \
+from ..util.amr import parse, get_amr_lib, resolve_label, COMMENT_PREFIX, DEP_PREFIX, \
     TOP_DEP, PREFIXED_RELATION_PATTERN, PREFIXED_RELATION_SUBSTITUTION, LABEL_ATTRIB, NAME, OP, PUNCTUATION_DEP, \
     PUNCTUATION_LABEL, TERMINAL_DEP, ALIGNMENT_PREFIX, ALIGNMENT_SEP, SKIP_TOKEN_PATTERN, CONCEPT, NUM, WIKI, CONST, \
     NUM_PATTERN, MINUS, WIKIFIER, TERMINAL_TAGS, is_concept, INSTANCE, PREFIXED_RELATION_ENUM, PREFIXED_RELATION_PREP
@@ -35,7 +35,7 @@ class AmrConverter(FormatConverter):
         self.format = "amr"
 
     def from_format(self, lines, passage_id, return_original=False, save_original=True, remove_cycles=True,
-                    wikification=True, placeholders=True, **kwargs):
+                    wikification=True, placeholders=True, annotation_cache=None, **kwargs):
         self.passage_id = passage_id
         self.return_original = return_original
         self.save_original = save_original
@@ -45,11 +45,18 @@ class AmrConverter(FormatConverter):
         self.set_extensions(**kwargs)
         passages = self._init_passages(self._amr_generator(lines), **kwargs)
         if placeholders:
-            passages = textutil.annotate_all(passages, as_array=True, as_tuples=True)
+            from semstr.util.annotation_cache import get_annotation_cache
+            cache = get_annotation_cache(annotation_cache)
+            passages = cache.annotate(passages, self._annotate, as_tuples=True) if cache else self._annotate(passages)
         for passage, graph in passages:
             yield self._build_passage(passage, graph)
 
+    @staticmethod
+    def _annotate(passages):
+        return textutil.annotate_all(passages, as_array=True, as_tuples=True)
+
     def set_extensions(self, **kwargs):
+        from ..util.amr import EXTENSIONS
         self.extensions = [l for l in EXTENSIONS if kwargs.get(l)]
         self.excluded = {i for l, r in EXTENSIONS.items() if l not in self.extensions for i in r}
 
@@ -129,6 +136,7 @@ class AmrConverter(FormatConverter):
                 q += [d for _, _, d in amr.triples(head=x)]
             return False
 
+        amr_lib = get_amr_lib()
         top = amr.triples(rel=TOP_DEP)  # start breadth-first search from :top relation
         assert len(top) == 1, "There must be exactly one %s edge, but %d are found" % (TOP_DEP, len(top))
         _, _, root = top[0]  # init with child of TOP
@@ -191,6 +199,7 @@ class AmrConverter(FormatConverter):
                     parent.add(tag, terminal)
 
     def align_nodes(self, amr):
+        amr_lib = get_amr_lib()
         preterminals = {}
         alignments = amr.alignments()
         tokens = amr.tokens()
@@ -9,6 +9,20 @@ from ucca.layer1 import EdgeTags
 
 from .format import FormatConverter
 
+SENTENCE_ID_PATTERNS = (re.compile(r"#(\S+)$"), re.compile(r"#\s*(\d+).*"), re.compile(r"#\s*sent_id\s*=\s*(\S+)"))
+
+
+def match_sentence_id(line):
+    """
+    :param line: comment line, stripped
+    :return: match object whose first group is the sentence ID, or None if the comment does not contain it
+    """
+    for pattern in SENTENCE_ID_PATTERNS:
+        m = pattern.match(line)
+        if m:
+            return m
+    return None
+
 
 class DependencyConverter(FormatConverter):
     """
@@ -340,8 +354,7 @@ class DependencyConverter(FormatConverter):
             line = line.strip()
             if line.startswith("#"):  # comment
                 self.lines_read.append(line)
-                m = re.match(r"#(\S+)$", line) or re.match(r"#\s*(\d+).*", line) or \
-                    re.match(r"#\s*sent_id\s*=\s*(\S+)", line)
+                m = match_sentence_id(line)
                 if m:  # comment may optionally contain the sentence ID
                     sentence_id = m.group(1)
                 else:
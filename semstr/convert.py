@@ -86,13 +86,15 @@ def from_amr(lines, passage_id=None, return_original=False, save_original=True,
     :param return_original: return triple of (UCCA passage, AMR string, AMR ID)
     :param wikification: whether to use wikification for replacing node labels with placeholders based on tokens
     :param placeholders: introduce placeholders into node labels when they include the terminal's text?
+    :param annotation_cache: directory to cache spaCy annotations in, when introducing placeholders
+                             (default: taken from SEMSTR_ANNOTATION_CACHE, if set)
 
     :return generator of Passage objects
     """
     from semstr.conversion.amr import AmrConverter
     return AmrConverter().from_format(lines, passage_id=passage_id, return_original=return_original,
                                       save_original=save_original, wikification=wikification, placeholders=placeholders,
-                                      format=kwargs.get("format"))
+                                      format=kwargs.get("format"), annotation_cache=kwargs.get("annotation_cache"))
 
 
 def to_amr(passage, metadata=True, wikification=True, use_original=True, verbose=False, default_label=None,
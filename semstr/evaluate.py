@@ -1,15 +1,22 @@
 #!/usr/bin/env python3
 
 import csv
+import hashlib
+import importlib
+import json
 import os
 import re
 import sys
-from itertools import groupby, repeat
+import tempfile
+from collections import Counter, OrderedDict, deque
+from itertools import chain, count, groupby, repeat
 
 import configargparse
 from tqdm import tqdm
 from ucca import ioutil, constructions as ucca_constructions
-from ucca.evaluation import LABELED, UNLABELED, evaluate as evaluate_ucca
+from ucca import evaluation
+from ucca.evaluation import LABELED, UNLABELED, EvaluatorResults, SummaryStatistics, \
+    evaluate as evaluate_ucca
 
 from semstr.cfgutil import add_verbose_arg, add_boolean_option
 from semstr.convert import CONVERTERS, UCCA_EXT
@@ -44,9 +51,13 @@ class Scores:
     """
     Keeps score objects from multiple formats and/or languages
     """
-    def __init__(self, scores):
-        self.elements = [(t.aggregate(s), l) for (t, l), s in groupby(scores,
-                                                                      lambda x: (type(x), getattr(x, "lang", None)))]
+    def __init__(self, scores=(), elements=None):
+        """
+        :param scores: score objects to group by type and language, aggregating each group
+        :param elements: list of (aggregated score, lang) pairs to use directly instead of scores
+        """
+        self.elements = [(t.aggregate(s), l) for (t, l), s in groupby(scores, lambda x: (
+            type(x), getattr(x, "lang", None)))] if elements is None else elements
         element, _ = self.elements[0] if len(self.elements) == 1 else (None, None)
         self.name = element.name if element else "Multiple"
         self.format = element.format if element else None
@@ -79,6 +90,30 @@ class Scores:
         print(",".join(self.fields()))
 
 
+class ScoresAccumulator:
+    """
+    Folds score objects into running aggregates one at a time, instead of keeping all of them as Scores(scores) does.
+    Consecutive scores of the same type and language are aggregated together, just like in Scores.
+    """
+    def __init__(self):
+        self.elements = []  # list of [(type, lang), aggregated score]
+        self.count = 0
+
+    def add(self, score):
+        key = (type(score), getattr(score, "lang", None))
+        if self.elements and self.elements[-1][0] == key:
+            self.elements[-1][1] = key[0].aggregate([self.elements[-1][1], score])
+        else:
+            self.elements.append([key, key[0].aggregate([score])])
+        self.count += 1
+
+    def summary(self):
+        """
+        :return: Scores object equal to the one obtained by passing all added score objects to Scores directly
+        """
+        return Scores(elements=[(s, l) for (_, l), s in self.elements])
+
+
 class ConvertedPassage:
     def __init__(self, converted, original=None, passage_id=None,
                  converted_format=None, in_converter=None, out_converter=None):
@@ -95,12 +130,30 @@ def passage_format(filename):
     return basename, None if ext in UCCA_EXT else ext.lstrip(".")
 
 
-def read_files(files, verbose=0, force_basename=False, **kw):
+def sort_files(files):
     try:
-        files = sorted(files, key=lambda x: tuple(map(int, re.findall("\d+", x))) or (x,))
+        return sorted(files, key=lambda x: tuple(map(int, re.findall("\d+", x))) or (x,))
     except TypeError as e:
         print("Cannot sort filenames: %s" % e, file=sys.stderr)
-    for filename in files:
+    return files
+
+
+# Formats with passages separated by blank lines, which can be skipped before they are converted, and whether a comment
+# line right after a passage ends it too
+LINE_SEPARATED_FORMATS = {"conll": False, "conllu": False, "sdp": False, "amr": True}
+
+
+def read_files(files, verbose=0, force_basename=False, shard=None, **kw):
+    """
+    :param shard: pair of (i, N), to read only passages whose index (over all files) modulo N is i-1: when possible,
+                  the others are skipped before they are converted
+    """
+    positions = count()
+
+    def _selected():  # called once for every passage, in order
+        return shard is None or next(positions) % shard[1] == shard[0] - 1
+
+    for filename in sort_files(files):
         basename, converted_format = passage_format(filename)
         if converted_format == "txt":
             converted_format = kw["format"]
@@ -108,31 +161,67 @@ def read_files(files, verbose=0, force_basename=False, **kw):
         kwargs = dict(converted_format=converted_format, in_converter=in_converter, out_converter=out_converter)
         if in_converter:
             with open(filename, encoding="utf-8") as f:
-                for converted, passage, passage_id in in_converter(f, passage_id=basename, return_original=True, **kw):
+                skip_lines = shard is not None and converted_format in LINE_SEPARATED_FORMATS
+                lines = select_passages(f, _selected, LINE_SEPARATED_FORMATS[converted_format]) if skip_lines else f
+                for converted, passage, passage_id in in_converter(lines, passage_id=basename, return_original=True,
+                                                                   **kw):
+                    if not skip_lines and not _selected():
+                        continue
                     if verbose:
                         with ioutil.external_write_mode():
                             print("Converting %s from %s" % (filename, converted_format))
                     yield ConvertedPassage(converted, passage, basename if force_basename else passage_id, **kwargs)
-        else:
+        elif _selected():
             passage_id = basename if force_basename else None
             yield ConvertedPassage(ioutil.file2passage(filename), passage_id=passage_id, **kwargs)
 
 
+def select_passages(lines, selected, comments_end_passages=False):
+    """
+    Filter the lines of a file in one of LINE_SEPARATED_FORMATS, keeping only those of selected passages
+    :param lines: iterable of lines
+    :param selected: function called once for every passage, in order, returning whether to keep it
+    :param comments_end_passages: whether a comment line right after a passage ends it (otherwise only a blank line)
+    :return: generator of lines
+    """
+    passage_lines, content = [], False
+    for line in lines:
+        passage_lines.append(line)
+        stripped = line.strip()
+        if stripped and not stripped.startswith("#"):
+            content = True
+        elif content and (comments_end_passages or not stripped):
+            if selected():
+                yield from passage_lines
+            passage_lines, content = [], False
+    if content and selected():
+        yield from passage_lines
+
+
 def evaluate_all(evaluate, files, name=None, verbose=0, quiet=False, basename=False, matching_ids=False,
-                 units=False, unlabeled=False, **kwargs):
-    guessed, ref = [iter(read_files(f, verbose=verbose, force_basename=basename, **kwargs)) for f in files[:2]]
+                 units=False, unlabeled=False, shard=None, cache_dir=None, progress=True, **kwargs):
+    if cache_dir:
+        yield from evaluate_cached(evaluate, files, cache_dir, name=name, verbose=verbose, quiet=quiet,
+                                   basename=basename, matching_ids=matching_ids, units=units, unlabeled=unlabeled,
+                                   shard=shard, **kwargs)
+        return
+    read_shard = None if matching_ids else shard  # passages are paired by index, so each side can be sharded alone
+    guessed, ref = [iter(read_files(f, verbose=verbose, force_basename=basename, shard=read_shard, **kwargs))
+                    for f in files[:2]]
     ref_yield_kwargs = dict(kwargs)
     ref_yield_kwargs.update(dep=True, enhanced=False)
     ref_yield_tags = repeat(None) if len(files) < 3 or files[2] is None else \
-        iter(read_files(files[2], verbose=verbose, **ref_yield_kwargs))
-    t = tqdm(zip(guessed, ref, ref_yield_tags), unit=" passages", desc=name, total=len(files[1]))
+        iter(read_files(files[2], verbose=verbose, shard=read_shard, **ref_yield_kwargs))
+    if matching_ids:
+        sizes = [sum(map(os.path.getsize, f)) for f in files[:2]]
+        passages = join_by_id(guessed, zip(ref, ref_yield_tags), index_guessed=sizes[0] <= sizes[1])
+    else:
+        passages = zip(guessed, ref, ref_yield_tags)
+    if shard and matching_ids:  # pairs are only known after reading all passages
+        index, num_shards = shard
+        passages = (p for i, p in enumerate(passages) if i % num_shards == index - 1)
+    t = tqdm(passages, unit=" passages", desc=name, total=len(files[1]), disable=not progress)
     for (g, r, ryt) in t:
-        if matching_ids:
-            while g.ID < r.ID:
-                g = next(guessed)
-            while g.ID > r.ID:
-                r = next(ref)
-                ryt = next(ref_yield_tags)
         if not quiet:
             with ioutil.external_write_mode():
                 print(r.ID, end=" ")
@@ -148,7 +237,8 @@ def evaluate_all(evaluate, files, name=None, verbose=0, quiet=False, basename=Fa
         result = evaluate(verbose=verbose > 1 or units, **evaluate_kwargs)
         if not quiet:
             with ioutil.external_write_mode():
-                print("F1: %.3f" % result.average_f1(UNLABELED if unlabeled else LABELED))
+                print("F1: %.3f" % result.average_f1(UNLABELED if unlabeled else LABELED),
+                      "(truncated)" if getattr(result, "truncated", False) else "")
         if verbose:
             with ioutil.external_write_mode():
                 result.print()
@@ -156,6 +246,177 @@ def evaluate_all(evaluate, files, name=None, verbose=0, quiet=False, basename=Fa
         yield result
 
 
+def evaluate_cached(evaluate, files, cache_dir, name=None, quiet=False, matching_ids=False, unlabeled=False,
+                    **kwargs):
+    """
+    Like evaluate_all, but loading per-passage results from the cache where the files and options have not changed,
+    and storing them there otherwise.
+    If there is the same number of guessed and reference files, each pair of files (by sorted order) is cached
+    separately, so that only changed files are evaluated again. Otherwise, all files are cached as a whole.
+    """
+    cache = EvaluationCache(cache_dir, evaluate, matching_ids=matching_ids, unlabeled=unlabeled, **kwargs)
+    groups = [files] if matching_ids else cache.group_files(files)
+    for group in tqdm(groups, unit=" files", desc=name):
+        key = cache.key(group)
+        results = cache.load(key)
+        if results is None:
+            results = list(evaluate_all(evaluate, group, quiet=quiet, matching_ids=matching_ids, unlabeled=unlabeled,
+                                        progress=False, **kwargs))
+            cache.store(key, results)
+        elif not quiet:
+            with ioutil.external_write_mode():
+                for result in results:
+                    print(result.ID, "F1: %.3f" % result.average_f1(UNLABELED if unlabeled else LABELED), "(cached)")
+        yield from results
+
+
+class EvaluationCache:
+    """
+    Content-addressed cache of per-passage evaluation counts, stored as JSON files in a directory.
+    Entries are keyed by the hashes of the contents of the evaluated files and of the evaluation options.
+    """
+    VERSION = 1
+    OPTIONS = ("format", "constructions", "unlabeled", "enhanced", "normalize", "basename", "matching_ids", "errors",
+               "shard", "time_limit", "max_iterations")
+
+    def __init__(self, cache_dir, evaluate, **kwargs):
+        """
+        :param cache_dir: directory to store cache entries in (created if missing)
+        :param evaluate: evaluation function, whose name is part of the key
+        :param kwargs: evaluation options; those in OPTIONS are part of the key
+        """
+        self.cache_dir = cache_dir
+        os.makedirs(cache_dir, exist_ok=True)
+        self.options = json.dumps([self.VERSION, evaluate.__module__, evaluate.__name__] +
+                                  [[k, kwargs.get(k)] for k in self.OPTIONS], sort_keys=True)
+        self.file_hashes = {}
+
+    @staticmethod
+    def group_files(files):
+        """
+        :param files: lists of guessed, reference and (optionally) reference yield tags files
+        :return: list of lists of files to cache separately: one per guessed file if possible, otherwise one for all
+        """
+        files = [None if f is None else sort_files(f) for f in files]
+        if any(f is not None and len(f) != len(files[0]) for f in files):
+            return [files]
+        return [[None if f is None else [f[i]] for f in files] for i in range(len(files[0]))]
+
+    def file_hash(self, filename):
+        h = self.file_hashes.get(filename)
+        if h is None:
+            h = hashlib.sha256(os.path.basename(filename).encode("utf-8"))  # passage IDs may be taken from file name
+            with open(filename, "rb") as f:
+                for chunk in iter(lambda: f.read(1 << 20), b""):
+                    h.update(chunk)
+            h = self.file_hashes[filename] = h.hexdigest()
+        return h
+
+    def key(self, files):
+        h = hashlib.sha256(self.options.encode("utf-8"))
+        for f in files:
+            h.update(json.dumps(None if f is None else [self.file_hash(filename) for filename in f]).encode("utf-8"))
+        return h.hexdigest()
+
+    def filename(self, key):
+        return os.path.join(self.cache_dir, key + ".json")
+
+    def load(self, key):
+        """
+        :param key: cache key, as returned by key()
+        :return: list of score objects, or None if not cached
+        """
+        try:
+            with open(self.filename(key), encoding="utf-8") as f:
+                return [scores_from_counts(entry) for entry in json.load(f)]
+        except FileNotFoundError:
+            return None
+        except (ValueError, KeyError, TypeError) as e:
+            print("Ignoring invalid cache entry '%s': %s" % (self.filename(key), e), file=sys.stderr)
+            return None
+
+    def store(self, key, results):
+        filename = self.filename(key)
+        with tempfile.NamedTemporaryFile("w", encoding="utf-8", dir=self.cache_dir, delete=False) as f:
+            json.dump([scores_to_counts(result) for result in results], f)
+        os.replace(f.name, filename)  # atomic, so that concurrent runs never read partial entries
+
+
+def scores_to_counts(scores):
+    """
+    :param scores: score object for one passage, as returned by an evaluator
+    :return: JSON-serializable dict with the score object's class, attributes and raw counts per construction
+    """
+    return dict(cls=[type(scores).__module__, type(scores).__name__],
+                attrs={k: v for k, v in vars(scores).items() if k != "evaluators"},
+                evaluators={eval_type: dict(default=list(results.default),
+                                            results=[[str(c), s.num_matches, s.num_only_guessed, s.num_only_ref,
+                                                      errors_to_counts(s.errors)] for c, s in results.results.items()])
+                            for eval_type, results in scores.evaluators.items()})
+
+
+def scores_from_counts(counts):
+    """
+    :param counts: dict returned by scores_to_counts
+    :return: score object of the original class, with the same counts (and the same aggregated results)
+    """
+    module, name = counts["cls"]
+    cls = getattr(importlib.import_module(module), name)
+    scores = cls.__new__(cls)
+    vars(scores).update(counts["attrs"])
+    scores.evaluators = {eval_type: EvaluatorResults(
+        ((get_construction(c), SummaryStatistics(m, g, r, errors_from_counts(errors)))
+         for c, m, g, r, errors in e["results"]), default=OrderedDict((c, get_construction(c)) for c in e["default"]))
+        for eval_type, e in counts["evaluators"].items()}
+    return scores
+
+
+def errors_to_counts(errors):  # Confusion matrix keys are (guessed, ref) label tuples, which JSON cannot use as keys
+    return None if errors is None else [[list(k) if isinstance(k, tuple) else k, v] for k, v in errors.items()]
+
+
+def errors_from_counts(counts):
+    return None if counts is None else Counter({tuple(k) if isinstance(k, list) else k: v for k, v in counts})
+
+
+def get_construction(name):
+    return ucca_constructions.CONSTRUCTION_BY_NAME.get(name) or ucca_constructions.create_category_construction(name)
+
+
+def join_by_id(guessed, ref, index_guessed=False):
+    """
+    Match guessed and reference passages by ID, regardless of the order they are read in (hash join).
+    One side is read fully into a dict by ID, and the other is streamed, looking up each partner in the dict.
+    IDs without a match on either side are skipped, and reported to stderr at the end.
+    :param guessed: iterable of ConvertedPassage
+    :param ref: iterable of (ConvertedPassage, ConvertedPassage or None) pairs: reference and yield tags reference
+    :param index_guessed: whether to index the guessed passages (should be the smaller side) rather than the reference
+    :return: generator of (guessed, ref, ref yield tags) triples, in the order of the streamed side
+    """
+    indexed, streamed = (guessed, ref) if index_guessed else (ref, guessed)
+    index = OrderedDict()
+    for item in indexed:
+        index.setdefault(item.ID if index_guessed else item[0].ID, deque()).append(item)
+    unmatched = []
+    for item in streamed:
+        passage_id = item[0].ID if index_guessed else item.ID
+        partners = index.get(passage_id)
+        if not partners:
+            unmatched.append(passage_id)
+            continue
+        partner = partners.popleft()
+        if not partners:
+            del index[passage_id]
+        yield (partner, *item) if index_guessed else (item, *partner)
+    unmatched_indexed = [i for i, partners in index.items() for _ in partners]
+    for side, ids in (("guessed", unmatched_indexed if index_guessed else unmatched),
+                      ("reference", unmatched if index_guessed else unmatched_indexed)):
+        if ids:
+            with ioutil.external_write_mode():
+                print("Skipped %d %s passages without a match: %s" % (len(ids), side, " ".join(map(str, ids))),
+                      file=sys.stderr)
+
+
 def write_csv(filename, rows):
     if filename:
         with sys.stdout if filename == "-" else open(filename, "w", encoding="utf-8", newline="") as f:
@@ -174,24 +435,124 @@ def main(args):
         print("Reference: '%s'" % args.ref)
         if args.ref_yield_tags:
             print("Using categories for fine-grained evaluation from '%s'" % args.ref_yield_tags)
-    results = list(evaluate_all(evaluate, files, name="Evaluating", **vars(args)))
-    summary = Scores(results)
     eval_type = UNLABELED if args.unlabeled else LABELED
-    if len(results) > 1:
-        if args.verbose:
-            print("Aggregated scores:")
-        if not args.quiet:
-            print("F1: %.3f" % summary.average_f1(eval_type))
-            summarize(summary)
-    elif not args.verbose:
-        summarize(summary, errors=args.errors)
-    # noinspection PyTypeChecker
-    title2index = dict(map(reversed, enumerate(summary.titles(eval_type, prefix=False, counts=True))))
-    write_csv(args.out_file, [["ID"] + summary.titles(eval_type, counts=True)] +
-              [[result.ID] + align_fields(result.fields(eval_type, counts=True),
-                                          result.titles(eval_type, counts=True), title2index) for result in results])
+    budget = args.time_limit is not None or args.max_iterations is not None  # add column for truncated search
+    accumulator = ScoresAccumulator()
+    truncated = []
+    with tempfile.TemporaryFile("w+", encoding="utf-8", newline="") as spool:  # per-passage rows, header not known yet
+        writer = csv.writer(spool)
+        kwargs = vars(args)
+        if args.shard:
+            files, kwargs["shard"] = shard_files(files, *args.shard)
+        for result in evaluate_all(evaluate, files, name="Evaluating", **kwargs):
+            accumulator.add(result)
+            if getattr(result, "truncated", False):
+                truncated.append(result.ID)
+            if args.out_file:
+                writer.writerow([result.ID, int(getattr(result, "truncated", False))] +
+                                result.titles(eval_type, counts=True) + result.fields(eval_type, counts=True))
+        summary = accumulator.summary()
+        if accumulator.count > 1:
+            if args.verbose:
+                print("Aggregated scores:")
+            if not args.quiet:
+                print("F1: %.3f" % summary.average_f1(eval_type))
+                summarize(summary)
+        elif not args.verbose:
+            summarize(summary, errors=args.errors)
+        # noinspection PyTypeChecker
+        title2index = dict(map(reversed, enumerate(summary.titles(eval_type, prefix=False, counts=True))))
+        spool.seek(0)
+        write_csv(args.out_file, chain(
+            [["ID"] + summary.titles(eval_type, counts=True) + (["truncated"] if budget else [])],
+            (read_spooled_row(row, title2index, budget) for row in csv.reader(spool))))
+    if truncated:
+        print("Search for best mapping truncated by time/iteration limit for %d passages: %s" % (
+            len(truncated), " ".join(truncated)), file=sys.stderr)
     write_csv(args.summary_file, [summary.titles(eval_type), summary.fields(eval_type)])
     write_csv(args.counts_file, [summary.titles(eval_type, counts=True), summary.fields(eval_type, counts=True)])
+    write_csv(args.raw_counts_file, raw_counts(summary))
+
+
+def shard_files(files, index, num_shards):
+    """
+    Select the files for one shard, if there are enough files to shard by file, pairing them by sorted order
+    :param files: lists of guessed, reference and (optionally) reference yield tags files
+    :param index: shard number, between 1 and num_shards
+    :param num_shards: total number of shards
+    :return: pair of (selected files, shard to select passages by, or None if sharded by files)
+    """
+    if any(f is not None and len(f) != len(files[1]) for f in files) or len(files[1]) < num_shards:
+        return files, (index, num_shards)  # Shard by passage index
+    return [None if f is None else sort_files(f)[index - 1::num_shards] for f in files], None
+
+
+def parse_shard(value):
+    """ Parse a shard specification of the form i/N, where 1 <= i <= N """
+    try:
+        index, num_shards = map(int, value.split("/"))
+    except ValueError as e:
+        raise configargparse.ArgumentTypeError("Invalid shard '%s', expected i/N" % value) from e
+    if not 1 <= index <= num_shards:
+        raise configargparse.ArgumentTypeError("Invalid shard '%s', must have 1 <= i <= N" % value)
+    return index, num_shards
+
+
+RAW_COUNTS_TITLES = ["name", "lang", "format", "eval_type", "construction", "default", "num_matches",
+                     "num_only_guessed", "num_only_ref"]
+
+
+def raw_counts(scores):
+    """
+    :param scores: Scores object
+    :return: rows of raw counts (with a title row), which can be summed over several runs by merge_raw_counts
+    """
+    yield RAW_COUNTS_TITLES
+    for element, lang in scores.elements:
+        for eval_type, results in element.evaluators.items():
+            for construction, stats in results.results.items():
+                yield [element.name, lang or "", element.format, eval_type, str(construction),
+                       int(str(construction) in results.default),
+                       stats.num_matches, stats.num_only_guessed, stats.num_only_ref]
+
+
+def merge_raw_counts(filenames):
+    """
+    Sum raw counts written by separate runs (e.g., on different shards of the data).
+    Like the aggregated scores of a single run, each element is a plain evaluation.Scores object rather than one of a
+    format-specific class (such as amr.SmatchScores), so passages whose search was truncated are not marked: each run
+    reports them separately (to stderr, and in the --out-file column).
+    :param filenames: CSV files written with --raw-counts-file
+    :return: Scores object with the same summary as a single run on all the data
+    """
+    counts = OrderedDict()  # (name, lang, format) -> eval_type -> construction -> [is default, counts]
+    for filename in filenames:
+        with open(filename, encoding="utf-8", newline="") as f:
+            rows = csv.reader(f)
+            if next(rows, None) != RAW_COUNTS_TITLES:
+                raise ValueError("Not a raw counts file: '%s'" % filename)
+            for name, lang, evaluation_format, eval_type, construction, default, *stats in rows:
+                entry = counts.setdefault((name, lang, evaluation_format), OrderedDict()).setdefault(
+                    eval_type, OrderedDict()).setdefault(construction, [False, 0, 0, 0])
+                entry[0] |= bool(int(default))
+                for i, num in enumerate(map(int, stats), start=1):
+                    entry[i] += num
+    return Scores(elements=[(evaluation.Scores(((eval_type, EvaluatorResults(
+        ((get_construction(c), SummaryStatistics(*stats, errors=Counter())) for c, (_, *stats) in results.items()),
+        default=OrderedDict((c, get_construction(c)) for c, (default, *_) in results.items() if default)))
+        for eval_type, results in evaluators.items()), name=name, evaluation_format=evaluation_format), lang or None)
+        for (name, lang, evaluation_format), evaluators in counts.items()])
+
+
+def merge(args):
+    summary = merge_raw_counts(args.filenames)
+    eval_type = UNLABELED if args.unlabeled else LABELED
+    if not args.quiet:
+        print("F1: %.3f" % summary.average_f1(eval_type))
+        summarize(summary)
+    write_csv(args.summary_file, [summary.titles(eval_type), summary.fields(eval_type)])
+    write_csv(args.counts_file, [summary.titles(eval_type, counts=True), summary.fields(eval_type, counts=True)])
+    write_csv(args.raw_counts_file, raw_counts(summary))
 
 
 def align_fields(fields, titles, title2index):
@@ -202,6 +563,14 @@ def align_fields(fields, titles, title2index):
     return ret
 
 
+def read_spooled_row(row, title2index, budget=False):
+    """ Convert a row written during evaluation, with ID, truncated flag, titles and fields, to an aligned CSV row """
+    passage_id, truncated, *titles_fields = row
+    n = len(titles_fields) // 2
+    return [passage_id] + align_fields(titles_fields[n:], titles_fields[:n], title2index) + (
+        [int(truncated)] if budget else [])
+
+
 def summarize(scores, errors=False):
     scores.print()
     if errors:
@@ -210,8 +579,23 @@ def summarize(scores, errors=False):
                 element.print_confusion_matrix()
 
 
-if __name__ == '__main__':
-    argparser = configargparse.ArgParser(description=desc)
+def add_output_args(argparser):
+    argparser.add_argument("-s", "--summary-file", help="file to write aggregated scores to, in CSV format")
+    argparser.add_argument("-c", "--counts-file", help="file to write aggregated counts to, in CSV format")
+    argparser.add_argument("--raw-counts-file", help="file to write raw aggregated counts to, in CSV format, "
+                                                     "for combining the results of several runs with 'merge'")
+    add_boolean_option(argparser, "unlabeled", "print unlabeled F1 for individual passages", short="u")
+
+
+if __name__ == '__main__' and sys.argv[1:2] == ["merge"]:
+    argparser = configargparse.ArgParser(description="Sums counts from several evaluation runs (e.g., on different "
+                                                     "shards) into the same summary as a single run would give.")
+    argparser.add_argument("filenames", nargs="+", help="raw counts files written by evaluate --raw-counts-file")
+    add_output_args(argparser)
+    add_boolean_option(argparser, "quiet", "do not print anything", short="q")
+    merge(argparser.parse_args(sys.argv[2:]))
+elif __name__ == '__main__':
+    argparser = configargparse.ArgParser(description=desc, epilog="To combine runs, use: %s merge -h" % sys.argv[0])
     argparser.add_argument("guessed", help="filename/directory for the guessed annotation(s)")
     argparser.add_argument("ref", help="filename/directory for the reference annotation(s)")
     argparser.add_argument("-r", "--ref-yield-tags", help="xml/pickle file name for reference used for extracting edge "
@@ -220,15 +604,22 @@ if __name__ == '__main__':
     argparser.add_argument("-f", "--format", default="amr", choices=CONVERTERS,
                            help="default format (if cannot determine by suffix)")
     argparser.add_argument("-o", "--out-file", help="file to write results for each evaluated passage to in CSV format")
-    argparser.add_argument("-s", "--summary-file", help="file to write aggregated scores to, in CSV format")
-    argparser.add_argument("-c", "--counts-file", help="file to write aggregated counts to, in CSV format")
-    add_boolean_option(argparser, "unlabeled", "print unlabeled F1 for individual passages", short="u")
+    add_output_args(argparser)
     add_boolean_option(argparser, "enhanced", "read enhanced dependencies", default=True)
     add_boolean_option(argparser, "normalize", "normalize passages before evaluation", short="N", default=True)
-    add_boolean_option(argparser, "matching-ids", "skip passages without a match (by ID)", short="i")
+    add_boolean_option(argparser, "matching-ids", "match passages by ID in any order, skipping passages without a "
+                                                     "match", short="i")
     add_boolean_option(argparser, "basename", "force passage ID to be file basename", short="b")
     add_boolean_option(argparser, "units", "print mutual and unique units")
     add_boolean_option(argparser, "errors", "print confusion matrix with error distribution")
+    argparser.add_argument("--shard", type=parse_shard, help="i/N: evaluate only the i-th out of N shards of the "
+                                                              "passages (or files), for merging raw counts later")
+    argparser.add_argument("--cache-dir", help="directory to cache per-passage counts in, to skip evaluating files "
+                                               "that have not changed since a previous run with the same options")
+    argparser.add_argument("--time-limit", type=float, help="maximum seconds to search for the best AMR node mapping "
+                                                            "per passage, after which the best found so far is used")
+    argparser.add_argument("--max-iterations", type=int, help="maximum hill-climbing steps to search for the best AMR "
+                                                              "node mapping per passage")
     group = argparser.add_mutually_exclusive_group()
     add_verbose_arg(group, help="detailed evaluation output")
     add_boolean_option(group, "quiet", "do not print anything", short="q")
@@ -1,10 +1,15 @@
 # noinspection PyUnresolvedReferences
 import importlib
 import os
+import random
 import re
 import sys
+import time
+from collections import defaultdict
 from importlib import util
+from multiprocessing import Pool
 
+import numpy as np
 import smatch
 from ucca import evaluation
 from ucca.constructions import PRIMARY
@@ -12,26 +17,476 @@ from ucca.constructions import PRIMARY
 EVAL_TYPES = (evaluation.LABELED, evaluation.UNLABELED)
 
 
-def get_scores(a1, a2, amr_id, eval_type, verbose):
-    if eval_type == evaluation.UNLABELED:
-        a1, a2 = [re.sub(":[a-zA-Z0-9-]*", ":label", a) for a in (a1, a2)]
-    try:
-        counts = smatch.get_amr_match(a1, a2, amr_id)
-    except (AttributeError, IndexError):  # error in one of the AMRs
+class SmatchEvaluator:
+    """
+    Smatch hill-climbing with its own match cache and random generator, instead of the module-global state of the
+    smatch package, so that separate instances can score AMR pairs concurrently (in threads or in processes)
+    """
+    def __init__(self, seed=None, iteration_num=None, verbose=False, native=True, time_limit=None,
+                 max_iterations=None):
+        """
+        :param seed: seed for the random restarts, or None for a non-deterministic search
+        :param iteration_num: number of restarts (the first one uses smart initialization)
+        :param verbose: whether to print the results
+        :param native: use the NumPy implementation (SmatchTables) rather than the reference hill-climbing
+        :param time_limit: maximum number of seconds to search for a mapping for each AMR pair
+        :param max_iterations: maximum number of hill-climbing steps (over all restarts) for each AMR pair
+        """
+        self.random = random.Random(seed)
+        self.iteration_num = smatch.iteration_num if iteration_num is None else iteration_num
+        self.verbose = verbose
+        self.native = native
+        self.time_limit = time_limit
+        self.max_iterations = max_iterations
+        self.budget = None
+        self.match_triple_dict = {}  # mapping (tuple) -> matching triple number, valid for one AMR pair only
+
+    def evaluate(self, guessed, ref, converter=None, amr_id=None, eval_types=EVAL_TYPES):
+        """
+        :return: SmatchScores object, whose `truncated' attribute tells if the search ran out of budget, in which case
+                 the scores are those of the best mapping found until then
+        """
+        a1, a2 = [read_amr(a, converter) for a in (guessed, ref)]
+        self.budget = SearchBudget(self.time_limit, self.max_iterations)
+        if self.native:
+            counts = self.get_native_counts(a1, a2, amr_id, eval_types)
+            scores = SmatchScores((eval_type, self.get_results(counts[eval_type], eval_type))
+                                  for eval_type in eval_types)
+        else:
+            scores = SmatchScores((eval_type, self.get_scores(a1, a2, amr_id, eval_type)) for eval_type in eval_types)
+        scores.truncated = self.budget.exceeded
+        if scores.truncated and self.verbose:
+            print("Search truncated for AMR pair", amr_id, file=smatch.DEBUG_LOG)
+        return scores
+
+    def get_native_counts(self, a1, a2, amr_id=None, eval_types=EVAL_TYPES):
+        """
+        Find the best node mapping using SmatchTables, with a separate search for each evaluation type, on the same
+        triples as the reference implementation (so that unlabeled relations keep the direction they were written in)
+        :return: dict of eval_type -> triple of best_match_num, test_triple_num, gold_triple_num
+        """
+        return {eval_type: self.get_native_match(*[unlabel(a) if eval_type == evaluation.UNLABELED else a
+                                                   for a in (a1, a2)], amr_id=amr_id, eval_type=eval_type)
+                for eval_type in eval_types}
+
+    def get_native_match(self, a1, a2, amr_id=None, eval_type=evaluation.LABELED):
+        """
+        :return: triple of best_match_num, test_triple_num, gold_triple_num
+        """
         try:
-            counts = smatch.get_amr_match(a2, a2, amr_id)
-            counts = (0, 0, counts[-1])  # best_match_num, test_triple_num
+            triples2 = parse_triples(a2, "b")
         except (AttributeError, IndexError):  # error in ref AMR
-            counts = (0, 0, 1)  # best_match_num, test_triple_num, gold_triple_num
-    smatch.match_triple_dict.clear()
-    res = SmatchResults(*counts)
-    if verbose:
-        print("Evaluation type: (" + eval_type + ")")
-        res.print()
-    return res
+            return 0, 0, 1
+        gold_triple_num = sum(map(len, triples2))
+        try:
+            triples1 = parse_triples(a1, "a")
+        except (AttributeError, IndexError):  # error in guessed AMR
+            return 0, 0, gold_triple_num
+        tables = SmatchTables(triples1, triples2)
+        mapping, match_num = tables.get_best_match(self.random, self.iteration_num, budget=self.budget)
+        if self.verbose:
+            print("AMR pair", amr_id, "(" + eval_type + ")", file=smatch.DEBUG_LOG)
+            print("Best node mapping alignment:", smatch.print_alignment(
+                tables.to_list(mapping), triples1[0], triples2[0]), file=smatch.DEBUG_LOG)
+        return match_num, sum(map(len, triples1)), gold_triple_num
+
+    def get_results(self, counts, eval_type):
+        res = SmatchResults(*counts)
+        if self.verbose:
+            print("Evaluation type: (" + eval_type + ")")
+            res.print()
+        return res
+
+    def get_scores(self, a1, a2, amr_id, eval_type):
+        if eval_type == evaluation.UNLABELED:
+            a1, a2 = map(unlabel, (a1, a2))
+        try:
+            counts = self.get_amr_match(a1, a2, amr_id)
+        except (AttributeError, IndexError):  # error in one of the AMRs
+            try:
+                counts = self.get_amr_match(a2, a2, amr_id)
+                counts = (0, 0, counts[-1])  # best_match_num, test_triple_num
+            except (AttributeError, IndexError):  # error in ref AMR
+                counts = (0, 0, 1)  # best_match_num, test_triple_num, gold_triple_num
+        finally:
+            self.match_triple_dict.clear()
+        return self.get_results(counts, eval_type)
+
+    def get_amr_match(self, a1, a2, amr_id=None):
+        """
+        Same as smatch.get_amr_match, but using the state of this evaluator
+        :return: triple of best_match_num, test_triple_num, gold_triple_num
+        """
+        amr1, amr2 = map(smatch.amr.AMR.parse_AMR_line, (a1, a2))
+        prefix1, prefix2 = "a", "b"
+        amr1.rename_node(prefix1)
+        amr2.rename_node(prefix2)
+        triples1, triples2 = amr1.get_triples(), amr2.get_triples()
+        best_mapping, best_match_num = self.get_best_match(*triples1, *triples2, prefix1, prefix2)
+        if self.verbose:
+            print("AMR pair", amr_id, file=smatch.DEBUG_LOG)
+            print("Best node mapping alignment:", smatch.print_alignment(best_mapping, triples1[0], triples2[0]),
+                  file=smatch.DEBUG_LOG)
+        return best_match_num, sum(map(len, triples1)), sum(map(len, triples2))
+
+    def get_best_match(self, instance1, attribute1, relation1, instance2, attribute2, relation2, prefix1, prefix2):
+        candidate_mappings, weight_dict = smatch.compute_pool(instance1, attribute1, relation1,
+                                                              instance2, attribute2, relation2, prefix1, prefix2)
+        best_match_num = 0
+        best_mapping = [-1] * len(instance1)
+        for i in range(self.iteration_num):
+            cur_mapping = self.smart_init_mapping(candidate_mappings, instance1, instance2) if i == 0 else \
+                self.random_init_mapping(candidate_mappings)
+            match_num = self.compute_match(cur_mapping, weight_dict)
+            while self.budget is None or self.budget.step():
+                gain, new_mapping = self.get_best_gain(cur_mapping, candidate_mappings, weight_dict,
+                                                       len(instance2), match_num)
+                if gain <= 0:
+                    break
+                match_num += gain
+                cur_mapping = new_mapping
+            if match_num > best_match_num:
+                best_mapping = cur_mapping[:]
+                best_match_num = match_num
+            if self.budget is not None and self.budget.exceeded:
+                break
+        return best_mapping, best_match_num
+
+    def smart_init_mapping(self, candidate_mapping, instance1, instance2):
+        matched = set()
+        result = []
+        no_word_match = []  # node indices that have no concept match
+        for i, candidates in enumerate(candidate_mapping):
+            for candidate in candidates:  # find the first instance triple match (same concept) among the candidates
+                if instance1[i][2] == instance2[candidate][2] and candidate not in matched:
+                    result.append(candidate)
+                    matched.add(candidate)
+                    break
+            else:
+                if candidates:
+                    no_word_match.append(i)
+                result.append(-1)
+        for i in no_word_match:  # if no concept match, choose a random candidate
+            result[i] = self.pick_unmatched(candidate_mapping[i], matched)
+        return result
+
+    def random_init_mapping(self, candidate_mapping):
+        matched = set()
+        return [self.pick_unmatched(candidates, matched) for candidates in candidate_mapping]
+
+    def pick_unmatched(self, candidates, matched):
+        candidates = list(candidates)
+        while candidates:
+            candidate = candidates.pop(self.random.randint(0, len(candidates) - 1))
+            if candidate not in matched:
+                matched.add(candidate)
+                return candidate
+        return -1
+
+    def compute_match(self, mapping, weight_dict):
+        key = tuple(mapping)
+        match_num = self.match_triple_dict.get(key)
+        if match_num is None:
+            match_num = 0
+            for i, m in enumerate(mapping):  # node i in AMR 1 maps to node m in AMR 2
+                for k, weight in weight_dict.get((i, m), {}).items():
+                    if k == -1:  # instance/attribute triples
+                        match_num += weight
+                    elif k[0] >= i and mapping[k[0]] == k[1]:  # relation triples, each counted only once
+                        match_num += weight
+            self.match_triple_dict[key] = match_num
+        return match_num
+
+    def move_gain(self, mapping, node_id, old_id, new_id, weight_dict, match_num):
+        new_mapping_list = mapping[:]
+        new_mapping_list[node_id] = new_id
+        key = tuple(new_mapping_list)
+        if key in self.match_triple_dict:
+            return self.match_triple_dict[key] - match_num
+        gain = 0
+        for k, weight in weight_dict.get((node_id, new_id), {}).items():
+            if k == -1 or new_mapping_list[k[0]] == k[1]:
+                gain += weight
+        for k, weight in weight_dict.get((node_id, old_id), {}).items():
+            if k == -1 or mapping[k[0]] == k[1]:
+                gain -= weight
+        self.match_triple_dict[key] = match_num + gain
+        return gain
+
+    def swap_gain(self, mapping, node_id1, mapping_id1, node_id2, mapping_id2, weight_dict, match_num):
+        new_mapping_list = mapping[:]
+        new_mapping_list[node_id1] = mapping_id2
+        new_mapping_list[node_id2] = mapping_id1
+        key = tuple(new_mapping_list)
+        if key in self.match_triple_dict:
+            return self.match_triple_dict[key] - match_num
+        gain = 0
+        new_mapping1, new_mapping2 = (node_id1, mapping_id2), (node_id2, mapping_id1)
+        old_mapping1, old_mapping2 = (node_id1, mapping_id1), (node_id2, mapping_id2)
+        if node_id1 > node_id2:
+            new_mapping1, new_mapping2 = new_mapping2, new_mapping1
+            old_mapping1, old_mapping2 = old_mapping2, old_mapping1
+        for sign, current, pairs in ((1, new_mapping_list, (new_mapping1, new_mapping2)),
+                                     (-1, mapping, (old_mapping1, old_mapping2))):
+            for j, node_pair in enumerate(pairs):
+                for k, weight in weight_dict.get(node_pair, {}).items():
+                    if k == -1 or (not j or k[0] != node_id1) and current[k[0]] == k[1]:  # avoid duplicates
+                        gain += sign * weight
+        self.match_triple_dict[key] = match_num + gain
+        return gain
+
+    def get_best_gain(self, mapping, candidate_mappings, weight_dict, instance_len, cur_match_num):
+        largest_gain = 0
+        new_mapping = mapping[:]
+        unmatched = sorted(set(range(instance_len)).difference(mapping))
+        for i, nid in enumerate(mapping):  # move: remap i to another unmatched node, (i, nid) -> (i, nm)
+            for nm in unmatched:
+                if nm in candidate_mappings[i]:
+                    gain = self.move_gain(mapping, i, nid, nm, weight_dict, cur_match_num)
+                    if gain > largest_gain:
+                        largest_gain = gain
+                        new_mapping = mapping[:]
+                        new_mapping[i] = nm
+        for i, m in enumerate(mapping):  # swap: (i, m), (j, m2) -> (i, m2), (j, m)
+            for j in range(i + 1, len(mapping)):
+                m2 = mapping[j]
+                gain = self.swap_gain(mapping, i, m, j, m2, weight_dict, cur_match_num)
+                if gain > largest_gain:
+                    largest_gain = gain
+                    new_mapping = mapping[:]
+                    new_mapping[i], new_mapping[j] = m2, m
+        return largest_gain, new_mapping
+
+
+class SearchBudget:
+    """
+    Limits on the time and on the number of hill-climbing steps spent on matching one AMR pair
+    """
+    def __init__(self, time_limit=None, max_iterations=None):
+        self.deadline = None if time_limit is None else time.time() + time_limit
+        self.remaining = max_iterations
+        self.exceeded = False
+
+    def step(self):
+        """
+        :return: whether there is budget left for another hill-climbing step (and take it)
+        """
+        if self.remaining is not None:
+            self.exceeded |= self.remaining <= 0
+            self.remaining -= 1
+        if self.deadline is not None:
+            self.exceeded |= time.time() > self.deadline
+        return not self.exceeded
+
+
+class SmatchTables:
+    """
+    Candidate node mappings and triple match weights between two AMRs, as NumPy arrays, for Smatch hill-climbing.
+    A mapping is an array giving, for every node in AMR 1, its node index in AMR 2, where n2 stands for no node.
+    """
+    def __init__(self, triples1, triples2):
+        """
+        :param triples1: instance, attribute and relation triples of AMR 1, with nodes renamed to prefix + index
+        :param triples2: instance, attribute and relation triples of AMR 2, with nodes renamed to prefix + index
+        """
+        (instance1, attribute1, relation1), (instance2, attribute2, relation2) = triples1, triples2
+        self.n1, self.n2 = len(instance1), len(instance2)
+        self.unary = np.zeros((self.n1, self.n2 + 1), dtype=int)  # matching instance/attribute triples per node pair
+        self.candidates = np.zeros((self.n1, self.n2 + 1), dtype=bool)
+        self.same_concept = np.zeros((self.n1, self.n2), dtype=bool)
+        concepts = defaultdict(list)
+        for triple in instance2:
+            concepts[triple[2]].append(node_index(triple[1]))
+        for triple in instance1:
+            self.same_concept[node_index(triple[1]), concepts.get(triple[2], [])] = True
+
+        # Rank of the first triple pair that made each node pair a candidate, in the order smatch goes over them
+        first = np.full((self.n1, self.n2 + 1), np.iinfo(np.int64).max, dtype=np.int64)
+
+        def _unary_key(triple):
+            return normalize(triple[0]), normalize(triple[2])
+
+        unary1, unary2 = instance1 + attribute1, instance2 + attribute2
+        nodes1, nodes2 = [np.array([node_index(t[1]) for t in triples], dtype=int) for triples in (unary1, unary2)]
+        for p1, p2 in group_positions(unary1, unary2, _unary_key):
+            i, a = np.ix_(nodes1[p1], nodes2[p2])
+            np.add.at(self.unary, (i, a), 1)
+            self.candidates[i, a] = True
+            np.minimum.at(first, (i, a), 2 * (p1[:, None] * len(unary2) + p2[None, :]))
+
+        def _relation_key(triple):
+            return normalize(triple[0])
+
+        (sources1, targets1), (sources2, targets2) = [
+            np.array([(node_index(t[1]), node_index(t[2])) for t in triples], dtype=int).reshape(-1, 2).T
+            for triples in (relation1, relation2)]
+        offset = 2 * len(unary1) * len(unary2)
+        entries = []
+        for p1, p2 in group_positions(relation1, relation2, _relation_key):
+            p1, p2 = np.repeat(p1, len(p2)), np.tile(p2, len(p1))
+            i, k, a, c = sources1[p1], targets1[p1], sources2[p2], targets2[p2]
+            self.candidates[i, a] = self.candidates[k, c] = True
+            rank = offset + 2 * (p1 * len(relation2) + p2)
+            np.minimum.at(first, (i, a), rank)
+            np.minimum.at(first, (k, c), rank + 1)
+            same = (i == k) & (a == c)  # both node pairs are the same, so the relation triple is like an attribute
+            np.add.at(self.unary, (i[same], a[same]), 1)
+            keep = (i != k) & (a != c)  # otherwise, the two node pairs cannot be both part of a mapping
+            entries += [(i[keep], a[keep], k[keep], c[keep]), (k[keep], c[keep], i[keep], a[keep])]
+        # A relation triple match: node i maps to a and node k maps to c (stored in both directions)
+        self.i, self.a, self.k, self.c = (np.concatenate(x) for x in zip(*entries)) if entries else \
+            (np.zeros(0, dtype=int) for _ in range(4))
+        self.rows = np.arange(self.n1)
+        # Candidates in the iteration order of the candidate sets in smatch, which depends on the order they are added
+        # in, so that the same random initial mappings are drawn
+        self.candidate_lists = []
+        for i, row in enumerate(self.candidates[:, :-1]):
+            candidates = np.flatnonzero(row)
+            self.candidate_lists.append(list(set(candidates[np.argsort(first[i, candidates])].tolist())))
 
+    def relation_gains(self, mapping):
+        """
+        :return: matrix whose (i, a) entry is the number of relation triples matched by mapping i to a,
+                 given where the other nodes are mapped
+        """
+        active = mapping[self.k] == self.c
+        return np.bincount(self.i[active] * (self.n2 + 1) + self.a[active],
+                           minlength=self.n1 * (self.n2 + 1)).reshape(self.n1, self.n2 + 1)
 
-def evaluate(guessed, ref, converter=None, verbose=False, amr_id=None, eval_types=EVAL_TYPES, **kwargs):
+    def compute_match(self, mapping):
+        return int(self.unary[self.rows, mapping].sum() + self.relation_gains(mapping)[self.rows, mapping].sum() // 2)
+
+    def get_best_gain(self, mapping):
+        """
+        Find the best move (remap a node to an unmatched node) or swap (exchange the nodes two nodes are mapped to)
+        :return: pair of gain and new mapping
+        """
+        gains = self.unary + self.relation_gains(mapping)
+        current = gains[self.rows, mapping]
+        unmatched = np.ones(self.n2 + 1, dtype=bool)
+        unmatched[mapping] = False
+        unmatched[self.n2] = False
+        move = np.where(self.candidates & unmatched, gains - current[:, None], 0)
+        swapped = gains[:, mapping]  # (i, j) entry: gains for mapping i to the node j is mapped to
+        swap = swapped + swapped.T - current[:, None] - current[None, :]
+        # Correct for relations between the two swapped nodes, which the gains matrix counts with the old mapping
+        between = ((self.a == mapping[self.k]) & (self.c == mapping[self.i]) |
+                   (self.a == mapping[self.i]) & (self.c == mapping[self.k]))
+        swap += np.bincount(self.i[between] * self.n1 + self.k[between],
+                            minlength=self.n1 * self.n1).reshape(self.n1, self.n1)
+        swap = np.triu(swap, 1)
+        new_mapping = mapping.copy()
+        move_gain, swap_gain = move.max(initial=0), swap.max(initial=0)
+        if move_gain >= swap_gain:
+            if move_gain > 0:
+                i, a = np.unravel_index(move.argmax(), move.shape)
+                new_mapping[i] = a
+            return move_gain, new_mapping
+        i, j = np.unravel_index(swap.argmax(), swap.shape)
+        new_mapping[i], new_mapping[j] = mapping[j], mapping[i]
+        return swap_gain, new_mapping
+
+    def hill_climb(self, mapping, budget=None):
+        match_num = self.compute_match(mapping)
+        while budget is None or budget.step():
+            gain, new_mapping = self.get_best_gain(mapping)
+            if gain <= 0:
+                return mapping, match_num
+            match_num += int(gain)
+            mapping = new_mapping
+        return mapping, match_num
+
+    def get_best_match(self, rand, iteration_num, budget=None):
+        """
+        Hill-climb from a smart initial mapping and from random ones
+        :param rand: random.Random object for the random initializations
+        :param iteration_num: number of restarts
+        :param budget: SearchBudget to stop at when exceeded, returning the best mapping found so far
+        :return: pair of best mapping and best matching triple number
+        """
+        best_mapping, best_match_num = np.full(self.n1, self.n2), 0
+        for iteration in range(iteration_num):
+            mapping = self.smart_init_mapping(rand) if iteration == 0 else self.random_init_mapping(rand)
+            mapping, match_num = self.hill_climb(mapping, budget)
+            if match_num > best_match_num:
+                best_mapping, best_match_num = mapping, match_num
+            if budget is not None and budget.exceeded:
+                break
+        return best_mapping, best_match_num
+
+    def smart_init_mapping(self, rand):
+        matched = np.zeros(self.n2, dtype=bool)
+        mapping = np.full(self.n1, self.n2)
+        no_concept_match = []
+        for i, candidates in enumerate(self.candidate_lists):
+            for candidate in candidates:  # the first unmatched candidate with the same concept
+                if self.same_concept[i, candidate] and not matched[candidate]:
+                    mapping[i] = candidate
+                    matched[candidate] = True
+                    break
+            else:
+                if candidates:
+                    no_concept_match.append(i)
+        for i in no_concept_match:
+            mapping[i] = self.pick_unmatched(i, matched, rand)
+        return mapping
+
+    def random_init_mapping(self, rand):
+        matched = np.zeros(self.n2, dtype=bool)
+        return np.array([self.pick_unmatched(i, matched, rand) for i in range(self.n1)], dtype=int)
+
+    def pick_unmatched(self, i, matched, rand):
+        candidates = list(self.candidate_lists[i])
+        while candidates:  # draw from all candidates until an unmatched one is found, as smatch does
+            candidate = candidates.pop(rand.randint(0, len(candidates) - 1))
+            if not matched[candidate]:
+                matched[candidate] = True
+                return candidate
+        return self.n2
+
+    def to_list(self, mapping):
+        return [-1 if m == self.n2 else int(m) for m in mapping]
+
+
+def unlabel(amr):
+    """
+    Replace all relation and attribute names by the same one, as the reference Smatch does for unlabeled evaluation
+    """
+    return re.sub(":[a-zA-Z0-9-]*", ":label", amr)
+
+
+def parse_triples(amr, prefix):
+    parsed = smatch.amr.AMR.parse_AMR_line(amr)
+    parsed.rename_node(prefix)
+    return parsed.get_triples()
+
+
+def node_index(name):
+    return int(name[1:])  # strip the single-letter prefix
+
+
+def normalize(item):
+    return item.lower().rstrip("_")
+
+
+def group_positions(triples1, triples2, key):
+    """
+    :return: for every key shared by triples from both AMRs, pair of arrays of the positions of its triples in each AMR
+    """
+    groups = defaultdict(lambda: ([], []))
+    for i, triples in enumerate((triples1, triples2)):
+        for position, triple in enumerate(triples):
+            groups[key(triple)][i].append(position)
+    return [(np.array(positions1), np.array(positions2)) for positions1, positions2 in groups.values()
+            if positions1 and positions2]
+
+
+def get_scores(a1, a2, amr_id, eval_type, verbose):
+    return SmatchEvaluator(verbose=verbose).get_scores(a1, a2, amr_id, eval_type)
+
+
+def evaluate(guessed, ref, converter=None, verbose=False, amr_id=None, eval_types=EVAL_TYPES, seed=None, native=True,
+             time_limit=None, max_iterations=None, **kwargs):
     """
     Compare two AMRs and return scores, possibly printing them too.
     :param guessed: AMR object to evaluate
@@ -40,12 +495,47 @@ def evaluate(guessed, ref, converter=None, verbose=False, amr_id=None, eval_type
     :param amr_id: ID of AMR pair
     :param eval_types: optional subset of evaluation types to perform (LABELED/UNLABELED)
     :param verbose: whether to print the results
-    :return: SmatchScores object
+    :param seed: random seed for the Smatch restarts
+    :param native: use the NumPy Smatch implementation rather than the reference one
+    :param time_limit: maximum number of seconds to search for the best node mapping
+    :param max_iterations: maximum number of hill-climbing steps to search for the best node mapping
+    :return: SmatchScores object (with truncated=True if the search for a mapping was stopped by the limits)
     """
     del kwargs
-    smatch.verbose = verbose
-    a1, a2 = [read_amr(a, converter) for a in (guessed, ref)]
-    return SmatchScores((eval_type, get_scores(a1, a2, amr_id, eval_type, verbose)) for eval_type in eval_types)
+    evaluator = SmatchEvaluator(seed=seed, verbose=verbose, native=native, time_limit=time_limit,
+                                max_iterations=max_iterations)
+    return evaluator.evaluate(guessed, ref, converter=converter, amr_id=amr_id, eval_types=eval_types)
+
+
+def evaluate_pairs(pairs, converter=None, eval_types=EVAL_TYPES, workers=None, seed=0, chunksize=16, time_limit=None,
+                   max_iterations=None):
+    """
+    Compare many pairs of AMRs concurrently, using a pool of processes.
+    Each pair is scored by its own SmatchEvaluator, seeded by the pair's position, so the results are reproducible
+    regardless of the number of workers.
+    :param pairs: iterable of (guessed, ref) or (guessed, ref, amr_id) tuples
+    :param converter: optional function to apply to inputs before evaluation (applied in the calling process)
+    :param eval_types: optional subset of evaluation types to perform (LABELED/UNLABELED)
+    :param workers: number of worker processes (default: number of CPUs), or 1 to evaluate in the calling process
+    :param seed: base random seed, added to each pair's position
+    :param chunksize: number of pairs to send to a worker at a time
+    :param time_limit: maximum number of seconds to search for the best node mapping for each pair
+    :param max_iterations: maximum number of hill-climbing steps to search for the best node mapping for each pair
+    :return: generator of SmatchScores objects, in the same order as the pairs
+    """
+    tasks = ((seed + i, [read_amr(a, converter) for a in pair[:2]], pair[2] if len(pair) > 2 else None, eval_types,
+              time_limit, max_iterations) for i, pair in enumerate(pairs))
+    if workers == 1:
+        yield from map(_evaluate_pair, tasks)
+    else:
+        with Pool(workers) as pool:
+            yield from pool.imap(_evaluate_pair, tasks, chunksize=chunksize)
+
+
+def _evaluate_pair(task):
+    seed, (a1, a2), amr_id, eval_types, time_limit, max_iterations = task
+    evaluator = SmatchEvaluator(seed=seed, time_limit=time_limit, max_iterations=max_iterations)
+    return evaluator.evaluate(a1, a2, amr_id=amr_id, eval_types=eval_types)
 
 
 def read_amr(amr, converter=None):
@@ -65,8 +555,9 @@ class SmatchResults(evaluation.EvaluatorResults):
 
 
 class SmatchScores(evaluation.Scores):
-    def __init__(self, *args, **kwargs):
+    def __init__(self, *args, truncated=False, **kwargs):
         super().__init__(*args, **kwargs)
+        self.truncated = truncated
         self.name = "AMR"
         self.format = "amr"
 
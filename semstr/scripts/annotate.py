@@ -1,16 +1,24 @@
 #!/usr/bin/env python3
 
 import argparse
+import os
+import sys
+from collections import deque
 from functools import partial
+from itertools import chain
+from multiprocessing import Pool
 
 from tqdm import tqdm
 from ucca import layer0
-from ucca.ioutil import write_passage, get_passages, get_passages_with_progress_bar, external_write_mode
+from ucca.ioutil import write_passage, get_passages, external_write_mode, gen_files, resolve_patterns
 from ucca.textutil import annotate_all
 
 from semstr.cfgutil import read_specs, add_specs_args
+from semstr.conversion.dep import match_sentence_id
 from semstr.convert import FROM_FORMAT, from_conllu, from_amr
-from semstr.scripts.udpipe import annotate_udpipe, copy_tok_to_extra
+from semstr.scripts.udpipe import annotate_udpipe, copy_tok_to_extra, batches
+from semstr.util.annotation_cache import get_annotation_cache
+from semstr.util.models import get_model, REGISTRY, UDPIPE, STANFORDNLP, SPACY
 
 desc = """Read passages in any format, and write back with spaCy/UDPipe annotations."""
 
@@ -21,38 +29,183 @@ FROM_FORMAT_NO_PLACEHOLDERS = dict(FROM_FORMAT)
 FROM_FORMAT_NO_PLACEHOLDERS.update({"amr": partial(from_amr, placeholders=False)})
 
 
-def copy_annotation(passages, conllu, by_id=False, as_array=True, as_extra=True, verbose=False, lang=None):
-    conllu_sentences = {annotated.ID: annotated for annotated in
-                        get_passages_with_progress_bar(conllu, converters=CONVERTERS, desc="Reading '%s'" % conllu)} \
-        if by_id else get_passages(conllu, converters=CONVERTERS)
-    for passage in passages:
-        try:
-            annotated = conllu_sentences[passage.ID] if by_id else next(conllu_sentences)
-        except (KeyError, StopIteration) as e:
-            raise ValueError("Missing annotation for passage ID '%s', by_id=%s" % (passage.ID, by_id)) from e
+class ConlluIndex:
+    """
+    Byte offsets of the sentences in CoNLL-U files by sentence ID, so that only the sentences that are needed are
+    read and converted, and only to terminals (with their annotation)
+    """
+    def __init__(self, filename_patterns, verbose=False):
+        """
+        :param filename_patterns: CoNLL-U file names, directories or glob patterns
+        :param verbose: print the number of sentences found in each file
+        """
+        self.offsets = {}  # sentence ID -> (file name, start offset, end offset)
+        self.files = {}  # file name -> open binary file
+        for filename in gen_files(resolve_patterns(filename_patterns)):
+            self.add_file(filename, verbose=verbose)
+
+    def add_file(self, filename, verbose=False):
+        base = os.path.splitext(os.path.basename(filename))[0]  # ID for sentences without one, as in get_passages
+        offset = num_sentences = 0
+        start = sentence_id = None
+        has_tokens = False
+        with open(filename, "rb") as f:
+            for raw in chain(f, [b""]):  # sentences are separated by empty lines, as in generate_graphs
+                line = raw.strip()
+                if line.startswith(b"#"):
+                    m = match_sentence_id(line.decode("utf-8"))
+                    if m:
+                        sentence_id = m.group(1)
+                elif line:
+                    has_tokens = True
+                elif has_tokens:
+                    self.offsets[sentence_id or base] = (filename, start, offset)
+                    num_sentences += 1
+                    start = sentence_id = None
+                    has_tokens = False
+                if line and start is None:
+                    start = offset
+                offset += len(raw)
         if verbose:
             with external_write_mode():
-                print("Reading annotation from '%s'" % annotated.ID)
-        if as_array:
-            passage.layer(layer0.LAYER_ID).docs()[:] = annotated.layer(layer0.LAYER_ID).docs()
-        if as_extra:
-            for terminal, annotated_terminal in zip(passage.layer(layer0.LAYER_ID).all,
-                                                    annotated.layer(layer0.LAYER_ID).all):
-                copy_tok_to_extra(annotated_terminal, terminal, lang=lang)
-        yield passage
+                print("Indexed %d sentences in '%s'" % (num_sentences, filename))
+
+    def __getitem__(self, sentence_id):
+        """
+        :param sentence_id: sentence ID
+        :return: passage with only terminals, annotated from the CoNLL-U sentence with the given ID
+        """
+        filename, start, end = self.offsets[sentence_id]
+        f = self.files.get(filename)
+        if f is None:
+            f = self.files[filename] = open(filename, "rb")
+        f.seek(start)
+        lines = f.read(end - start).decode("utf-8").splitlines()
+        for passage in from_conllu(lines + [""], passage_id=sentence_id, annotate=True, terminals_only=True):
+            return passage
+        raise KeyError(sentence_id)
+
+    def close(self):
+        for f in self.files.values():
+            f.close()
+        self.files.clear()
 
 
-def annotate_stanfordnlp(passages, model_name, as_array=True, as_extra=True, verbose=False, lang=None):
-    def _parser(conllu, *args, **kwargs):
+def copy_annotation(passages, conllu, by_id=False, as_array=True, as_extra=True, verbose=False, lang=None):
+    """
+    Copy annotation from CoNLL-U sentences to passages
+    :param passages: iterable of passages
+    :param conllu: CoNLL-U file names, directories or glob patterns
+    :param by_id: match sentences to passages by ID, using a ConlluIndex, rather than by order
+    :param as_array: save annotations as array in passage level
+    :param as_extra: save annotations as extra in terminal level
+    :param verbose: print the ID of each sentence copied
+    :param lang: language code
+    :return: generator of annotated passages, in the same order
+    """
+    index = ConlluIndex(conllu, verbose=verbose) if by_id else None
+    conllu_sentences = None if by_id else get_passages(conllu, converters=CONVERTERS)
+    try:
+        for passage in passages:
+            try:
+                annotated = index[passage.ID] if by_id else next(conllu_sentences)
+            except (KeyError, StopIteration) as e:
+                raise ValueError("Missing annotation for passage ID '%s', by_id=%s" % (passage.ID, by_id)) from e
+            if verbose:
+                with external_write_mode():
+                    print("Reading annotation from '%s'" % annotated.ID)
+            if as_array:
+                passage.layer(layer0.LAYER_ID).docs()[:] = annotated.layer(layer0.LAYER_ID).docs()
+            if as_extra:
+                for terminal, annotated_terminal in zip(passage.layer(layer0.LAYER_ID).all,
+                                                        annotated.layer(layer0.LAYER_ID).all):
+                    copy_tok_to_extra(annotated_terminal, terminal, lang=lang)
+            yield passage
+    finally:
+        if index is not None:
+            index.close()
+
+
+def annotate_stanfordnlp(passages, model_name, as_array=True, as_extra=True, verbose=False, lang=None,
+                         batch_size=None):
+    def _parser(conllu, *args, batch_size=None, **kwargs):
         del args, kwargs
-        import stanfordnlp
-        text = "\n".join(" ".join(line.split()[1] if line.strip() else line
-                                  for line in lines if line and not line.startswith("#"))
-                         for lines in conllu if lines)
-        nlp = stanfordnlp.Pipeline(lang=lang, tokenize_pretokenized=True)
-        return nlp(text).conll_file.conll_as_string().splitlines()
+        nlp = get_model(STANFORDNLP, lang=lang)
+        for batch in batches(conllu, batch_size):
+            text = "\n".join(" ".join(line.split()[1] if line.strip() else line
+                                      for line in lines if line and not line.startswith("#"))
+                             for lines in batch if lines)
+            yield from nlp(text).conll_file.conll_as_string().splitlines()
     yield from annotate_udpipe(passages, model_name, as_array=as_array, as_extra=as_extra, verbose=verbose, lang=lang,
-                               parser=_parser)
+                               parser=_parser, batch_size=batch_size)
+
+
+def annotate(passages, lang=None, udpipe=None, stanfordnlp=None, conllu=None, as_array=True, as_extra=True,
+             verbose=False, batch_size=None, annotation_cache=None):
+    """
+    Annotate passages using UDPipe, StanfordNLP or spaCy (after copying any CoNLL-U annotation), and introduce AMR
+    placeholders if annotating as array
+    :param passages: iterable of passages
+    :param lang: language code
+    :param udpipe: UDPipe model name, if annotating with UDPipe
+    :param stanfordnlp: StanfordNLP model name, if annotating with StanfordNLP
+    :param conllu: CoNLL-U file name, if the annotation was already copied from it (see copy_annotation)
+    :param as_array: save annotations as array in passage level
+    :param as_extra: save annotations as extra in terminal level
+    :param verbose: print tagged text for each passage
+    :param batch_size: number of sentences to parse at a time with UDPipe or StanfordNLP
+    :param annotation_cache: directory to look up annotations in before running the model, and to save new ones to
+                             (default: taken from SEMSTR_ANNOTATION_CACHE, if set); not used when copying CoNLL-U
+    :return: generator of annotated passages, in the same order
+    """
+    kwargs = dict(as_array=as_array, as_extra=as_extra, verbose=verbose, lang=lang)
+
+    def _annotate(ps):
+        if conllu:
+            pass
+        elif udpipe:
+            ps = annotate_udpipe(ps, udpipe, batch_size=batch_size, **kwargs)
+        elif stanfordnlp:
+            ps = annotate_stanfordnlp(ps, stanfordnlp, batch_size=batch_size, **kwargs)
+        else:
+            get_model(SPACY, lang=lang)
+        yield from annotate_all(ps, replace=conllu or not (udpipe or stanfordnlp), **kwargs)
+
+    cache = None if conllu else get_annotation_cache(
+        annotation_cache, backend=UDPIPE if udpipe else STANFORDNLP if stanfordnlp else SPACY,
+        name=udpipe or stanfordnlp, lang=lang)
+    for passage in cache.annotate(passages, _annotate, as_array=as_array, as_extra=as_extra) if cache else \
+            _annotate(passages):
+        if passage.extra.get("format") == "amr" and as_array:
+            from semstr.conversion.amr import AmrConverter
+            AmrConverter.introduce_placeholders(passage)
+        yield passage
+    if cache and verbose:
+        with external_write_mode():
+            print(cache, file=sys.stderr)
+
+
+def annotate_parallel(passages, workers, shard_size, **kwargs):
+    """
+    Annotate shards of passages in a process pool, each process loading its own models once
+    :param passages: iterable of passages
+    :param workers: number of processes
+    :param shard_size: number of passages to send to a process at a time
+    :param kwargs: keyword arguments for annotate
+    :return: generator of annotated passages, in the same order
+    """
+    with Pool(workers) as pool:
+        pending = deque()  # only a few shards per worker are read ahead, to keep memory bounded
+        for shard in batches(passages, shard_size):
+            pending.append(pool.apply_async(_annotate_shard, (shard,), kwargs))
+            if len(pending) >= 2 * workers:
+                yield from pending.popleft().get()
+        while pending:
+            yield from pending.popleft().get()
+
+
+def _annotate_shard(passages, **kwargs):
+    return list(annotate(passages, **kwargs))
 
 
 def main(args):
@@ -61,19 +214,26 @@ def main(args):
     for spec in read_specs(args, converters=FROM_FORMAT_NO_PLACEHOLDERS):
         kwargs = dict(as_array=args.as_array, as_extra=args.as_extra, verbose=args.verbose, lang=spec.lang)
         passages = spec.passages
-        if spec.conllu:
+        if spec.conllu:  # Copying by order requires reading the CoNLL-U file in order, so it is not done in parallel
             passages = copy_annotation(passages, spec.conllu, by_id=args.by_id, **kwargs)
-        elif spec.udpipe:
-            passages = annotate_udpipe(passages, spec.udpipe, **kwargs)
-        elif spec.stanfordnlp:
-            passages = annotate_stanfordnlp(passages, spec.stanfordnlp, **kwargs)
-        for passage in annotate_all(passages if args.verbose else
-                                    tqdm(passages, unit=" passages", desc="Annotating " + spec.out_dir),
-                                    replace=spec.conllu or not (spec.udpipe or spec.stanfordnlp), **kwargs):
-            if passage.extra.get("format") == "amr" and args.as_array:
-                from semstr.conversion.amr import AmrConverter
-                AmrConverter.introduce_placeholders(passage)
+        kwargs.update(udpipe=spec.udpipe, stanfordnlp=spec.stanfordnlp, conllu=spec.conllu, batch_size=args.batch_size,
+                      annotation_cache=args.annotation_cache)
+        passages = annotate_parallel(passages, args.workers, args.shard_size, **kwargs) if args.workers > 1 else \
+            annotate(passages, **kwargs)
+        if not args.verbose:
+            passages = tqdm(passages, unit=" passages", desc="Annotating " + spec.out_dir)
+        for passage in passages:
             write_passage(passage, outdir=spec.out_dir, verbose=args.verbose, binary=args.binary)
+    if args.verbose:
+        REGISTRY.print_stats()
+
+
+def check_args(parser, args):
+    if args.workers < 1:
+        parser.error("--workers must be positive")
+    if args.shard_size < 1:
+        parser.error("--shard-size must be positive")
+    return args
 
 
 if __name__ == '__main__':
@@ -84,4 +244,9 @@ if __name__ == '__main__':
     argparser.add_argument("-i", "--by-id", action="store_true", help="if copying CoNLL-U annotations, match them to"
                                                                       "passages by id rather than by order")
     argparser.add_argument("-v", "--verbose", action="store_true", help="print tagged text for each passage")
-    main(argparser.parse_args())
+    argparser.add_argument("-w", "--workers", type=int, default=1, help="number of processes to annotate in parallel")
+    argparser.add_argument("--shard-size", type=int, default=50, help="number of passages to send to a process at a "
+                                                                      "time, if annotating in parallel")
+    argparser.add_argument("--annotation-cache", help="directory to cache annotations in, keyed by the passage tokens "
+                                                      "and model (default: $SEMSTR_ANNOTATION_CACHE, if set)")
+    main(check_args(argparser, argparser.parse_args()))
@@ -11,7 +11,7 @@ from ucca.normalization import normalize
 
 from semstr.cfgutil import add_verbose_arg, add_boolean_option
 from semstr.convert import CONVERTERS
-from semstr.evaluate import EVALUATORS, Scores
+from semstr.evaluate import EVALUATORS, ScoresAccumulator
 
 desc = """Convert files to UCCA standard format, convert back to the original format and evaluate.
 """
@@ -20,10 +20,10 @@ desc = """Convert files to UCCA standard format, convert back to the original fo
 def main(args):
     if args.out_dir:
         os.makedirs(args.out_dir, exist_ok=True)
-    scores = []
+    scores = ScoresAccumulator()
     for pattern in args.filenames:
         for filename in sorted(glob(pattern)) or [pattern]:
-            file_scores = []
+            file_scores = ScoresAccumulator()
             basename, ext = os.path.splitext(os.path.basename(filename))
             passage_format = ext.lstrip(".")
             if passage_format == "txt":
@@ -59,17 +59,17 @@ def main(args):
                         s = evaluate(guessed, ref, verbose=args.verbose > 1, units=args.units)
                     except Exception as e:
                         raise ValueError("Error evaluating conversion of %s" % filename) from e
-                    file_scores.append(s)
+                    file_scores.add(s)
+                    scores.add(s)
                     if args.verbose:
                         with ioutil.external_write_mode():
                             print(passage_id)
                             s.print()
-                    t.set_postfix(F1="%.2f" % (100.0 * Scores(file_scores).average_f1()))
-            scores += file_scores
+                    t.set_postfix(F1="%.2f" % (100.0 * file_scores.summary().average_f1()))
     print()
-    if args.verbose and len(scores) > 1:
+    if args.verbose and scores.count > 1:
         print("Aggregated scores:")
-    Scores(scores).print()
+    scores.summary().print()
 
 
 def check_args(parser, args):
@@ -3,46 +3,164 @@
 import argparse
 import os
 import sqlite3
+from collections import deque
+from multiprocessing import Pool
 
 from tqdm import tqdm
 from ucca import layer0
-from ucca.textutil import annotate_all, Attr
 
 from semstr.cfgutil import read_specs, add_specs_args
 from semstr.convert import FROM_FORMAT
-from semstr.scripts.udpipe import annotate_udpipe
+from semstr.scripts.udpipe import annotate_udpipe, batches
+from semstr.util.find_db import TERMINAL_COLUMNS, UNIT_COLUMNS, INDEXED_COLUMNS, unit_intervals, annotate_spacy, \
+    get_annotation
 
-desc = """Create an index containing all terminals from a corpus, with their dependency relation and category."""
+desc = """Create an index containing all terminals from a corpus, with their dependency relation and category, and all
+units with their category and span, for structural queries."""
+
+
+BULK_PRAGMAS = ("journal_mode=WAL", "synchronous=OFF", "cache_size=-262144", "temp_store=MEMORY")  # 256MB cache
 
 
 def main(args):
     for spec in read_specs(args, converters=FROM_FORMAT):
-        spec.passages = annotate_udpipe(spec.passages, spec.udpipe) if spec.udpipe else \
-            annotate_all(spec.passages, as_array=True, replace=not spec.udpipe, lang=spec.lang)
+        kwargs = dict(udpipe=spec.udpipe, lang=spec.lang, batch_size=args.batch_size)
+        rows = passage_rows_parallel(spec.passages, args.workers, args.shard_size, **kwargs) if args.workers > 1 \
+            else passage_rows(spec.passages, **kwargs)
         filename = os.path.join(spec.out_dir, "find.db")
-        with sqlite3.connect(filename) as conn:
-            c = conn.cursor()
-            c.execute("DROP TABLE terminals")
-            c.execute("CREATE TABLE terminals (pid, tid, text, ftag, fparent, dep)")
-            c.execute("CREATE INDEX idx_terminals_pid ON terminals (pid)")
-            c.execute("CREATE INDEX idx_terminals_text ON terminals (text)")
-            c.execute("CREATE INDEX idx_terminals_ftag ON terminals (ftag)")
-            c.execute("CREATE INDEX idx_terminals_dep ON terminals (dep)")
-            for passage in tqdm(spec.passages, unit=" passages", desc="Creating " + filename):
-                rows = []
-                for terminal in passage.layer(layer0.LAYER_ID).all:
-                    parent = terminal.parents[0]
-                    rows.append((passage.ID, terminal.ID, terminal.text, parent.ftag, str(parent.fparent),
-                                 get_annotation(terminal, spec.udpipe)))
-                c.executemany("INSERT INTO terminals VALUES (?,?,?,?,?,?)", rows)
+        write_db(filename, tqdm(rows, unit=" passages", desc=("Updating " if args.update else "Creating ") + filename),
+                 bulk=args.bulk, update=args.update, transaction_size=args.transaction_size)
+
+
+def passage_rows(passages, udpipe=None, lang=None, batch_size=None):
+    """
+    Annotate passages and get the rows to insert into the terminals and units tables
+    :param passages: iterable of passages
+    :param udpipe: UDPipe model name, if annotating with UDPipe rather than spaCy
+    :param lang: language code
+    :param batch_size: number of sentences to parse at a time with UDPipe
+    :return: generator of (passage ID, list of terminal rows, list of unit rows) tuples
+    """
+    passages = annotate_udpipe(passages, udpipe, batch_size=batch_size) if udpipe else annotate_spacy(passages, lang)
+    for passage in passages:
+        yield to_rows(passage, udpipe)
+
+
+def to_rows(passage, udpipe=None):
+    """
+    :param passage: annotated passage
+    :param udpipe: whether the passage was annotated with UDPipe
+    :return: tuple of (passage ID, list of terminal rows, list of unit rows)
+    """
+    intervals, positions = unit_intervals(passage)
+    rows = []
+    for terminal in passage.layer(layer0.LAYER_ID).all:
+        parent = terminal.parents[0]
+        rows.append((passage.ID, terminal.ID, terminal.text, parent.ftag, str(parent.fparent),
+                     get_annotation(terminal, udpipe), positions.get(terminal.ID)))
+    return passage.ID, rows, [(passage.ID, uid, passage.by_id(uid).ftag, lo, hi) for uid, (lo, hi) in intervals.items()]
+
+
+def passage_rows_parallel(passages, workers, shard_size, **kwargs):
+    """
+    Annotate shards of passages in a process pool, returning the rows to the calling process, which is the only writer
+    :param passages: iterable of passages
+    :param workers: number of processes
+    :param shard_size: number of passages to send to a process at a time
+    :param kwargs: keyword arguments for passage_rows
+    :return: generator of (passage ID, list of terminal rows, list of unit rows) tuples, in the same order
+    """
+    with Pool(workers) as pool:
+        pending = deque()  # only a few shards per worker are read ahead, to keep memory bounded
+        for shard in batches(passages, shard_size):
+            pending.append(pool.apply_async(_shard_rows, (shard,), kwargs))
+            if len(pending) >= 2 * workers:
+                yield from pending.popleft().get()
+        while pending:
+            yield from pending.popleft().get()
+
+
+def _shard_rows(passages, **kwargs):
+    return list(passage_rows(passages, **kwargs))
+
+
+def write_db(filename, rows, bulk=False, update=False, transaction_size=1000):
+    """
+    Write terminal and unit rows to the database, creating the tables and their indexes if they do not exist
+    :param filename: database file name
+    :param rows: iterable of (passage ID, list of terminal rows, list of unit rows) tuples
+    :param bulk: load in large transactions with tuned pragmas, and create indexes only after the load
+    :param update: keep existing rows, replacing only those of passages that are written again
+    :param transaction_size: number of passages to insert per transaction, if bulk=True
+    :return: number of passages written
+    """
+    conn = sqlite3.connect(filename)
+    try:
+        c = conn.cursor()
+        if bulk:
+            for pragma in BULK_PRAGMAS:
+                c.execute("PRAGMA " + pragma)
+        if update:
+            columns = [column for _, column, *_ in c.execute("PRAGMA table_info(terminals)")]
+            if columns and columns != list(TERMINAL_COLUMNS):
+                raise ValueError("'%s' was created by an older version, and must be created again without update"
+                                 % filename)
+        else:
+            c.execute("DROP TABLE IF EXISTS terminals")
+            c.execute("DROP TABLE IF EXISTS units")
+        c.execute("CREATE TABLE IF NOT EXISTS terminals (%s)" % ", ".join(TERMINAL_COLUMNS))
+        c.execute("CREATE TABLE IF NOT EXISTS units (%s)" % ", ".join(UNIT_COLUMNS))
+        if update:
+            create_indexes(c, ("pid",))  # for deleting existing rows by passage ID
+        elif not bulk:
+            create_indexes(c)
+        written = 0
+        for pid, terminal_rows, unit_rows in rows:
+            if update:
+                c.execute("DELETE FROM terminals WHERE pid=?", (pid,))
+                c.execute("DELETE FROM units WHERE pid=?", (pid,))
+            c.executemany("INSERT INTO terminals VALUES (%s)" % ",".join(len(TERMINAL_COLUMNS) * "?"), terminal_rows)
+            c.executemany("INSERT INTO units VALUES (%s)" % ",".join(len(UNIT_COLUMNS) * "?"), unit_rows)
+            written += 1
+            if not bulk or written % transaction_size == 0:
                 conn.commit()
+        conn.commit()
+        create_indexes(c)
+        if bulk:
+            c.execute("ANALYZE")  # statistics for the query planner
+        conn.commit()
+    finally:
+        conn.close()
+    return written
+
+
+def create_indexes(c, columns=INDEXED_COLUMNS):
+    for column in columns:
+        c.execute("CREATE INDEX IF NOT EXISTS idx_terminals_%s ON terminals (%s)" % (column, column))
+        if column == "text":  # for case-insensitive queries
+            c.execute("CREATE INDEX IF NOT EXISTS idx_terminals_text_nocase ON terminals (text COLLATE NOCASE)")
+        elif column == "pid":  # for finding units by passage and category, and deleting by passage
+            c.execute("CREATE INDEX IF NOT EXISTS idx_units_pid_ftag ON units (pid, ftag, lo)")
 
 
-def get_annotation(terminal, udpipe=False):
-    return terminal.tok[Attr.DEP.value] if udpipe else terminal.get_annotation(Attr.DEP, as_array=True)
+def check_args(parser, args):
+    for name in ("transaction_size", "workers", "shard_size"):
+        if getattr(args, name) < 1:
+            parser.error("--%s must be positive" % name.replace("_", "-"))
+    return args
 
 
 if __name__ == '__main__':
     argparser = argparse.ArgumentParser(description=desc)
     add_specs_args(argparser)
-    main(argparser.parse_args())
+    argparser.add_argument("--bulk", action="store_true", help="load in large transactions with tuned pragmas, and "
+                                                               "create the indexes after the load")
+    argparser.add_argument("--update", action="store_true", help="update an existing database: replace the rows of "
+                                                                 "the given passages (by ID), keep the rest")
+    argparser.add_argument("--transaction-size", type=int, default=1000, help="number of passages per transaction "
+                                                                              "in bulk mode")
+    argparser.add_argument("-w", "--workers", type=int, default=1, help="number of processes to annotate in parallel, "
+                                                                        "all feeding one writer")
+    argparser.add_argument("--shard-size", type=int, default=50, help="number of passages to send to a process at a "
+                                                                      "time, if annotating in parallel")
+    main(check_args(argparser, argparser.parse_args()))
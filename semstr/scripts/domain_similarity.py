@@ -1,23 +1,25 @@
 import csv
 from collections import Counter
-from itertools import chain
+from multiprocessing import Pool
 
 import configargparse
 import numpy as np
+from scipy import sparse
 from scipy.stats import entropy
 from tqdm import tqdm
 from ucca import layer0
-from ucca.ioutil import read_files_and_dirs
+from ucca.ioutil import read_files_and_dirs, gen_files
 
 desc = """Calculate similarity between dataset domains."""
 
+SIMILARITIES = ("var", "cos", "euc", "js")
+
 
 def main(args):
-    p = {d: probs(d) for d in args.dirs}
-    vocab = sorted(set(chain(*p.values())))
-    reps = np.array([[p[d].get(v, 0.0) for v in vocab] for d in args.dirs], dtype=float)
-    sims = np.array([i * [np.nan] + [sim(reps[i], reps[j], args.similarity) for j in range(i, len(reps))]
-                     for i in range(len(reps))], dtype=float)
+    vocab, reps = to_sparse([probs(d, workers=args.workers) for d in args.dirs])
+    print("Vocabulary size: %d" % len(vocab))
+    sims = similarities(reps, args.similarity)
+    sims[np.tril_indices(len(sims), -1)] = np.nan  # only pairs (i, j) with i <= j
     print(sims)
     filename = "similarities.txt"
     np.savetxt(filename, sims)
@@ -36,17 +38,86 @@ def sim(x, y, similarity):
     raise ValueError("Unknown similarity '%s'" % similarity)
 
 
-def probs(d):
+def similarities(reps, similarity):
+    """
+    Calculate the similarity between all pairs of rows, the same as sim() for each pair
+    :param reps: sparse matrix of shape (number of domains, vocabulary size), each row a probability distribution
+    :param similarity: one of SIMILARITIES
+    :return: dense symmetric matrix of shape (number of domains, number of domains)
+    """
+    reps = sparse.csr_matrix(reps, dtype=float)
+    if similarity in ("cos", "euc"):
+        gram = (reps @ reps.T).toarray()
+        sq_norms = np.diag(gram)
+        if similarity == "cos":
+            norms = np.sqrt(sq_norms)
+            with np.errstate(divide="ignore", invalid="ignore"):
+                return gram / np.outer(norms, norms)
+        return np.sqrt(np.maximum(sq_norms[:, None] + sq_norms[None, :] - 2 * gram, 0))
+    sums = np.asarray(reps.sum(axis=1)).ravel()
+    if similarity == "var":  # |x-y|_1 = sum(x) + sum(y) - 2 * sum(min(x, y)), since all values are non-negative
+        return sums[:, None] + sums[None, :] - 2 * pairwise_sums(reps, np.minimum)
+    if similarity == "js":  # terms of words in only one domain sum to log(2) * (sum(x) + sum(y)) in total
+        return (np.log(2) * (sums[:, None] + sums[None, :]) + pairwise_sums(reps, js_shared)) / 2
+    raise ValueError("Unknown similarity '%s'" % similarity)
+
+
+def js_shared(x, y):
+    """
+    Difference of the Jensen-Shannon divergence terms of a word that has non-zero x and y,
+    from the terms it would have if it occurred in only one of the domains (x*log(2) + y*log(2))
+    """
+    with np.errstate(divide="ignore", invalid="ignore"):
+        m = x + y
+        return np.where(x > 0, x * np.log(x / m) + y * np.log(y / m), 0.0)
+
+
+def pairwise_sums(reps, f):
+    """
+    :param reps: sparse CSR matrix with non-negative values
+    :param f: element-wise function of two arrays, returning zero where the second is zero
+    :return: dense matrix whose (i, j) entry is the sum over columns w of f(reps[i, w], reps[j, w])
+    """
+    num_rows = reps.shape[0]
+    rows = np.repeat(np.arange(num_rows), np.diff(reps.indptr))  # row index of each non-zero entry
+    result = np.empty((num_rows, num_rows))
+    for i in range(num_rows):
+        x = reps[i].toarray().ravel()[reps.indices]  # row i, aligned with the non-zero entries of all rows
+        result[i] = np.bincount(rows, weights=f(x, reps.data), minlength=num_rows)
+    return result
+
+
+def to_sparse(distributions):
+    """
+    :param distributions: list of dicts of word -> probability
+    :return: pair of (dict of word -> column index, sparse CSR matrix with a row per distribution)
+    """
+    vocab = {}
+    indices, data, indptr = [], [], [0]
+    for distribution in distributions:
+        indices += [vocab.setdefault(word, len(vocab)) for word in distribution]
+        data += distribution.values()
+        indptr.append(len(indices))
+    return vocab, sparse.csr_matrix((np.array(data, dtype=float), np.array(indices, dtype=np.int64), indptr),
+                                    shape=(len(distributions), len(vocab)))
+
+
+def probs(d, workers=1):
     filename = d + ".freq.csv"
     try:
         with open(filename, encoding="utf-8") as f:
             counts = dict((key, int(value)) for key, value in csv.reader(f))
         print("Loaded '%s'" % filename)
     except IOError:
-        counts = Counter()
-        for p in tqdm(read_files_and_dirs(d), unit=" passages", desc="Reading %s" % d):
-            for t in p.layer(layer0.LAYER_ID).all:
-                counts[t.text] += 1
+        files = list(gen_files(d))
+        if workers > 1:
+            counts = Counter()
+            with Pool(workers) as pool:
+                for file_counts in tqdm(pool.imap_unordered(count_tokens, files, chunksize=16), total=len(files),
+                                        unit=" files", desc="Reading %s" % d):
+                    counts.update(file_counts)
+        else:
+            counts = count_tokens(files, progress="Reading %s" % d)
         with open(filename, "w", encoding="utf-8") as f:
             csv.writer(f).writerows(counts.most_common())
         print("Saved '%s'" % filename)
@@ -54,8 +125,23 @@ def probs(d):
     return {key: float(value) / s for key, value in counts.items()}
 
 
+def count_tokens(files, progress=None):
+    """
+    :param files: passage file name, or list of file names
+    :param progress: description for a progress bar, if one should be shown
+    :return: Counter of token text
+    """
+    counts = Counter()
+    passages = read_files_and_dirs(files)
+    for p in tqdm(passages, unit=" passages", desc=progress) if progress else passages:
+        for t in p.layer(layer0.LAYER_ID).all:
+            counts[t.text] += 1
+    return counts
+
+
 if __name__ == '__main__':
     argparser = configargparse.ArgParser(description=desc)
     argparser.add_argument("dirs", nargs="+", help="directories with passages to compare")
-    argparser.add_argument("-s", "--similarity", choices=("var", "cos", "euc", "js"), default="var")
+    argparser.add_argument("-s", "--similarity", choices=SIMILARITIES, default="var")
+    argparser.add_argument("-w", "--workers", type=int, default=1, help="number of processes to count tokens with")
     main(argparser.parse_args())
@@ -1,30 +1,115 @@
 #!/usr/bin/env python3
-import os
 
 import configargparse
+import numpy as np
 from tqdm import tqdm
-from ucca.textutil import read_word_vectors
 
 desc = """Filter a word embedding file to contain only words found in a given corpus"""
 
+FORMATS = ("txt", "npy")
+VOCAB_SUFFIX = ".vocab"
+
 
 def main(args):
     with open(args.corpus, encoding="utf-8") as f:
         words = set(word for line in tqdm(f, desc="Reading '%s'" % args.corpus, unit=" lines") for word in line.split())
-    it = read_word_vectors(None, None, args.filename)
+    it = filter_word_vectors(args.filename, words)
     nr_row, nr_dim = next(it)
-    found = 0
-    with open(args.filename + args.suffix + "~", "w", encoding="utf-8") as f:
-        for w, v in tqdm(it, desc="Filtering '%s'" % args.filename, unit=" lines"):
-            if w in words:
-                found += 1
-                print(" ".join(map(str, [w] + list(v))), file=f)
-    with open(args.filename + args.suffix + "~", encoding="utf-8") as f, \
-            open(args.filename + args.suffix, "w", encoding="utf-8") as g:
-        print(found, nr_dim, file=g)
+    it = tqdm(it, desc="Filtering '%s'" % args.filename, unit=" words")
+    out = args.filename + args.suffix
+    if args.format == "npy":
+        found = write_npy(out, it, nr_dim)
+        print("Wrote %d vectors to '%s' and '%s'" % (found, out + ".npy", out + VOCAB_SUFFIX))
+    else:
+        found = write_text(out, it, nr_row, nr_dim)
+        print("Wrote %d vectors to '%s'" % (found, out))
+
+
+def filter_word_vectors(filename, words):
+    """
+    Read a word vectors text file (as ucca.textutil.read_word_vectors does), parsing only the lines of given words
+    :param filename: text file to load vectors from, with an optional first row indicating size and dimension
+    :param words: set of words to keep
+    :return: generator: first element is (#vectors or None, #dims); and all the rest are (word, list of value strings),
+             for the first occurrence of each word in `words'
+    """
+    seen = set()
+    nr_dim = None
+    with open(filename, encoding="utf-8") as f:
         for line in f:
-            print(line, file=g)
-    os.remove(args.filename + args.suffix + "~")
+            if nr_dim is None:
+                fields = line.split()
+                try:
+                    nr_row, nr_dim = map(int, fields)
+                    yield nr_row, nr_dim
+                    continue
+                except ValueError:  # No header, just get vector length from first one
+                    nr_dim = len(fields) - 1
+                    yield None, nr_dim
+            word = line.split(None, 1)[:1]  # Split the rest only if the word is needed
+            if word and word[0] in words and word[0] not in seen:
+                fields = line.split()
+                if len(fields) > nr_dim:  # May not be equal if word is whitespace
+                    seen.add(fields[0])
+                    yield fields[0], fields[-nr_dim:]
+
+
+def write_text(filename, vectors, nr_row, nr_dim):
+    """
+    Write vectors in text format, with a header line giving their number and dimension, in one pass:
+    the header is written padded, and filled in after all vectors are written
+    :param filename: text file to write to
+    :param vectors: iterable of (word, list of value strings)
+    :param nr_row: upper bound for the number of vectors (e.g., the number in the input file), or None if unknown
+    :param nr_dim: vector dimension
+    :return: number of vectors written
+    """
+    width = len("%d %d" % (nr_row, nr_dim)) if nr_row is not None else 40
+    found = 0
+    with open(filename, "w", encoding="utf-8") as f:
+        print(width * " ", file=f)
+        for word, vector in vectors:
+            print(word, *vector, file=f)
+            found += 1
+        f.seek(0)
+        f.write(("%d %d" % (found, nr_dim)).ljust(width))  # Trailing spaces are ignored when reading
+    return found
+
+
+def write_npy(prefix, vectors, nr_dim, chunk_size=65536):
+    """
+    Write vectors as a float32 NumPy matrix file (prefix + ".npy") and a vocabulary file (prefix + ".vocab"),
+    with the word of each row in its own line, so that they can be loaded with memory mapping (see load_npy)
+    :param prefix: file name prefix
+    :param vectors: iterable of (word, list of value strings)
+    :param nr_dim: vector dimension
+    :param chunk_size: number of rows to convert to an array at a time
+    :return: number of vectors written
+    """
+    chunks, rows = [], []
+    with open(prefix + VOCAB_SUFFIX, "w", encoding="utf-8") as f:
+        for word, vector in vectors:
+            print(word, file=f)
+            rows.append(vector)
+            if len(rows) == chunk_size:
+                chunks.append(np.array(rows, dtype=np.float32))
+                rows = []
+    chunks.append(np.array(rows, dtype=np.float32).reshape(-1, nr_dim))
+    matrix = np.concatenate(chunks)
+    np.save(prefix + ".npy", matrix)
+    return len(matrix)
+
+
+def load_npy(prefix, mmap_mode="r"):
+    """
+    Load vectors written by write_npy
+    :param prefix: file name prefix
+    :param mmap_mode: passed to np.load; by default the matrix is memory-mapped read-only rather than read
+    :return: pair of (dict of word -> row index, matrix)
+    """
+    with open(prefix + VOCAB_SUFFIX, encoding="utf-8") as f:
+        vocab = {line.rstrip("\n"): i for i, line in enumerate(f)}
+    return vocab, np.load(prefix + ".npy", mmap_mode=mmap_mode)
 
 
 if __name__ == '__main__':
@@ -32,4 +117,7 @@ if __name__ == '__main__':
     argparser.add_argument("filename", help="word vectors file to filter")
     argparser.add_argument("corpus", help="tokenized corpus to look up words in")
     argparser.add_argument("-s", "--suffix", default=".filtered", help="suffix to append to given input file")
+    argparser.add_argument("-f", "--format", choices=FORMATS, default="txt", help="output format: text, or NumPy "
+                                                                                  "matrix (.npy) and vocabulary file "
+                                                                                  "(.vocab) for memory mapping")
     main(argparser.parse_args())
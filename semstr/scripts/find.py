@@ -2,55 +2,84 @@
 
 import argparse
 import os
+import sqlite3
 
 from tqdm import tqdm
 from ucca import layer0
-from ucca.textutil import annotate_all, Attr
 
 from semstr.cfgutil import read_specs, add_specs_args
 from semstr.convert import FROM_FORMAT
 from semstr.scripts.udpipe import annotate_udpipe
+from semstr.util.find_db import ConnectionPool, find_rows, has_table, is_under, annotate_spacy, get_annotation
 
-desc = """Find all instances of a certain word or dependency relation."""
+desc = """Find all instances of a certain word or dependency relation, optionally inside units of certain categories.
+Uses the index created by create_find_db.py if it exists, rather than reading (and annotating) the passages."""
 
 
 def main(args):
     words = args.word or []
     categories = list(args.category or ())
     dependencies = list(args.dependency or ())
+    under = list(args.under or ())
     if args.case_insensitive:
         words = list(map(str.lower, words))
     for spec in read_specs(args, converters=FROM_FORMAT):
-        if args.dependency:
-            spec.passages = annotate_udpipe(spec.passages, spec.udpipe) if spec.udpipe else \
-                annotate_all(spec.passages, as_array=True, replace=not spec.udpipe, lang=spec.lang)
-        t = tqdm(spec.passages, unit=" passages", desc="Finding")
-        if words:
-            t.set_postfix(words=",".join(words))
-        if categories:
-            t.set_postfix(categories=",".join(categories))
-        if dependencies:
-            t.set_postfix(dependencies=",".join(dependencies))
-        found = 0
-        filename = os.path.join(spec.out_dir, "_".join(words + categories + dependencies) + ".txt")
+        filename = os.path.join(spec.out_dir, "_".join(words + categories + dependencies +
+                                                       (["under"] + under if under else [])) + ".txt")
+        db = args.db or os.path.join(spec.out_dir, "find.db")
         with open(filename, "w", encoding="utf-8") as f:
-            for passage in t:
-                for terminal in passage.layer(layer0.LAYER_ID).all:
-                    parent = terminal.parents[0]
-                    word = terminal.text
-                    if args.case_insensitive:
-                        word = word.lower()
-                    if (not words or word in words) and (
-                            not categories or parent.ftag in categories) and (
-                            not dependencies or get_annotation(terminal, spec.udpipe) in dependencies):
-                        print(passage.ID, parent.fparent, file=f)
-                        found += 1
-                        t.set_postfix(found=found)
+            if can_use_db(db, under):
+                print("Using index '%s'" % db)
+                with ConnectionPool(db, size=1).connection() as conn:
+                    for row in find_rows(conn, dict(text=words, ftag=categories, dep=dependencies),
+                                         nocase=args.case_insensitive, under=under):
+                        print(row[0], row[4], file=f)  # pid, fparent
+            else:
+                find_in_passages(f, spec, words, categories, dependencies, under, args.case_insensitive,
+                                 batch_size=args.batch_size)
         print("Wrote '%s'" % filename)
 
 
-def get_annotation(terminal, udpipe=False):
-    return terminal.tok[Attr.DEP.value] if udpipe else terminal.get_annotation(Attr.DEP, as_array=True)
+def can_use_db(db, under=()):
+    """
+    :param db: database file created by create_find_db.py
+    :param under: unit categories, if the query is structural
+    :return: whether the database exists and can answer the query
+    """
+    if not os.path.isfile(db):
+        return False
+    conn = sqlite3.connect(db)
+    try:
+        return has_table(conn, "terminals") and (not under or has_table(conn, "units"))
+    finally:
+        conn.close()
+
+
+def find_in_passages(f, spec, words, categories, dependencies, under, case_insensitive=False, batch_size=None):
+    if dependencies:
+        spec.passages = annotate_udpipe(spec.passages, spec.udpipe, batch_size=batch_size) \
+            if spec.udpipe else annotate_spacy(spec.passages, spec.lang)
+    t = tqdm(spec.passages, unit=" passages", desc="Finding")
+    if words:
+        t.set_postfix(words=",".join(words))
+    if categories:
+        t.set_postfix(categories=",".join(categories))
+    if dependencies:
+        t.set_postfix(dependencies=",".join(dependencies))
+    found = 0
+    for passage in t:
+        for terminal in passage.layer(layer0.LAYER_ID).all:
+            parent = terminal.parents[0]
+            word = terminal.text
+            if case_insensitive:
+                word = word.lower()
+            if (not words or word in words) and (
+                    not categories or parent.ftag in categories) and (
+                    not dependencies or get_annotation(terminal, spec.udpipe) in dependencies) and (
+                    not under or is_under(terminal, under)):
+                print(passage.ID, parent.fparent, file=f)
+                found += 1
+                t.set_postfix(found=found)
 
 
 if __name__ == '__main__':
@@ -60,4 +89,8 @@ if __name__ == '__main__':
     argparser.add_argument("-i", "--case-insensitive", action="store_true", help="Ignore case when looking up words")
     argparser.add_argument("-e", "--category", nargs="+", help="Incoming edge categories to find")
     argparser.add_argument("-d", "--dependency", nargs="+", help="Dependency relation(s) to find dependents of")
+    argparser.add_argument("-U", "--under", nargs="+", help="Unit categories to find terminals inside of, outermost "
+                                                            "first: e.g., `H P' for inside a P which is inside an H")
+    argparser.add_argument("--db", help="Index created by create_find_db.py (default: find.db in the output directory,"
+                                        " if it exists)")
     main(argparser.parse_args())
@@ -0,0 +1,123 @@
+#!/usr/bin/env python3
+
+import argparse
+import random
+import sqlite3
+import time
+from itertools import count
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlencode
+from urllib.request import urlopen
+
+import numpy as np
+
+from semstr.util.find_db import INDEXED_COLUMNS, CURSOR_HEADER, ConnectionPool, page_end, find_rows
+
+desc = """Load test for find_server: run concurrent random queries against a local database (or a running server),
+reading one or more pages of each result, and print throughput and latency."""
+
+
+def sample_queries(filename, num=100, seed=1):
+    """
+    :param filename: database file name
+    :param num: number of queries
+    :param seed: random seed
+    :return: list of filter dicts, each with one or two of the indexed columns set to values from the database
+    """
+    rng = random.Random(seed)
+    conn = sqlite3.connect(filename)
+    try:
+        values = {column: [v for v, in conn.execute(
+            "SELECT DISTINCT %s FROM terminals WHERE %s IS NOT NULL LIMIT 1000" % (column, column))]
+            for column in INDEXED_COLUMNS}
+    finally:
+        conn.close()
+    columns = [column for column in INDEXED_COLUMNS if values[column]]
+    return [{column: rng.choice(values[column]) for column in rng.sample(columns, min(len(columns),
+                                                                                      rng.choice((1, 2))))}
+            for _ in range(num)]
+
+
+def query_local(pool, filters, limit=None, max_pages=None):
+    """
+    :return: number of rows found, reading through all pages (up to max_pages)
+    """
+    total = 0
+    cursor = None
+    for _ in count() if not max_pages else range(max_pages):
+        with pool.connection() as conn:
+            end = page_end(conn, filters, limit=limit, cursor=cursor)
+            total += sum(1 for _ in find_rows(conn, filters, cursor=cursor, end=end, limit=limit))
+        if end is None:
+            break
+        cursor = end
+    return total
+
+
+def query_http(url, filters, limit=None, max_pages=None):
+    """
+    :return: number of rows found, reading through all pages (up to max_pages)
+    """
+    total = 0
+    params = dict(filters, limit=limit or "")
+    for _ in count() if not max_pages else range(max_pages):
+        with urlopen(url, data=urlencode(params).encode("utf-8")) as response:
+            total += sum(1 for line in response if line.strip())
+            cursor = response.headers.get(CURSOR_HEADER)
+        if cursor is None:
+            break
+        params["cursor"] = cursor
+    return total
+
+
+def load_test(query, queries, threads=8):
+    """
+    :param query: function taking a filter dict and returning the number of rows found
+    :param queries: list of filter dicts
+    :param threads: number of concurrent clients
+    :return: tuple of (list of seconds per query, total number of rows, number of errors, total seconds)
+    """
+    def _run(filters):
+        start = time.perf_counter()
+        try:
+            rows = query(filters)
+            return time.perf_counter() - start, rows, None
+        except Exception as e:
+            return time.perf_counter() - start, 0, e
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(threads) as executor:
+        results = list(executor.map(_run, queries))
+    seconds = time.perf_counter() - start
+    return [s for s, _, _ in results], sum(n for _, n, _ in results), sum(e is not None for *_, e in results), seconds
+
+
+def main(args):
+    queries = sample_queries(args.db, args.requests, seed=args.seed)
+    if args.url:
+        def _query(filters):
+            return query_http(args.url, filters, limit=args.limit, max_pages=args.max_pages)
+    else:
+        pool = ConnectionPool(args.db, size=args.pool_size)
+
+        def _query(filters):
+            return query_local(pool, filters, limit=args.limit, max_pages=args.max_pages)
+    latencies, rows, errors, seconds = load_test(_query, queries, threads=args.threads)
+    print("%d requests (%d errors), %d rows in %.3fs: %.1f requests/s" % (
+        len(latencies), errors, rows, seconds, len(latencies) / seconds))
+    print("Latency: " + ", ".join("p%d=%.1fms" % (p, 1000 * v) for p, v in
+                                  zip((50, 95, 99), np.percentile(latencies, (50, 95, 99)))))
+
+
+if __name__ == "__main__":
+    argparser = argparse.ArgumentParser(description=desc)
+    argparser.add_argument("db", nargs="?", default="find.db", help="database created by create_find_db.py, to take "
+                                                                    "query values from (and to query, without --url)")
+    argparser.add_argument("--url", help="URL of a running find_server, rather than querying the database directly")
+    argparser.add_argument("-t", "--threads", type=int, default=8, help="number of concurrent clients")
+    argparser.add_argument("-n", "--requests", type=int, default=1000, help="total number of queries")
+    argparser.add_argument("--limit", type=int, default=100, help="page size (0 for no pagination)")
+    argparser.add_argument("--max-pages", type=int, default=1, help="number of pages to read per query (0 for all)")
+    argparser.add_argument("--pool-size", type=int, default=8, help="number of database connections, without --url")
+    argparser.add_argument("--seed", type=int, default=1, help="random seed for choosing queries")
+    main(argparser.parse_args())
@@ -1,33 +1,57 @@
 #!/usr/bin/env python3
 
 import os
-import sqlite3
 
 from flask import Flask, Response, request
 
+from semstr.util.find_db import INDEXED_COLUMNS, CURSOR_HEADER, get_pool, page_end, find_rows
+
 desc = """Flask server to find terminals from a corpus by their dependency relation and category."""
 
 DB_FILENAME = "find.db"
+POOL_SIZE = int(os.getenv("POOL_SIZE", 8))
 
 app = Flask(__name__)
 
 
 @app.route("/", methods=["POST"])
 def find():
-    with sqlite3.connect(DB_FILENAME) as conn:
-        c = conn.cursor()
-        values = tuple(request.values.get(param) or None for param in ("pid", "text", "ftag", "dep"))
-        sql = """SELECT * FROM terminals WHERE
-                         (?1 IS NULL OR pid=?1) AND
-                         (?2 IS NULL OR text=?2) AND
-                         (?3 IS NULL OR ftag=?3) AND
-                         (?4 IS NULL OR dep=?4)
-                         %s""" % (" COLLATE NOCASE" if request.values.get("nocase") else "")
-        print(sql, values)
-        rows = c.execute(sql, values)
-        rows = list(rows)
-        print("%d rows" % len(rows))
-        return Response("\n".join(map("\t".join, rows)), headers={"Content-Type": "text/plain"})
+    """
+    Find terminals matching the given filters (any of pid, text, ftag, dep), one tab-separated row per line.
+    If `under' is given, as space-separated unit categories (outermost first), return only terminals inside them.
+    If `limit' is given, return only a page of that size, with the cursor for the next page in the X-Next-Cursor
+    header (missing after the last page); pass it as `cursor' to get the next page.
+    """
+    filters = {column: request.values.get(column) for column in INDEXED_COLUMNS}
+    nocase = bool(request.values.get("nocase"))
+    under = (request.values.get("under") or "").split()
+    try:
+        limit = int(request.values.get("limit") or 0) or None
+        cursor = request.values.get("cursor")
+        cursor = None if cursor is None else int(cursor)
+    except ValueError:
+        return Response("Invalid limit or cursor", status=400, headers={"Content-Type": "text/plain"})
+    pool = get_pool(app.config.get("DB_FILENAME", DB_FILENAME), size=POOL_SIZE)
+    conn = pool.acquire()
+    try:
+        end = page_end(conn, filters, nocase=nocase, limit=limit, cursor=cursor, under=under)
+        rows = find_rows(conn, filters, nocase=nocase, cursor=cursor, end=end, limit=limit, under=under)
+    except Exception:
+        pool.release(conn)
+        raise
+
+    def _generate():
+        try:
+            for i, row in enumerate(rows):
+                yield ("\n" if i else "") + "\t".join("" if v is None else str(v) for v in row)
+        finally:  # also when the client disconnects
+            rows.close()
+            pool.release(conn)
+
+    headers = {"Content-Type": "text/plain"}
+    if end is not None:
+        headers[CURSOR_HEADER] = str(end)
+    return Response(_generate(), headers=headers)
 
 
 session_opts = {
@@ -38,4 +62,4 @@ session_opts = {
 }
 
 if __name__ == "__main__":
-    app.run(debug=True, host=os.getenv("IP", "0.0.0.0"), port=int(os.getenv("PORT", 5002)))
+    app.run(debug=True, host=os.getenv("IP", "0.0.0.0"), port=int(os.getenv("PORT", 5002)), threaded=True)
@@ -13,6 +13,7 @@ from semstr.conversion.conllu import ConlluConverter
 from semstr.convert import TO_FORMAT, write_passage, map_labels, FROM_FORMAT
 from semstr.evaluate import Scores, EVALUATORS
 from semstr.scripts.udpipe import parse_udpipe
+from semstr.util.models import get_model, REGISTRY, SPACY
 
 desc = """Read passages in any format, extract text, parse using spaCy/UDPipe and save any format.
 NOTE: the dependencies output by spaCy depend on the model used.
@@ -21,6 +22,7 @@ See https://spacy.io/api/annotation#section-dependency-parsing"""
 
 
 def parse_spacy(passages, lang, verbose=False):
+    get_model(SPACY, lang=lang)
     for passage, in annotate_all(zip(passages), as_array=True, as_tuples=True, lang=lang, verbose=verbose):
         terminals = sorted(passage.layer(layer0.LAYER_ID).all, key=operator.attrgetter("position"))
         dep_nodes = [ConlluConverter.Node(
@@ -43,8 +45,9 @@ def parse_spacy(passages, lang, verbose=False):
         yield passage, parsed
 
 
-def parse(passages, lang, udpipe, verbose):
-    return parse_udpipe(passages, udpipe, verbose) if udpipe else parse_spacy(passages, lang, verbose)
+def parse(passages, lang, udpipe, verbose, batch_size=None):
+    return parse_udpipe(passages, udpipe, verbose, batch_size=batch_size) if udpipe else \
+        parse_spacy(passages, lang, verbose)
 
 
 def main(args):
@@ -53,7 +56,7 @@ def main(args):
         if not args.verbose:
             spec.passages = tqdm(spec.passages, unit=" passages",
                                  desc="Parsing " + (spec.out_dir if spec.out_dir != "." else spec.lang))
-        for passage, parsed in parse(spec.passages, spec.lang, spec.udpipe, args.verbose):
+        for passage, parsed in parse(spec.passages, spec.lang, spec.udpipe, args.verbose, args.batch_size):
             map_labels(parsed, args.label_map)
             normalize(parsed, extra=True)
             if args.write:
@@ -68,6 +71,8 @@ def main(args):
                                             verbose=args.verbose > 1))
         if scores:
             Scores(scores).print()
+    if args.verbose:
+        REGISTRY.print_stats()
 
 
 if __name__ == '__main__':
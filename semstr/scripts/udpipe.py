@@ -2,7 +2,7 @@
 
 import argparse
 import os
-from itertools import tee, groupby
+from itertools import tee, groupby, islice
 from operator import itemgetter
 from time import time
 
@@ -16,46 +16,64 @@ from semstr.convert import FROM_FORMAT, to_conllu, from_conllu
 from semstr.evaluate import Scores
 from semstr.evaluation.conllu import evaluate
 from semstr.scripts.join import find_ids
+from semstr.util.models import get_model, UDPIPE
 
 desc = """Parse text to Universal Dependencies using UDPipe."""
 
 
-def udpipe(sentences, model_name, verbose=False):
+def udpipe(sentences, model_name, verbose=False, batch_size=None):
     """
     Parse text to Universal Dependencies using UDPipe.
     :param sentences: iterable of iterables of strings (one string per line)
-    :param model_name: filename containing UDPipe model to load
+    :param model_name: filename containing UDPipe model to load (only once per process, see ModelRegistry)
     :param verbose: print extra information
-    :return: iterable of lines containing parsed output
+    :param batch_size: number of sentences to parse at a time, to keep memory bounded (default: all at once)
+    :return: generator of lines containing parsed output, yielded as each batch is parsed
     """
-    from ufal.udpipe import Model, Pipeline, ProcessingError
-    model = Model.load(model_name)
-    if not model:
-        raise ValueError("Invalid model: '%s'" % model_name)
-    pipeline = Pipeline(model, "conllu", Pipeline.DEFAULT, Pipeline.DEFAULT, "conllu")
-    lines1, lines2 = tee(l for s in sentences for l in s)
-    text = "\n".join(lines1)
-    error = ProcessingError()
-    num_tokens = sum(1 for l in lines2 if l)
-    with ioutil.external_write_mode():
-        print("Running %s on %d tokens... " % (model_name, num_tokens), end="", flush=True)
-    start = time()
-    processed = pipeline.process(text, error)
-    duration = time() - start
-    with ioutil.external_write_mode():
-        print("Done (%.3fs, %.0f tokens/s)" % (duration, num_tokens / duration if duration else 0))
-        if verbose:
-            print(processed)
-    if error.occurred():
-        raise RuntimeError(error.message)
-    return processed.splitlines()
-
-
-def parse_udpipe(passages, model_name, verbose=False, annotate=False, terminals_only=False, parser=None):
+    from ufal.udpipe import ProcessingError
+    _, pipeline = get_model(UDPIPE, model_name)
+    for batch in batches(sentences, batch_size):
+        lines = [l for s in batch for l in s]
+        num_tokens = sum(1 for l in lines if l)
+        error = ProcessingError()
+        with ioutil.external_write_mode():
+            print("Running %s on %d tokens... " % (model_name, num_tokens), end="", flush=True)
+        start = time()
+        processed = pipeline.process("\n".join(lines), error)
+        duration = time() - start
+        with ioutil.external_write_mode():
+            print("Done (%.3fs, %.0f tokens/s)" % (duration, num_tokens / duration if duration else 0))
+            if verbose:
+                print(processed)
+        if error.occurred():
+            raise RuntimeError(error.message)
+        yield from processed.splitlines()
+
+
+def batches(items, size=None):
+    """
+    :param items: iterable
+    :param size: maximum number of items per batch, or None for one batch with all items
+    :return: generator of lists of consecutive items
+    """
+    if not size:
+        yield list(items)
+        return
+    items = iter(items)
+    while True:
+        batch = list(islice(items, size))
+        if not batch:
+            break
+        yield batch
+
+
+def parse_udpipe(passages, model_name, verbose=False, annotate=False, terminals_only=False, parser=None,
+                 batch_size=None):
     if parser is None:
         parser = udpipe
-    passages1, passages2 = tee(passages)
-    processed = parser((to_conllu_native(p, test=True, enhanced=False) for p in passages1), model_name, verbose)
+    passages1, passages2 = tee(passages)  # with batches, only up to one batch of passages is buffered
+    processed = parser((to_conllu_native(p, test=True, enhanced=False) for p in passages1), model_name, verbose,
+                       batch_size=batch_size)
     return zip(passages2, from_conllu(processed, passage_id=None, annotate=annotate, terminals_only=terminals_only,
                                       preprocess=not terminals_only))
 
@@ -67,13 +85,15 @@ def split(passage):
         raise RuntimeError("Failed splitting passage " + passage.ID) from e
 
 
-def annotate_udpipe(passages, model_name, as_array=True, as_extra=True, verbose=False, lang=None, parser=None):
+def annotate_udpipe(passages, model_name, as_array=True, as_extra=True, verbose=False, lang=None, parser=None,
+                    batch_size=None):
     if model_name:
         t1, t2 = tee((paragraph, passage) for passage in passages for paragraph in split(passage))
         paragraphs = map(itemgetter(0), t1)
         passages = map(itemgetter(1), t2)
         for key, group in groupby(zip(passages, parse_udpipe(paragraphs, model_name, verbose, parser=parser,
-                                                             annotate=True, terminals_only=True)), key=itemgetter(0)):
+                                                             annotate=True, terminals_only=True,
+                                                             batch_size=batch_size)), key=itemgetter(0)):
             passage = key
             for passage, (paragraph, annotated) in group:
                 # noinspection PyUnresolvedReferences
@@ -133,7 +153,8 @@ def main(args):
         sentences, to_parse = tee((to_conllu_native(p), to_conllu_native(p, test=True, enhanced=False))
                                   if isinstance(p, core.Passage) else (p, strip_enhanced(p)) for p in spec.passages)
         t = tqdm(zip((x for x, _ in sentences),
-                     split_by_empty_lines(udpipe((x for _, x in to_parse), spec.udpipe, args.verbose))),
+                     split_by_empty_lines(udpipe((x for _, x in to_parse), spec.udpipe, args.verbose,
+                                                 batch_size=args.batch_size))),
                  unit=" sentences")
         for sentence, parsed in t:
             sentence = list(sentence)
@@ -1,16 +1,26 @@
 import argparse
 import sys
+from collections import deque
 from itertools import islice
+from multiprocessing import Pool, Value
 
 from semstr.convert import iter_passages
 from semstr.validation import validate, print_errors
 
 
 def main(args):
-    errors = ((p.ID, list(validate(p, normalization=args.normalize, extra_normalization=args.extra_normalization,
-                                   ucca_validation=args.ucca_validation, output_format=args.format)))
-              for p in iter_passages(args.filenames, desc="Validating"))
+    kwargs = dict(normalization=args.normalize, extra_normalization=args.extra_normalization,
+                  ucca_validation=args.ucca_validation, output_format=args.format)
+    timing = {} if args.timing else None
+    passages = iter_passages(args.filenames, desc="Validating")
+    if args.workers > 1:
+        errors = validate_parallel(passages, args.workers, strict=args.strict, **kwargs)
+    else:
+        errors = ((p.ID, list(validate(p, timing=timing, **kwargs))) for p in passages)
     errors = dict(islice(((k, v) for k, v in errors if v), 1 if args.strict else None))
+    if timing:
+        for check, seconds in sorted(timing.items(), key=lambda x: -x[1]):
+            print("%-30s %.3fs" % (check, seconds), file=sys.stderr)
     if errors:
         id_len = max(map(len, errors))
         for passage_id, es in sorted(errors.items()):
@@ -20,9 +30,50 @@ def main(args):
         print("No errors found.")
 
 
+def validate_parallel(passages, workers, strict=False, **kwargs):
+    """
+    Validate passages in a process pool, giving the same results in the same order as validating them sequentially
+    :param passages: iterable of passages
+    :param workers: number of processes
+    :param strict: whether only the first passage with errors is needed, so that later ones may be skipped
+    :param kwargs: keyword arguments for validate
+    :return: generator of (passage ID, list of errors) pairs, where errors are None for skipped passages
+    """
+    first_error = Value("q", sys.maxsize) if strict else None  # index of first passage with errors found so far
+    with Pool(workers, initializer=_init_worker, initargs=(kwargs, first_error)) as pool:
+        pending = deque()  # only a few passages per worker are read ahead, to keep memory bounded
+        for i, passage in enumerate(passages):
+            pending.append(pool.apply_async(_validate, ((i, passage),)))
+            if len(pending) >= 4 * workers:
+                yield pending.popleft().get()
+        while pending:
+            yield pending.popleft().get()
+
+
+def _init_worker(kwargs, first_error):
+    _init_worker.kwargs = kwargs
+    _init_worker.first_error = first_error
+
+
+def _validate(task):
+    i, passage = task
+    first_error = _init_worker.first_error
+    if first_error is not None and i > first_error.value:  # an earlier passage already has errors
+        return passage.ID, None
+    errors = list(validate(passage, **_init_worker.kwargs))
+    if errors and first_error is not None:
+        with first_error.get_lock():
+            first_error.value = min(first_error.value, i)
+    return passage.ID, errors
+
+
 def check_args(parser, args):
     if args.extra_normalization and not args.normalize:
         parser.error("Cannot specify --extra-normalization without --normalize")
+    if args.workers < 1:
+        parser.error("--workers must be positive")
+    if args.timing and args.workers > 1:
+        parser.error("Cannot specify --timing with --workers")
     return args
 
 
@@ -35,4 +86,6 @@ if __name__ == "__main__":
     argparser.add_argument("-u", "--ucca-validation", action="store_true", help="apply UCCA-specific validations")
     argparser.add_argument("-n", "--normalize", action="store_true", help="normalize passages before validation")
     argparser.add_argument("-e", "--extra-normalization", action="store_true", help="more normalization rules")
+    argparser.add_argument("-t", "--timing", action="store_true", help="print time spent on each check")
+    argparser.add_argument("-w", "--workers", type=int, default=1, help="number of processes to validate in parallel")
     main(check_args(argparser, argparser.parse_args()))
@@ -4,26 +4,17 @@ import importlib
 import os
 import re
 import string
+import sys
+import types
 from collections import defaultdict
 from importlib import util  # needed for amr.peg
 
-import spotlight
-from requests.exceptions import ConnectionError
-from spotlight import SpotlightException
 from ucca import layer1
 from ucca.convert import to_text
 from ucca.textutil import Attr
-from word2number import w2n
 
 from ..constraints import Valid
 
-prev_dir = os.getcwd()
-try:
-    os.chdir(os.path.dirname(util.find_spec("src.amr").origin))  # to find amr.peg
-    from src import amr as amr_lib
-finally:
-    os.chdir(prev_dir)
-
 TERMINAL_DEP = layer1.EdgeTags.Terminal
 PUNCTUATION_DEP = layer1.EdgeTags.Punctuation
 PUNCTUATION_LABEL = layer1.NodeTags.Punctuation
@@ -82,11 +73,12 @@ MONTHS = ("january", "february", "march", "april", "may", "june", "july", "augus
 WEEKDAYS = ("monday", "tuesday", "wednesday", "thursday", "friday", "saturday", "sunday")
 SEASONS = ("winter", "fall", "spring", "summer")
 
-# things to exclude from the graph because they are a separate task
-EXTENSIONS = {
+# things to exclude from the graph because they are a separate task: names of the concepts in EXTENSIONS, which is
+# created on first access (see __getattr__), since its concepts require the AMR library
+EXTENSION_CONCEPT_NAMES = {
     WIKI: (),
     "numbers": (),
-    "urls": (amr_lib.Concept("url-entity"),),
+    "urls": ("url-entity",),
 }
 
 NEGATIONS = {}
@@ -95,9 +87,50 @@ ROLESETS = {}
 CATEGORIES = {}
 
 
+def get_amr_lib():
+    """
+    Import the AMR library on first use rather than on import of this module, since it compiles its grammar on import
+    :return: the amr module
+    """
+    if get_amr_lib.module is None:
+        prev_dir = os.getcwd()
+        try:
+            os.chdir(os.path.dirname(util.find_spec("src.amr").origin))  # to find amr.peg
+            get_amr_lib.module = importlib.import_module("src.amr")
+        finally:
+            os.chdir(prev_dir)
+    return get_amr_lib.module
+
+
+get_amr_lib.module = None
+
+
+def __getattr__(name):
+    """
+    Module attributes that require the AMR library, which used to be loaded on import of this module:
+    amr_lib (the amr module) and EXTENSIONS (dict of extension name -> tuple of amr_lib.Concept)
+    """
+    if name == "amr_lib":
+        return get_amr_lib()
+    if name == "EXTENSIONS":
+        amr_lib = get_amr_lib()
+        extensions = globals()[name] = {l: tuple(map(amr_lib.Concept, r)) for l, r in EXTENSION_CONCEPT_NAMES.items()}
+        return extensions
+    raise AttributeError("module '%s' has no attribute '%s'" % (__name__, name))
+
+
+if sys.version_info < (3, 7):  # module __getattr__ is only supported from Python 3.7 (PEP 562)
+    class _Module(types.ModuleType):
+        def __getattr__(self, name):
+            return __getattr__(name)
+
+    sys.modules[__name__].__class__ = _Module
+
+
 def read_resources():
     if read_resources.done:
         return
+    prev_dir = os.getcwd()
     try:
         os.chdir(os.path.join(os.path.dirname(os.path.realpath(__file__)), "resources"))
         with open("negations.txt", encoding="utf-8") as f:
@@ -131,7 +164,7 @@ read_resources.done = False
 
 
 def parse(*args, **kwargs):
-    return amr_lib.AMR(*args, **kwargs)
+    return get_amr_lib().AMR(*args, **kwargs)
 
 
 def is_concept(label):
@@ -150,7 +183,17 @@ def is_valid_arg(node, label, *tags, is_parent=True):
     read_resources()
     if label is None or (tags and TERMINAL_TAGS.issuperset(filter(None, tags))):  # Not labeled yet or unlabeled parsing
         return True
-    label = resolve_label(node, label, conservative=True, wikification=False)
+    return is_valid_resolved_arg(resolve_label(node, label, conservative=True, wikification=False), tags, is_parent)
+
+
+def is_valid_resolved_arg(label, tags, is_parent=True):
+    """
+    The part of is_valid_arg that only depends on the label after resolving it, and not on the node
+    :param label: resolved label (see resolve_label)
+    :param tags: tuple of edge tags
+    :param is_parent: whether the node is the parent (rather than the child) of the edges
+    """
+    read_resources()
     concept = label[len(CONCEPT) + 1:-1] if label.startswith(CONCEPT) else None
     const = label[len(CONST) + 1:-1] if label.startswith(CONST) else None
     if PLACEHOLDER_PATTERN.search(label):
@@ -232,9 +275,7 @@ def resolve_label(node, label=None, reverse=False, conservative=False, wikificat
             category = CATEGORIES.get(label)  # category suffix to append to label
         elif LABEL_SEPARATOR in label:
             label = label[:label.find(LABEL_SEPARATOR)]  # remove category suffix
-        children = [c.children[0] if c.tag == "PNCT" else c for c in node.children]
-        terminals = sorted([c for c in children if getattr(c, "text", None)],
-                           key=lambda c: getattr(c, "index", getattr(c, "position", None)))
+        terminals = get_terminals(node)
         if terminals:
             if not reverse and label.startswith(NUM):  # numeric label (always 1 unless "numbers" layer is on)
                 number = terminals_to_number(terminals)  # try replacing spelled-out numbers/months with digits
@@ -276,6 +317,15 @@ def resolve_label(node, label=None, reverse=False, conservative=False, wikificat
     return label
 
 
+def get_terminals(node):
+    """
+    :return: list of the terminals among the node's children (or grandchildren, through punctuation), in text order
+    """
+    children = [c.children[0] if c.tag == "PNCT" else c for c in node.children]
+    return sorted([c for c in children if getattr(c, "text", None)],
+                  key=lambda c: getattr(c, "index", getattr(c, "position", None)))
+
+
 def terminals_to_number(terminals):
     text = " ".join(t.text for t in terminals)
     try:  # first make sure it's not a number already
@@ -283,6 +333,7 @@ def terminals_to_number(terminals):
         return None
     except ValueError:
         pass
+    from word2number import w2n
     # noinspection PyBroadException
     try:
         return w2n.word_to_num(text)
@@ -348,6 +399,9 @@ class Wikifier:
     def wikify_text(self, text, offset):
         if not self.enabled:
             raise ValueError("Wikifier is disabled")
+        import spotlight
+        from requests.exceptions import ConnectionError
+        from spotlight import SpotlightException
         error = ValueError("Failed to wikify '%s' offset %d" % (text, offset))
         if self.text != text:
             self.text = text
@@ -0,0 +1,226 @@
+import hashlib
+import json
+import os
+import sys
+import tempfile
+from itertools import groupby
+
+import numpy as np
+from ucca import layer0, textutil
+from ucca.textutil import Attr, MODEL_ENV_VAR, DEFAULT_MODEL
+
+from .models import UDPIPE, STANFORDNLP, SPACY
+
+CACHE_ENV_VAR = "SEMSTR_ANNOTATION_CACHE"
+SIGNED_ATTRS = (Attr.ENT_IOB, Attr.HEAD)  # the rest are spaCy string hashes, which are unsigned 64-bit integers
+
+
+def file_version(path):
+    """
+    :param path: model file or directory
+    :return: string identifying the current contents of the path, or None if it does not exist
+    """
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    return "%s:%d:%d" % (os.path.abspath(path), stat.st_size, int(stat.st_mtime))
+
+
+def package_version(name):
+    try:
+        import pkg_resources
+        return "%s:%s" % (name, pkg_resources.get_distribution(name).version)
+    except Exception:  # not installed as a package, e.g. a spaCy model loaded by path
+        return name
+
+
+def model_version(backend, name=None, lang=None):
+    """
+    Identify the model that annotations come from, without loading it
+    :param backend: one of "udpipe", "stanfordnlp", "spacy"
+    :param name: model name or path, if the backend uses one
+    :param lang: language code
+    :return: string to include in the cache key, which changes when the model is replaced
+    """
+    if backend == SPACY:
+        lang = lang or "en"  # resolve the model name the same way as ucca.textutil.get_nlp
+        name = textutil.models.get(lang) or os.environ.get("_".join((MODEL_ENV_VAR, lang.upper()))) or \
+               os.environ.get(MODEL_ENV_VAR) or DEFAULT_MODEL.get(lang, "xx")
+        return "%s %s" % (package_version("spacy"), file_version(name) or package_version(name))
+    if backend == UDPIPE:
+        return file_version(name) or name
+    if backend == STANFORDNLP:
+        return package_version("stanfordnlp")
+    raise ValueError("Unknown model backend: '%s'" % backend)
+
+
+class AnnotationCache:
+    """
+    Persistent cache of syntactic annotation, stored as one compressed NumPy file per passage in a directory.
+    Entries are keyed by the passage tokens (split to paragraphs), language, backend and model version, so that the
+    same text is only annotated once, even across runs and across passage IDs.
+    Each entry holds the layer 0 "doc" arrays and, if the passage was annotated as extra, the Terminal.extra values.
+    """
+    VERSION = 1
+
+    def __init__(self, cache_dir, backend=SPACY, name=None, lang=None):
+        """
+        :param cache_dir: directory to store cache entries in (created if missing)
+        :param backend: annotation backend, one of "udpipe", "stanfordnlp", "spacy"
+        :param name: model name or path, if the backend uses one
+        :param lang: default language code, overridden by the "lang" attribute of passages
+        """
+        self.cache_dir = cache_dir
+        os.makedirs(cache_dir, exist_ok=True)
+        self.backend = backend
+        self.name = name
+        self.lang = lang or "en"
+        self.versions = {}  # lang -> model version
+        self.hits = self.misses = 0
+
+    def key(self, passage):
+        lang = passage.attrib.get("lang", self.lang)
+        version = self.versions.get(lang)
+        if version is None:
+            version = self.versions[lang] = model_version(self.backend, self.name, lang)
+        tokens = [[t.text for t in terminals] for terminals in paragraphs(passage)]
+        return hashlib.sha256(json.dumps([self.VERSION, self.backend, version, lang, tokens]).encode("utf-8")
+                              ).hexdigest()
+
+    def filename(self, key):
+        return os.path.join(self.cache_dir, key + ".npz")
+
+    def load(self, passage, as_array=True, as_extra=True):
+        """
+        Set the passage annotation from the cache, if found
+        :param passage: Passage object, modified in-place
+        :param as_array: set layer 0 "doc" arrays
+        :param as_extra: set Terminal.extra values
+        :return: whether the passage was found in the cache (with all requested annotation)
+        """
+        filename = self.filename(self.key(passage))
+        try:
+            with np.load(filename) as entry:
+                if (as_array and "values" not in entry) or (as_extra and "strings" not in entry):
+                    self.misses += 1
+                    return False
+                l0 = passage.layer(layer0.LAYER_ID)
+                lengths = entry["lengths"].tolist()
+                if sum(lengths) != len(l0.all):
+                    raise ValueError("%d terminals, but %d cached" % (len(l0.all), sum(lengths)))
+                if as_array:
+                    l0.docs(len(lengths))[:] = split(from_array(entry["values"], entry["missing"]), lengths)
+                if as_extra:
+                    for terminal, values, missing in zip(l0.all, entry["strings"].tolist(),
+                                                         entry["strings_missing"].tolist()):
+                        terminal.extra.update((a.key, None if m else v) for a, v, m in zip(Attr, values, missing))
+        except FileNotFoundError:
+            self.misses += 1
+            return False
+        except (ValueError, KeyError, OSError) as e:
+            print("Ignoring invalid cache entry '%s': %s" % (filename, e), file=sys.stderr)
+            self.misses += 1
+            return False
+        self.hits += 1
+        return True
+
+    def store(self, passage, as_array=True, as_extra=True):
+        """
+        Save the annotation of an annotated passage
+        :param passage: Passage object, already annotated
+        :param as_array: save layer 0 "doc" arrays
+        :param as_extra: save Terminal.extra values
+        :return: whether the annotation could be saved
+        """
+        l0 = passage.layer(layer0.LAYER_ID)
+        entry = dict(lengths=np.array([len(terminals) for terminals in paragraphs(passage)], dtype=np.int64))
+        if as_array:
+            docs = [tok for doc in l0.docs() for tok in doc]
+            if len(docs) != len(l0.all) or not all(v is None or isinstance(v, int) for tok in docs for v in tok):
+                return False
+            entry["values"], entry["missing"] = to_array(docs)
+        if as_extra:
+            strings = [[terminal.extra.get(a.key) for a in Attr] for terminal in l0.all]
+            if not all(v is None or isinstance(v, str) for values in strings for v in values):
+                return False
+            entry["strings"] = np.array([["" if v is None else v for v in values] for values in strings],
+                                        dtype=np.str_).reshape(-1, len(Attr))
+            entry["strings_missing"] = np.array([[v is None for v in values] for values in strings],
+                                                dtype=np.bool_).reshape(-1, len(Attr))
+        with tempfile.NamedTemporaryFile(suffix=".npz", dir=self.cache_dir, delete=False) as f:
+            np.savez_compressed(f, **entry)
+        os.replace(f.name, self.filename(self.key(passage)))  # atomic, so concurrent runs never read partial entries
+        return True
+
+    def annotate(self, passages, annotate, as_array=True, as_extra=True, as_tuples=False):
+        """
+        Annotate passages, taking the annotation from the cache where possible
+        :param passages: iterable of passages (or of tuples starting with a passage, if as_tuples=True)
+        :param annotate: function taking an iterable of passages (or tuples) and returning a generator of the same,
+                         annotated, in the same order; only called with passages that were not found in the cache
+        :param as_array: annotation is set as layer 0 "doc" arrays
+        :param as_extra: annotation is set as Terminal.extra values
+        :param as_tuples: treat input as tuples of (passage, context), and return context for each passage as-is
+        :return: generator of annotated passages (or tuples), in the same order
+        """
+        def _passage(x):
+            return x[0] if as_tuples else x
+
+        for found, group in groupby(passages, lambda x: self.load(_passage(x), as_array=as_array, as_extra=as_extra)):
+            if found:
+                yield from group
+            else:
+                for x in annotate(group):
+                    self.store(_passage(x), as_array=as_array, as_extra=as_extra)
+                    yield x
+
+    def __str__(self):
+        return "Annotation cache '%s': %d hit(s), %d miss(es)" % (self.cache_dir, self.hits, self.misses)
+
+
+def get_annotation_cache(cache_dir=None, backend=SPACY, name=None, lang=None):
+    """
+    :param cache_dir: cache directory, or None to take it from SEMSTR_ANNOTATION_CACHE
+    :return: AnnotationCache object, or None if no directory is given (cache disabled)
+    """
+    cache_dir = cache_dir or os.environ.get(CACHE_ENV_VAR)
+    return AnnotationCache(cache_dir, backend=backend, name=name, lang=lang) if cache_dir else None
+
+
+def paragraphs(passage):
+    """
+    :return: list of lists of terminals, one per paragraph number (as indexed in layer 0 "doc" arrays)
+    """
+    terminals = passage.layer(layer0.LAYER_ID).all
+    result = [[] for _ in range(max((t.paragraph for t in terminals), default=0))]
+    for terminal in terminals:
+        result[terminal.paragraph - 1].append(terminal)
+    return result
+
+
+def to_array(docs):
+    """
+    :param docs: list of per-terminal lists of int or None
+    :return: pair of (uint64 array of values, bool array of missing values)
+    """
+    missing = np.array([[v is None for v in tok] for tok in docs], dtype=np.bool_).reshape(-1, len(Attr))
+    values = np.array([[0 if v is None else v % (1 << 64) for v in tok] for tok in docs],
+                      dtype=np.uint64).reshape(-1, len(Attr))
+    return values, missing
+
+
+def from_array(values, missing):
+    signed = values.astype(np.int64)  # two's complement, for values that may be negative
+    columns = [signed[:, a.value] if a in SIGNED_ATTRS else values[:, a.value] for a in Attr]
+    return [[None if m else int(v) for v, m in zip(tok, tok_missing)]
+            for tok, tok_missing in zip(zip(*[c.tolist() for c in columns]), missing.tolist())]
+
+
+def split(items, lengths):
+    start = 0
+    result = []
+    for length in lengths:
+        result.append(items[start:start + length])
+        start += length
+    return result
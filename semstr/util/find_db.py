@@ -0,0 +1,255 @@
+import os
+import sqlite3
+from contextlib import contextmanager
+from queue import Queue, Empty
+from threading import Lock
+
+COLUMNS = ("pid", "tid", "text", "ftag", "fparent", "dep")
+INDEXED_COLUMNS = ("pid", "text", "ftag", "dep")  # the columns that can be used as filters
+TERMINAL_COLUMNS = COLUMNS + ("pos",)  # pos: position of the terminal in pre-order traversal of the passage
+UNIT_COLUMNS = ("pid", "uid", "ftag", "lo", "hi")  # lo, hi: first and last pre-order position in the unit's subtree
+CURSOR_HEADER = "X-Next-Cursor"  # response header with the cursor for the next page, in find_server
+
+
+class ConnectionPool:
+    """
+    Thread-safe pool of read-only connections to a SQLite database, opened on demand up to a maximum number.
+    """
+    def __init__(self, filename, size=8, timeout=30):
+        """
+        :param filename: database file name
+        :param size: maximum number of open connections; further requests wait for one to be released
+        :param timeout: seconds to wait for a connection before raising queue.Empty
+        """
+        self.filename = filename
+        self.size = size
+        self.timeout = timeout
+        self.idle = Queue()
+        self.opened = 0
+        self.lock = Lock()
+
+    def open(self):
+        conn = sqlite3.connect("file:%s?mode=ro" % os.path.abspath(self.filename), uri=True, check_same_thread=False)
+        conn.execute("PRAGMA query_only=ON")
+        return conn
+
+    def acquire(self):
+        try:
+            return self.idle.get_nowait()
+        except Empty:
+            pass
+        with self.lock:
+            if self.opened < self.size:
+                self.opened += 1
+                try:
+                    return self.open()
+                except sqlite3.Error:
+                    self.opened -= 1
+                    raise
+        return self.idle.get(timeout=self.timeout)
+
+    def release(self, conn):
+        self.idle.put(conn)
+
+    @contextmanager
+    def connection(self):
+        conn = self.acquire()
+        try:
+            yield conn
+        finally:
+            self.release(conn)
+
+    def close(self):
+        with self.lock:
+            while True:
+                try:
+                    self.idle.get_nowait().close()
+                except Empty:
+                    break
+            self.opened = 0
+
+
+def get_pool(filename, size=8):
+    """
+    :return: process-wide ConnectionPool for the given database file
+    """
+    pool = get_pool.pools.get(filename)
+    if pool is None:
+        pool = get_pool.pools[filename] = ConnectionPool(filename, size=size)
+    return pool
+
+
+get_pool.pools = {}
+
+
+def build_query(filters, nocase=False, cursor=None, end=None, limit=None, offset=None, columns=COLUMNS, under=()):
+    """
+    Create a query with a predicate for each given filter only, so that the index of one of them can be used
+    :param filters: dict of column name (one of INDEXED_COLUMNS) -> value to match, or list of values to match any of;
+                    empty values are ignored
+    :param nocase: match text case-insensitively
+    :param cursor: return only rows after this rowid
+    :param end: return only rows up to this rowid (inclusive)
+    :param limit: maximum number of rows to return
+    :param offset: number of rows to skip
+    :param columns: columns to select after the rowid
+    :param under: unit categories, outermost first: return only terminals inside a unit with the last category, which
+                  is itself inside a unit with the previous category, etc. (requires the units table)
+    :return: pair of (SQL string, parameters tuple)
+    """
+    predicates, params = [], []
+    for column in INDEXED_COLUMNS:
+        value = filters.get(column)
+        if value:
+            values = [value] if isinstance(value, str) else list(value)
+            predicates.append("t.%s%s %s" % (column, " COLLATE NOCASE" if nocase and column == "text" else "",
+                                             "=?" if len(values) == 1 else "IN (%s)" % ",".join(len(values) * "?")))
+            params += values
+    if under:
+        predicates.append(contained("t.pos", "t.pos", list(under), params))
+    for op, value in ((">", cursor), ("<=", end)):
+        if value is not None:
+            predicates.append("t.rowid%s?" % op)
+            params.append(int(value))
+    sql = "SELECT %s FROM terminals t" % ", ".join("t." + c for c in ("rowid",) + tuple(columns))
+    if predicates:
+        sql += " WHERE " + " AND ".join(predicates)
+    sql += " ORDER BY t.rowid"
+    if limit or offset:
+        sql += " LIMIT ? OFFSET ?"
+        params += [-1 if limit is None else int(limit), int(offset or 0)]
+    return sql, tuple(params)
+
+
+def contained(lo, hi, categories, params, pid="t.pid"):
+    """
+    Create a predicate for a span of pre-order positions being inside units with the given categories
+    :param lo: SQL expression for the first position of the span
+    :param hi: SQL expression for the last position of the span
+    :param categories: unit categories, outermost first; the span must be in a unit with the last one, etc.
+    :param params: list of query parameters to append to
+    :param pid: SQL expression for the passage ID
+    :return: SQL predicate using nested EXISTS subqueries, one for each category
+    """
+    alias = "u%d" % len(categories)
+    params.append(categories[-1])
+    predicate = "EXISTS (SELECT 1 FROM units %s WHERE %s.pid=%s AND %s.ftag=? AND %s.lo<%s AND %s<=%s.hi" % (
+        alias, alias, pid, alias, alias, lo, hi, alias)
+    if len(categories) > 1:
+        predicate += " AND " + contained(alias + ".lo", alias + ".hi", categories[:-1], params, pid=alias + ".pid")
+    return predicate + ")"
+
+
+def page_end(conn, filters, nocase=False, limit=None, cursor=None, under=()):
+    """
+    Find where a page of results ends, reading only rowids (which are stored in the indexes)
+    :param conn: database connection
+    :param filters: dict of column name (one of INDEXED_COLUMNS) -> value to match; empty values are ignored
+    :param nocase: match text case-insensitively
+    :param limit: page size
+    :param cursor: cursor returned with the previous page, or None for the first page
+    :param under: unit categories, outermost first, to find terminals inside of
+    :return: rowid of the last row in the page, to use as cursor for the next page, or None if this is the last page
+    """
+    if not limit:
+        return None
+    row = conn.execute(*build_query(filters, nocase=nocase, cursor=cursor, limit=1, offset=int(limit) - 1,
+                                    columns=(), under=under)).fetchone()
+    return None if row is None else row[0]
+
+
+def find_rows(conn, filters, nocase=False, cursor=None, end=None, limit=None, under=(), fetch_size=1000):
+    """
+    :param conn: database connection
+    :param filters: dict of column name (one of INDEXED_COLUMNS) -> value to match, or list of values to match any of;
+                    empty values are ignored
+    :param nocase: match text case-insensitively
+    :param cursor: return only rows after this rowid, e.g. the end of the previous page
+    :param end: return only rows up to this rowid, e.g. as returned by page_end
+    :param limit: maximum number of rows to return
+    :param under: unit categories, outermost first, to find terminals inside of
+    :param fetch_size: number of rows to fetch from the database at a time
+    :return: generator of rows, each a tuple of values for COLUMNS
+    """
+    c = conn.execute(*build_query(filters, nocase=nocase, cursor=cursor, end=end, limit=limit, under=under))
+    try:
+        while True:
+            rows = c.fetchmany(fetch_size)
+            if not rows:
+                break
+            for _, *row in rows:
+                yield row
+    finally:
+        c.close()
+
+
+def unit_intervals(passage):
+    """
+    Number the nodes of the passage's primary tree (excluding remote edges) in pre-order, so that a node is inside a
+    unit if and only if its position is in the unit's interval
+    :param passage: Passage object
+    :return: pair of (dict of unit ID -> (lo, hi), dict of terminal ID -> position)
+    """
+    from ucca import layer0, layer1
+    intervals, positions = {}, {}
+    position = 0
+    roots = [node for node in passage.layer(layer1.LAYER_ID).all
+             if node.tag == layer1.NodeTags.Foundational and node.fparent is None]
+    stack = [(node, False) for node in reversed(roots)]
+    while stack:
+        node, done = stack.pop()
+        if done:
+            intervals[node.ID] = (intervals[node.ID], position - 1)
+            continue
+        if node.layer.ID == layer0.LAYER_ID:
+            positions[node.ID] = position
+        else:
+            intervals[node.ID] = position
+            stack.append((node, True))
+            stack += [(edge.child, False) for edge in reversed(node) if is_primary(edge)]
+        position += 1
+    return intervals, positions
+
+
+def is_primary(edge):
+    from ucca import layer0
+    child = edge.child
+    if child.layer.ID == layer0.LAYER_ID:
+        return child.parents[0] is edge.parent
+    return not edge.attrib.get("remote") and child.fparent is edge.parent
+
+
+def is_under(terminal, categories):
+    """
+    Same as the `under' condition of build_query, but on a passage rather than in the database
+    :param terminal: Terminal object
+    :param categories: unit categories, outermost first
+    :return: whether the terminal is inside a unit with the last category, itself inside one with the previous, etc.
+    """
+    i = len(categories) - 1
+    node = terminal.parents[0] if terminal.parents else None
+    while node is not None and i >= 0:
+        if node.ftag == categories[i]:
+            i -= 1
+        node = node.fparent
+    return i < 0
+
+
+def has_table(conn, table):
+    return conn.execute("SELECT 1 FROM sqlite_master WHERE type='table' AND name=?", (table,)).fetchone() is not None
+
+
+def annotate_spacy(passages, lang):
+    """
+    Annotate passages with spaCy, loading the model for the language into ucca.textutil on first use
+    :param passages: iterable of Passage objects
+    :param lang: two-letter language code
+    :return: generator of annotated passages, with layer 0 extra["doc"] set to arrays of annotation values
+    """
+    from ucca.textutil import annotate_all
+    return annotate_all(passages, as_array=True, replace=True, lang=lang)
+
+
+def get_annotation(terminal, udpipe=False):
+    from ucca.textutil import Attr
+    return terminal.tok[Attr.DEP.value] if udpipe else terminal.get_annotation(Attr.DEP, as_array=True)
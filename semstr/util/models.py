@@ -0,0 +1,156 @@
+import os
+import sys
+from collections import OrderedDict
+from threading import RLock
+from time import time
+
+UDPIPE = "udpipe"
+STANFORDNLP = "stanfordnlp"
+SPACY = "spacy"
+MAX_MODELS_ENV_VAR = "SEMSTR_MAX_MODELS"
+
+
+def load_udpipe(name, lang=None):
+    del lang
+    from ufal.udpipe import Model, Pipeline
+    model = Model.load(name)
+    if not model:
+        raise ValueError("Invalid model: '%s'" % name)
+    return model, Pipeline(model, "conllu", Pipeline.DEFAULT, Pipeline.DEFAULT, "conllu")  # pipeline needs the model
+
+
+def load_stanfordnlp(name=None, lang=None):
+    del name
+    import stanfordnlp
+    return stanfordnlp.Pipeline(lang=lang, tokenize_pretokenized=True)
+
+
+def load_spacy(name=None, lang=None):
+    del name
+    from ucca.textutil import get_nlp
+    return get_nlp(lang or "en")
+
+
+def unload_spacy(name=None, lang=None):
+    del name
+    from ucca import textutil
+    textutil.nlp.pop(lang or "en", None)  # ucca keeps its own reference to loaded spaCy models
+    textutil.tokenizer.pop(lang or "en", None)
+
+
+class ModelStats:
+    def __init__(self):
+        self.loads = 0
+        self.hits = 0
+        self.evictions = 0
+        self.seconds = 0.0  # total time spent loading
+
+    def __str__(self):
+        return "%d load(s) (%.3fs), %d hit(s), %d eviction(s)" % (self.loads, self.seconds, self.hits, self.evictions)
+
+
+class ModelRegistry:
+    """
+    Cache of loaded annotation models, keyed by (backend, model name, language).
+    When more than max_models are loaded, the least recently used one is unloaded.
+    The process-wide instance is REGISTRY, used by get_model.
+    """
+    BACKENDS = {  # backend -> (load function, unload function or None), each taking model name and language
+        UDPIPE: (load_udpipe, None),
+        STANFORDNLP: (load_stanfordnlp, None),
+        SPACY: (load_spacy, unload_spacy),
+    }
+
+    def __init__(self, max_models=None):
+        """
+        :param max_models: maximum number of models to keep loaded (default: taken from SEMSTR_MAX_MODELS, or 4)
+        """
+        self.max_models = max_models or int(os.environ.get(MAX_MODELS_ENV_VAR, 4))
+        self.backends = dict(self.BACKENDS)
+        self.models = OrderedDict()  # key -> model, least recently used first
+        self.stats = OrderedDict()  # key -> ModelStats
+        self.lock = RLock()
+
+    def register(self, backend, load, unload=None):
+        """
+        Add a backend, or replace an existing one
+        :param backend: backend name
+        :param load: function taking model name and language, returning the loaded model
+        :param unload: function taking model name and language, to call when the model is evicted
+        """
+        self.backends[backend] = (load, unload)
+
+    def get(self, backend, name=None, lang=None):
+        """
+        :param backend: one of the registered backends, e.g. "udpipe", "stanfordnlp", "spacy"
+        :param name: model name or path, if the backend uses one
+        :param lang: language code, if the backend uses one
+        :return: the loaded model, loading it only if it is not loaded already
+        """
+        try:
+            load, _ = self.backends[backend]
+        except KeyError as e:
+            raise ValueError("Unknown model backend: '%s'" % backend) from e
+        key = (backend, name, lang)
+        with self.lock:
+            stats = self.stats.get(key)
+            if stats is None:
+                stats = self.stats[key] = ModelStats()
+            model = self.models.get(key)
+            if model is None:
+                start = time()
+                model = load(name, lang)
+                stats.seconds += time() - start
+                stats.loads += 1
+                self.models[key] = model
+                self.evict_extra()
+            else:
+                stats.hits += 1
+                self.models.move_to_end(key)
+            return model
+
+    def set_max_models(self, max_models):
+        """
+        Change the maximum number of models to keep loaded, unloading the least recently used ones if there are more
+        :param max_models: maximum number of models
+        """
+        with self.lock:
+            self.max_models = max_models
+            self.evict_extra()
+
+    def evict_extra(self):
+        with self.lock:
+            while len(self.models) > self.max_models:
+                self.evict(next(iter(self.models)))
+
+    def evict(self, key):
+        """
+        Unload a model, so that it will be loaded again next time it is requested
+        :param key: tuple of (backend, model name, language)
+        """
+        with self.lock:
+            if self.models.pop(key, None) is not None:
+                backend, name, lang = key
+                _, unload = self.backends[backend]
+                if unload is not None:
+                    unload(name, lang)
+                self.stats[key].evictions += 1
+
+    def clear(self):
+        with self.lock:
+            for key in list(self.models):
+                self.evict(key)
+
+    def print_stats(self, file=sys.stderr):
+        for (backend, name, lang), stats in self.stats.items():
+            print("%s model %s: %s" % (backend, "'%s'" % name if name else lang, stats), file=file)
+
+
+REGISTRY = ModelRegistry()
+
+
+def get_model(backend, name=None, lang=None):
+    """
+    :return: model from the process-wide ModelRegistry (REGISTRY), loading it only if it is not loaded already
+    """
+    return REGISTRY.get(backend, name, lang)
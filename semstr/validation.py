@@ -1,9 +1,12 @@
+import time
+from collections import OrderedDict
 from itertools import groupby
+from weakref import WeakKeyDictionary
 
 from ucca import layer0, layer1, validation as ucca_validations
 from ucca.normalization import normalize
 
-from .constraints import Direction
+from .constraints import Direction, TagMasks
 
 
 def ucca_constraints(*args, **kwargs):
@@ -34,6 +37,36 @@ CONSTRAINTS = {
 }
 
 
+def get_constraints(passage_format=None):
+    """
+    :param passage_format: format name, or None for UCCA
+    :return: Constraints object for the format, created only once per process
+    """
+    constraints = get_constraints.cache.get(passage_format)
+    if constraints is None:
+        try:
+            constraints = get_constraints.cache[passage_format] = CONSTRAINTS[passage_format]()
+        except KeyError as e:
+            raise ValueError("No validations defined for '%s' format" % passage_format) from e
+    return constraints
+
+
+get_constraints.cache = {}
+
+
+def get_compiled_tag_rules(constraints):
+    """
+    :return: CompiledTagRules for the Constraints object, compiled only once per process
+    """
+    compiled = get_compiled_tag_rules.cache.get(constraints)
+    if compiled is None:
+        compiled = get_compiled_tag_rules.cache[constraints] = constraints.compile_tag_rules()
+    return compiled
+
+
+get_compiled_tag_rules.cache = WeakKeyDictionary()
+
+
 def detect_cycles(passage):
     stack = [list(passage.layer(layer1.LAYER_ID).heads)]
     visited = set()
@@ -66,15 +99,15 @@ def check_orphan_terminals(constraints, terminal):
             yield "Orphan %s terminal (%s) '%s'" % (terminal.tag, terminal.ID, terminal)
 
 
-def check_root_terminal_children(constraints, l1, terminal):
+def check_root_terminal_children(constraints, l1, terminal, heads=None):
     if not constraints.allow_root_terminal_children:
-        if set(l1.heads).intersection(terminal.parents):
+        if (set(l1.heads) if heads is None else heads).intersection(terminal.parents):
             yield "Terminal child of root (%s) '%s'" % (terminal.ID, terminal)
 
 
-def check_top_level_allowed(constraints, l1):
+def check_top_level_allowed(constraints, l1, heads=None):
     if constraints.top_level_allowed:
-        for head in l1.heads:
+        for head in l1.heads if heads is None else heads:
             for edge in head:
                 if edge.tag not in constraints.top_level_allowed:
                     yield "Top level %s edge (%s)" % (edge.tag, edge)
@@ -101,8 +134,8 @@ def check_multiple_incoming(constraints, node):
             yield "Multiple incoming non-remote (%s)" % join(incoming)
 
 
-def check_top_level_only(constraints, l1, node):
-    if constraints.top_level_only and node not in l1.heads:
+def check_top_level_only(constraints, l1, node, heads=None):
+    if constraints.top_level_only and node not in (l1.heads if heads is None else heads):
         for edge in node:
             if edge.tag in constraints.top_level_only:
                 yield "Non-top level %s edge (%s)" % (edge.tag, edge)
@@ -114,13 +147,27 @@ def check_required_outgoing(constraints, node):
         yield "Non-terminal without outgoing %s (%s)" % (constraints.required_outgoing, node.ID)
 
 
-def check_tag_rules(constraints, node):
+def check_tag_rules(constraints, node, compiled=None, masks=None):
+    """
+    :param constraints: Constraints object
+    :param node: node to check the outgoing edges of
+    :param compiled: CompiledTagRules for the constraints, to check rules faster than by calling TagRule.violation
+    :param masks: dict of node -> TagMasks, for the compiled rules, to get or add masks of the node and its children
+    """
     for edge in node:
-        for rule in constraints.tag_rules:
-            for violation in (rule.violation(node, edge, Direction.outgoing, message=True),
-                              rule.violation(edge.child, edge, Direction.incoming, message=True)):
-                if violation:
-                    yield "%s (%s)" % (violation, join([edge]))
+        if compiled is None:
+            for rule in constraints.tag_rules:
+                for violation in (rule.violation(node, edge, Direction.outgoing, message=True),
+                                  rule.violation(edge.child, edge, Direction.incoming, message=True)):
+                    if violation:
+                        yield "%s (%s)" % (violation, join([edge]))
+        else:
+            violations = [compiled.violations(get_masks(masks, compiled, n), edge.tag, d, existing=True)
+                          for n, d in ((node, Direction.outgoing), (edge.child, Direction.incoming))]
+            for i in sorted(set().union(*violations)):
+                for n, d, violated in zip((node, edge.child), (Direction.outgoing, Direction.incoming), violations):
+                    if i in violated:
+                        yield "%s (%s)" % (compiled.message(i, n, edge, d), join([edge]))
         valid = constraints.allow_parent(node, edge.tag)
         if not valid:
             yield "%s may not be a '%s' parent (%s, %s): %s" % (
@@ -134,33 +181,267 @@ def check_tag_rules(constraints, node):
             "Illegal edge: %s (%s)" % (join([edge]), valid)
 
 
+def get_masks(masks, compiled, node):
+    node_masks = masks.get(node)
+    if node_masks is None:
+        node_masks = masks[node] = TagMasks(compiled, node)
+    return node_masks
+
+
 def validate(passage, normalization=False, extra_normalization=False, ucca_validation=False, output_format=None,
-             **kwargs):
+             timing=None, **kwargs):
+    """
+    :param passage: passage to validate
+    :param normalization: whether to normalize the passage first
+    :param extra_normalization: whether to apply extra normalization rules (if normalizing)
+    :param ucca_validation: whether to apply UCCA-specific validations rather than format-specific constraints
+    :param output_format: format to take constraints from, if the passage does not specify it
+    :param timing: dict to add the seconds spent on each check to, by check name
+    :return: generator of error messages
+    """
     del kwargs
     if normalization:
         normalize(passage, extra=extra_normalization)
     if ucca_validation:
         yield from ucca_validations.validate(passage)
     else:  # Generic validations depending on format-specific constraints
-        try:
-            constraints = CONSTRAINTS[passage.extra.get("format", output_format)]()
-        except KeyError as e:
-            raise ValueError("No validations defined for '%s' format" % output_format) from e
-        yield from detect_cycles(passage)
-        l0 = passage.layer(layer0.LAYER_ID)
-        l1 = passage.layer(layer1.LAYER_ID)
-        for terminal in l0.all:
-            yield from check_orphan_terminals(constraints, terminal)
-            yield from check_root_terminal_children(constraints, l1, terminal)
-            yield from check_multiple_incoming(constraints, terminal)
-        yield from check_top_level_allowed(constraints, l1)
-        for node in l1.all:
-            yield from check_multigraph(constraints, node)
-            yield from check_implicit_children(constraints, node)
-            yield from check_multiple_incoming(constraints, node)
-            yield from check_top_level_only(constraints, l1, node)
-            yield from check_required_outgoing(constraints, node)
-            yield from check_tag_rules(constraints, node)
+        yield from validate_constraints(passage, get_constraints(passage.extra.get("format", output_format)), timing)
+
+
+def validate_constraints(passage, constraints, timing=None):
+    """
+    Run all checks in one pass over the nodes, computing what several checks need (heads, tag masks) only once
+    :param passage: passage to validate
+    :param constraints: Constraints object
+    :param timing: dict to add the seconds spent on each check to, by check name
+    :return: generator of error messages
+    """
+    def run(check, *args):
+        if timing is None:
+            return check(*args)
+        start = time.perf_counter()
+        messages = list(check(*args))
+        timing[check.__name__] = timing.get(check.__name__, 0) + time.perf_counter() - start
+        return messages
+
+    compiled = get_compiled_tag_rules(constraints)
+    yield from run(detect_cycles, passage)
+    l0 = passage.layer(layer0.LAYER_ID)
+    l1 = passage.layer(layer1.LAYER_ID)
+    heads = set(l1.heads)
+    masks = {}
+    for terminal in l0.all:
+        yield from check_terminal(constraints, l1, terminal, heads, run)
+    yield from run(check_top_level_allowed, constraints, l1)
+    for node in l1.all:
+        yield from check_node(constraints, l1, node, heads, compiled, masks, run)
+
+
+def call(check, *args):
+    return check(*args)
+
+
+def check_terminal(constraints, l1, terminal, heads, run=call):
+    yield from run(check_orphan_terminals, constraints, terminal)
+    yield from run(check_root_terminal_children, constraints, l1, terminal, heads)
+    yield from run(check_multiple_incoming, constraints, terminal)
+
+
+def check_node(constraints, l1, node, heads, compiled, masks, run=call):
+    yield from run(check_multigraph, constraints, node)
+    yield from run(check_implicit_children, constraints, node)
+    yield from run(check_multiple_incoming, constraints, node)
+    yield from run(check_top_level_only, constraints, l1, node, heads)
+    yield from run(check_required_outgoing, constraints, node)
+    yield from run(check_tag_rules, constraints, node, compiled, masks)
+
+
+class IncrementalValidator:
+    """
+    Keeps the validation state of a passage under construction, to check it after each change without re-validating
+    the whole passage. Call add_edge/add_node after adding an edge or node, and remove_edge/remove_node before
+    removing one. Changes are applied lazily: the next query re-checks only the nodes around the changed edges, and
+    searches for cycles only from the added edges (or from previously detected cycles, after removing edges).
+    Errors are the same as from validate, except for cycle descriptions, and that cycles are found even if they are
+    not reachable from the heads.
+    """
+    def __init__(self, passage, output_format=None, constraints=None):
+        """
+        :param passage: passage to validate, including any changes to it later
+        :param output_format: format to take constraints from, if the passage does not specify it
+        :param constraints: Constraints object, to use instead of the format's default
+        """
+        self.passage = passage
+        self.constraints = constraints or get_constraints(passage.extra.get("format", output_format))
+        self.compiled = get_compiled_tag_rules(self.constraints)
+        self.l1 = passage.layer(layer1.LAYER_ID)
+        self.masks = {}  # node -> TagMasks, removed for nodes whose edges changed
+        self.node_errors = OrderedDict()  # node -> non-empty list of error messages about it, by passage order
+        self.cycles = OrderedDict()  # edge -> message, for edges closing a cycle (without them the graph is a DAG)
+        self.added = OrderedDict()  # edges added since the last update, not checked for cycles yet
+        self.removed = False  # whether edges not closing cycles were removed since the last update
+        self.dirty = OrderedDict()  # nodes to re-check on the next update
+        self.find_cycles()
+        for node in passage.layer(layer0.LAYER_ID).all + self.l1.all:
+            self.dirty[node] = None
+        self.update()
+
+    @property
+    def valid(self):
+        """
+        :return: whether the passage has no errors after all changes so far
+        """
+        self.update()
+        return not self.cycles and not self.node_errors
+
+    def errors(self):
+        """
+        :return: generator of error messages for the passage after all changes so far
+        """
+        self.update()
+        yield from self.cycles.values()
+        for node in self.node_errors:  # Messages describe nodes by their text, which may have changed since checked
+            yield from self.check(node)
+
+    def add_edge(self, edge):
+        """
+        Notify that an edge was added to the passage
+        """
+        self.added[edge] = None
+        self.touch(edge)
+
+    def remove_edge(self, edge):
+        """
+        Notify that an edge is removed from the passage (may also be called after it is removed)
+        """
+        if edge in self.added:
+            del self.added[edge]
+        elif edge in self.cycles:
+            del self.cycles[edge]
+        else:  # the edge was part of the DAG
+            self.removed = True
+        self.touch(edge)
+
+    def add_node(self, node):
+        """
+        Notify that a node was added to the passage, along with any edges it was created with
+        """
+        self.dirty[node] = None
+        for edge in list(node.incoming) + list(node):
+            self.add_edge(edge)
+
+    def remove_node(self, node):
+        """
+        Notify that a node is removed from the passage, along with its edges. Must be called before destroying it
+        """
+        for edge in list(node.incoming) + list(node):
+            self.remove_edge(edge)
+        for state in self.dirty, self.masks, self.node_errors:
+            state.pop(node, None)
+
+    def touch(self, edge):
+        parent, child = edge.parent, edge.child
+        self.masks.pop(parent, None)
+        self.masks.pop(child, None)
+        # Errors about an edge may depend on the tags of edges around both nodes, so re-check nodes with edges to them
+        for node in [parent, child] + parent.parents + child.parents:
+            self.dirty[node] = None
+        for node in child.children:  # Terminals may have become children of a head, or stopped being
+            if node.layer.ID == layer0.LAYER_ID:
+                self.dirty[node] = None
+
+    def update(self):
+        """
+        Apply all changes since the last update to the validation state
+        :return: list of error messages that did not exist before the update
+        """
+        new = []
+        if self.removed:  # cycles may have been broken
+            for edge in list(self.cycles):
+                path = self.find_path(edge.child, edge.parent)
+                if path is None:
+                    del self.cycles[edge]  # the edge is now part of the DAG
+                else:
+                    self.cycles[edge] = self.cycle_message(path)
+            self.removed = False
+        while self.added:
+            edge, _ = self.added.popitem(last=False)
+            path = self.find_path(edge.child, edge.parent)
+            if path is not None:
+                self.cycles[edge] = message = self.cycle_message(path)
+                new.append(message)
+        while self.dirty:
+            node, _ = self.dirty.popitem(last=False)
+            old = self.node_errors.get(node, ())
+            messages = list(self.check(node))
+            if messages:
+                self.node_errors[node] = messages
+                new += [m for m in messages if m not in old]
+            else:
+                self.node_errors.pop(node, None)
+        return new
+
+    def check(self, node):
+        if node.layer.ID == layer0.LAYER_ID:
+            yield from check_terminal(self.constraints, self.l1, node, {p for p in node.parents if self.is_head(p)})
+        elif node.layer.ID == layer1.LAYER_ID:
+            heads = {node} if self.is_head(node) else set()
+            yield from check_top_level_allowed(self.constraints, self.l1, heads)
+            yield from check_node(self.constraints, self.l1, node, heads, self.compiled, self.masks)
+
+    @staticmethod
+    def is_head(node):
+        return node.layer.ID == layer1.LAYER_ID and all(p.layer.ID != layer1.LAYER_ID for p in node.parents)
+
+    def find_cycles(self):
+        """
+        Find edges closing cycles in the whole passage, by depth-first search: removing these edges leaves a DAG
+        """
+        visited = set()
+        for root in self.passage.layer(layer0.LAYER_ID).all + self.l1.all:
+            if root in visited:
+                continue
+            visited.add(root)
+            path = [root]
+            path_set = {root}
+            stack = [iter(root)]
+            while stack:
+                for edge in stack[-1]:
+                    if edge.child in path_set:
+                        self.cycles[edge] = self.cycle_message(path[path.index(edge.child):])
+                    elif edge.child not in visited:
+                        visited.add(edge.child)
+                        path.append(edge.child)
+                        path_set.add(edge.child)
+                        stack.append(iter(edge.child))
+                        break
+                else:
+                    path_set.remove(path.pop())
+                    stack.pop()
+
+    def find_path(self, source, target):
+        """
+        :return: list of nodes on a path from source to target on edges of the DAG, or None if there is none
+        """
+        parents = {source: None}
+        stack = [source]
+        while stack:
+            node = stack.pop()
+            if node is target:
+                path = []
+                while node is not None:
+                    path.append(node)
+                    node = parents[node]
+                return path[::-1]
+            for edge in node:
+                if edge.child not in parents and edge not in self.cycles and edge not in self.added:
+                    parents[edge.child] = node
+                    stack.append(edge.child)
+        return None
+
+    @staticmethod
+    def cycle_message(path):
+        return "Detected cycle (%s)" % "->".join(n.ID for n in path + path[:1])
 
 
 def print_errors(errors, passage_id, id_len=None):
@@ -1,11 +1,14 @@
 """Testing code for the amr format, unit-testing only."""
 
 import unittest
+from types import SimpleNamespace
 
+from ucca import layer1
 from ucca.convert import split2sentences, textutil
+from ucca.evaluation import LABELED, UNLABELED
 
 from semstr.convert import from_amr, to_amr
-from semstr.evaluation.amr import evaluate
+from semstr.evaluation.amr import evaluate, evaluate_pairs
 
 textutil.models["en"] = "en_core_web_sm"
 
@@ -47,6 +50,80 @@ class EvaluationTests(unittest.TestCase):
             scores = evaluate(ref, ref, amr_id=amr_id)
             self.assertAlmostEqual(scores.average_f1(), 1)
 
+    def test_evaluate_pairs(self):
+        """Test that concurrent evaluation gives the same scores as sequential evaluation"""
+        pairs = [(a1, a2) for a1 in TEST_AMRS for a2 in TEST_AMRS]
+        sequential = list(map(str, evaluate_pairs(pairs, workers=1)))
+        self.assertEqual(sequential, list(map(str, evaluate_pairs(pairs, workers=2, chunksize=1))))
+        for (a1, a2), scores in zip(pairs, sequential):
+            if a1 == a2:
+                self.assertEqual(scores, "1.000,1.000,1.000")
+
+    def test_native(self):
+        """Test that the native Smatch implementation finds the same labeled and unlabeled matches as the reference"""
+        for a1 in TEST_AMRS:
+            for a2 in TEST_AMRS:
+                for seed in range(3):
+                    native, reference = [evaluate(a1, a2, native=native, seed=seed) for native in (True, False)]
+                    for eval_type in (LABELED, UNLABELED):
+                        self.assertEqual(*[(r.p, r.r, r.f1) for r in (native[eval_type], reference[eval_type])],
+                                         "%s\n%s\n%s, seed=%d" % (a1, a2, eval_type, seed))
+
+    def test_budget(self):
+        """Test that a search stopped by its budget is marked as truncated, and still returns the best mapping so far"""
+        for native in (True, False):
+            for a1 in TEST_AMRS:
+                self.assertFalse(evaluate(a1, a1, native=native).truncated)
+                scores = evaluate(a1, a1, native=native, max_iterations=0)
+                self.assertTrue(scores.truncated)
+                self.assertAlmostEqual(scores.average_f1(), 1)  # smart initialization is enough for identical AMRs
+
+
+class ConstraintTests(unittest.TestCase):
+    """Tests the AMR constraints."""
+
+    def test_allow_label_mask(self):
+        """Test that the vectorized allowed-label mask agrees with checking each label"""
+        from semstr.constraint.amr import AmrConstraints
+        constraints = AmrConstraints()
+        passages = [passage for passage, _, _ in read_test_amr()]
+        labels = sorted({n.attrib.get("label") for p in passages for n in p.layer(layer1.LAYER_ID).all} - {None})
+        labels += ["Concept(<l>)", "Concept(<l>-01)", "Const(<t>)", "Num(<t>)", "Num(5)", "Num(40)", "Const(-)",
+                   "Const(interrogative)", "Concept(monday)", "Concept(date-entity)", None]
+        for passage in passages:
+            for node in map(as_parser_node, passage.layer(layer1.LAYER_ID).all):
+                mask = constraints.allow_label_mask(node, labels)
+                self.assertEqual(len(mask), len(labels))
+                for label, allowed in zip(labels, mask):
+                    self.assertEqual(bool(constraints.allow_label(node, label)), allowed, (node.ID, label))
+
+    def test_tag_masks(self):
+        """Test that the edge tag masks agree with checking each tag"""
+        from semstr.constraint.amr import AmrConstraints
+        constraints = AmrConstraints()
+        passages = [passage for passage, _, _ in read_test_amr()]
+        tags = sorted({e.tag for p in passages for n in p.layer(layer1.LAYER_ID).all for e in n})
+        for passage in passages:
+            for node in passage.layer(layer1.LAYER_ID).all:
+                self.assertSequenceEqual(list(constraints.allow_parent_mask(node, tags)),
+                                         [bool(constraints.allow_parent(node, tag)) for tag in tags])
+                self.assertSequenceEqual(list(constraints.allow_child_mask(node, tags)),
+                                         [bool(constraints.allow_child(node, tag)) for tag in tags])
+
+
+def as_parser_node(node):  # Add the attributes constraints expect nodes to have during parsing
+    return SimpleNamespace(ID=node.ID, children=node.children, attrib=node.attrib, parents=node.parents,
+                           outgoing_tags={e.tag for e in node}, incoming_tags={e.tag for e in node.incoming},
+                           is_root=not node.incoming)
+
+
+TEST_AMRS = (
+    '(w / want-01 :ARG0 (b / boy) :ARG1 (g / go-01 :ARG0 b :ARG4 (c / city :name (n / name :op1 "Paris"))))',
+    '(w / want-01 :ARG0 (b / boy) :ARG1 (g / go-02 :ARG1 b :ARG4 (c / city :name (n / name :op1 "Paris"))))',
+    '(x / want-01 :ARG1 (y / girl) :ARG0 (z / go-01 :ARG0 y :polarity -))',
+    '(b / boy :ARG0-of (w / want-01 :ARG1 (g / go-01 :ARG0 b :ARG4 (c / city :name (n / name :op1 "Paris")))))',
+)
+
 
 def read_test_amr():
     with open("test_files/LDC2014T12.amr") as f:
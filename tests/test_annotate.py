@@ -0,0 +1,82 @@
+"""Testing code for annotation, unit-testing only."""
+
+import pytest
+from ucca import layer0
+from ucca.ioutil import get_passages
+from ucca import textutil
+from ucca.textutil import Attr
+
+from semstr.convert import iter_passages, from_conllu
+from semstr.scripts.annotate import annotate, annotate_parallel, copy_annotation, ConlluIndex, CONVERTERS
+from semstr.util.annotation_cache import AnnotationCache
+
+PASSAGES = ["test_files/504.xml", "test_files/25650000.xml", "test_files/20001001.sdp"]
+CONLLU = "test_files/UD_English.conllu"
+
+
+@pytest.mark.parametrize("as_array", (True, False), ids=("array", "extra"))
+def test_annotate_parallel(as_array):
+    """Test that annotating shards in parallel gives the same annotation, in the same order, as one process"""
+    kwargs = dict(lang="en", as_array=as_array, as_extra=not as_array)
+    expected = list(annotate(iter_passages(PASSAGES), **kwargs))
+    actual = list(annotate_parallel(iter_passages(PASSAGES), workers=2, shard_size=1, **kwargs))
+    assert [p.ID for p in actual] == [p.ID for p in expected]
+    for passage, expected_passage in zip(actual, expected):
+        l0, expected_l0 = (p.layer(layer0.LAYER_ID) for p in (passage, expected_passage))
+        assert l0.docs() == expected_l0.docs()
+        assert [t.extra for t in l0.all] == [t.extra for t in expected_l0.all]
+
+
+def test_annotation_cache(tmpdir):
+    """Test that cached annotation is identical to the original, and that the model only runs on new token sequences"""
+    annotated = []
+
+    def _annotate(passages):  # fake model, giving large hashes and negative heads as spaCy does
+        for passage in passages:
+            annotated.append(passage.ID)
+            l0 = passage.layer(layer0.LAYER_ID)
+            docs = l0.docs(max(t.paragraph for t in l0.all))
+            for i in range(len(docs)):
+                docs[i] = [[-t.para_pos if a is Attr.HEAD else 3 if a is Attr.ENT_IOB else 2 ** 64 - len(t.text)
+                            for a in Attr] for t in l0.all if t.paragraph == i + 1]
+            for terminal in l0.all:
+                terminal.extra.update((a.key, terminal.text.lower()) for a in Attr if a is not Attr.ENT_TYPE)
+                terminal.extra[Attr.ENT_TYPE.key] = None
+            yield passage
+
+    expected = list(_annotate(iter_passages(PASSAGES)))
+    cache = AnnotationCache(str(tmpdir))
+    actual = list(cache.annotate(iter_passages(PASSAGES[:2]), _annotate))
+    assert annotated == [p.ID for p in expected + expected[:2]]
+    actual += list(cache.annotate(iter_passages(PASSAGES), _annotate))
+    assert annotated[-1:] == [expected[2].ID]  # only the last passage is new
+    assert (cache.hits, cache.misses) == (2, 3)
+    assert [p.ID for p in actual] == [p.ID for p in expected[:2] + expected]
+    for passage, expected_passage in zip(actual, expected[:2] + expected):
+        l0, expected_l0 = (p.layer(layer0.LAYER_ID) for p in (passage, expected_passage))
+        assert l0.docs() == expected_l0.docs()
+        assert [t.extra for t in l0.all] == [t.extra for t in expected_l0.all]
+
+
+def test_annotation_cache_model(tmpdir, monkeypatch):
+    """Test that the cache key depends on the spaCy model set in ucca.textutil.models, which get_nlp loads first"""
+    passage = next(iter_passages(PASSAGES))
+    monkeypatch.setitem(textutil.models, "en", "en_core_web_sm")
+    key = AnnotationCache(str(tmpdir)).key(passage)
+    monkeypatch.setitem(textutil.models, "en", "en_core_web_lg")
+    assert AnnotationCache(str(tmpdir)).key(passage) != key
+
+
+def test_copy_annotation_by_id():
+    """Test that copying annotation by ID from the indexed CoNLL-U file is the same as from fully converted passages"""
+    expected = list(get_passages(CONLLU, converters=CONVERTERS))
+    index = ConlluIndex(CONLLU)
+    assert sorted(index.offsets) == sorted(p.ID for p in expected)
+    with open(CONLLU, encoding="utf-8") as f:
+        passages = list(from_conllu(f))[::-1]  # not annotated, and in a different order
+    for passage in copy_annotation(passages, CONLLU, by_id=True, as_extra=False):
+        expected_passage = next(p for p in expected if p.ID == passage.ID)
+        assert [t.text for t in passage.layer(layer0.LAYER_ID).all] == \
+            [t.text for t in index[passage.ID].layer(layer0.LAYER_ID).all]
+        assert passage.layer(layer0.LAYER_ID).docs() == expected_passage.layer(layer0.LAYER_ID).docs()
+    index.close()
@@ -0,0 +1,29 @@
+"""Testing code for running batch jobs, unit-testing only."""
+
+import os
+
+import pytest
+
+from semstr.batch import run_jobs, parse_command
+
+
+@pytest.mark.parametrize("workers", (1, 2))
+def test_run_jobs(workers, tmpdir):
+    """Test that jobs run in the same process give the same outputs and statuses as separate commands"""
+    out_dir = str(tmpdir)
+    lines = ["python -m semstr.convert test_files/20001001.sdp -f conllu -o " + out_dir,
+             "semstr/scripts/validate.py test_files/504.xml",
+             "semstr.convert --no-such-option",
+             "semstr.no_such_module",
+             "semstr.convert test_files/504.xml -f conllu -o " + out_dir]
+    results = list(run_jobs(lines, workers=workers))
+    assert [(i, line) for i, _, _, line in results] == list(enumerate(lines, start=1))
+    assert [status for _, status, _, _ in results] == [0, 0, 2, 1, 0]
+    assert sorted(os.listdir(out_dir)) == ["20001001.conllu", "504.conllu"]
+
+
+def test_parse_command():
+    assert parse_command("python3 -m semstr.evaluate 'a b' c") == ("semstr.evaluate", ["a b", "c"])
+    assert parse_command("semstr/convert.py a") == ("semstr/convert.py", ["a"])
+    with pytest.raises(ValueError):
+        parse_command("python -m")
@@ -0,0 +1,56 @@
+"""Testing code for format-specific constraints, unit-testing only."""
+
+import pytest
+from ucca import layer1
+
+from semstr.constraints import Direction, TagMasks
+from semstr.convert import iter_passages
+from semstr.validation import CONSTRAINTS
+
+PASSAGES = {
+    None: ["test_files/504.xml", "test_files/25650000.xml"],
+    "sdp": ["test_files/20001001.sdp"],
+    "conllu": ["test_files/UD_English.conllu"],
+}
+
+
+@pytest.mark.parametrize("passage_format", PASSAGES, ids=lambda f: f or "ucca")
+def test_compiled_tag_rules(passage_format):
+    """Test that compiled tag rules find the same violations as checking each TagRule"""
+    constraints = CONSTRAINTS[passage_format]()
+    nodes = [n for p in iter_passages(PASSAGES[passage_format]) for n in p.layer(layer1.LAYER_ID).all]
+    tags = sorted({e.tag for n in nodes for e in n})
+    compiled = constraints.compile_tag_rules(tags[::2])  # The rest of the tags are added to the vocabulary lazily
+    for node in nodes:
+        masks = TagMasks(compiled, node)
+        for direction, edges in ((Direction.outgoing, list(node)), (Direction.incoming, node.incoming)):
+            for tag_or_edge, existing in [(e, True) for e in edges] + [(t, False) for t in tags]:
+                tag = tag_or_edge.tag if existing else tag_or_edge
+                expected = [i for i, rule in enumerate(constraints.tag_rules)
+                            if rule.violation(node, tag_or_edge, direction, message=True)]
+                actual = compiled.violations(masks, tag, direction, existing=existing)
+                assert actual == expected, (node, tag_or_edge, direction)
+                for i in actual:
+                    assert compiled.message(i, node, tag_or_edge, direction)
+    masks = TagMasks(compiled)
+    masks.add(Direction.incoming, tags[0])
+    masks.add(Direction.incoming, tags[0])
+    masks.remove(Direction.incoming, tags[0])
+    assert masks.masks == [compiled.bit(tags[0]), 0]
+    masks.remove(Direction.incoming, tags[0])
+    assert masks.masks == [0, 0]
+
+
+@pytest.mark.parametrize("passage_format", PASSAGES, ids=lambda f: f or "ucca")
+def test_masks(passage_format):
+    """Test that tag masks agree with checking each tag separately"""
+    constraints = CONSTRAINTS[passage_format]()
+    nodes = [n for p in iter_passages(PASSAGES[passage_format]) for n in p.layer(layer1.LAYER_ID).all]
+    tags = sorted({e.tag for n in nodes for e in n})
+    for node in nodes:
+        assert list(constraints.allow_parent_mask(node, tags)) == [bool(constraints.allow_parent(node, t))
+                                                                   for t in tags]
+        assert list(constraints.allow_child_mask(node, tags)) == [bool(constraints.allow_child(node, t))
+                                                                  for t in tags]
+        for child in node.children:
+            assert list(constraints.allow_edge_mask(node, child, tags)) == [True] * len(tags)
@@ -0,0 +1,23 @@
+"""Testing code for domain similarity, unit-testing only."""
+
+import numpy as np
+import pytest
+
+from semstr.scripts.domain_similarity import SIMILARITIES, similarities, sim, to_sparse, count_tokens
+
+PASSAGES = ["test_files/504.xml", "test_files/25650000.xml"]
+
+
+@pytest.mark.parametrize("similarity", SIMILARITIES)
+def test_similarities(similarity):
+    """Test that computing all pairs with sparse matrices gives the same as the dense similarity of each pair"""
+    distributions = []
+    for counts in [count_tokens(f) for f in PASSAGES] + [count_tokens(PASSAGES)]:
+        total = sum(counts.values())
+        distributions.append({word: count / total for word, count in counts.items()})
+    distributions.append({"_%d" % i: 0.1 for i in range(10)})  # disjoint from the rest
+    vocab, reps = to_sparse(distributions)
+    assert reps.shape == (len(distributions), len(vocab))
+    dense = reps.toarray()
+    expected = np.array([[sim(x, y, similarity) for y in dense] for x in dense])
+    assert np.allclose(similarities(reps, similarity), expected)
@@ -0,0 +1,106 @@
+"""Testing code for format-independent evaluation, unit-testing only."""
+
+import json
+from types import SimpleNamespace
+
+import pytest
+from ucca.evaluation import LABELED
+
+from semstr.convert import from_conllu, to_conllu, CONVERTERS
+from semstr.evaluate import Scores, ScoresAccumulator, join_by_id, scores_to_counts, scores_from_counts, raw_counts, \
+    merge_raw_counts, write_csv, evaluate_all
+from semstr.evaluation.conllu import evaluate
+
+
+def test_accumulator():
+    """Test that folding scores one by one gives the same summary as aggregating them all at once"""
+    scores = list(evaluate_test_conllu())
+    accumulator = ScoresAccumulator()
+    for score in scores:
+        accumulator.add(score)
+    assert accumulator.count == len(scores)
+    expected, actual = Scores(scores), accumulator.summary()
+    assert actual.name == expected.name
+    assert actual.titles(LABELED, counts=True) == expected.titles(LABELED, counts=True)
+    assert actual.fields(LABELED, counts=True) == expected.fields(LABELED, counts=True)
+
+
+@pytest.mark.parametrize("index_guessed", (False, True), ids=("index_ref", "index_guessed"))
+def test_join_by_id(index_guessed, capsys):
+    """Test that passages are matched by ID regardless of order, and unmatched ones are reported"""
+    guessed = [SimpleNamespace(ID=i) for i in ("10", "9", "2", "3")]
+    ref = [(SimpleNamespace(ID=i), None) for i in ("2", "10", "9", "11")]
+    joined = list(join_by_id(guessed, ref, index_guessed=index_guessed))
+    assert sorted((g.ID, r.ID) for g, r, _ in joined) == [("10", "10"), ("2", "2"), ("9", "9")]
+    err = capsys.readouterr().err
+    assert "1 guessed passages without a match: 3" in err
+    assert "1 reference passages without a match: 11" in err
+
+
+def test_counts_round_trip():
+    """Test that score objects restored from cached counts give the same results as the original ones"""
+    scores = list(evaluate_test_conllu())
+    restored = [scores_from_counts(json.loads(json.dumps(scores_to_counts(s)))) for s in scores]
+    assert [type(s) for s in restored] == [type(s) for s in scores]
+    assert [s.fields(LABELED, counts=True) for s in restored] == [s.fields(LABELED, counts=True) for s in scores]
+    assert Scores(restored).fields(LABELED) == Scores(scores).fields(LABELED)
+
+
+def test_cache_matching_ids(tmpdir):
+    """Test that matching passages by ID is part of the cache key, since it pairs passages differently than by order"""
+    guessed = str(tmpdir.join("reversed.conllu"))
+    with open("test_files/UD_English.conllu") as f:
+        sentences = f.read().strip().split("\n\n")
+    with open(guessed, "w") as f:
+        f.write("\n\n".join(reversed(sentences)) + "\n\n")
+    files = [[guessed], ["test_files/UD_English.conllu"], None]
+    kwargs = dict(cache_dir=str(tmpdir.join("cache")), format="conllu", quiet=True, progress=False)
+    for _ in range(2):  # evaluated, then cached
+        assert [s.average_f1() for s in evaluate_all(evaluate, files, matching_ids=True, **kwargs)] == [1, 1]
+    with pytest.raises(AssertionError, match="Tokens do not match"):  # evaluated by order, not loaded from the cache
+        list(evaluate_all(evaluate, files, matching_ids=False, **kwargs))
+
+
+@pytest.mark.parametrize("num_shards", (2, 3))
+def test_shard(tmpdir, monkeypatch, num_shards):
+    """Test that shards together evaluate every passage once, converting only the passages in the shard"""
+    filename = str(tmpdir.join("passages.conllu"))
+    with open(filename, "w") as out:
+        for lang in ("English", "German", "English"):
+            with open("test_files/UD_%s.conllu" % lang) as f:
+                out.write(f.read().strip() + "\n\n")
+    converted = []
+
+    def _from_conllu(*args, **kwargs):
+        for item in from_conllu(*args, **kwargs):
+            converted.append(item[-1])
+            yield item
+
+    monkeypatch.setitem(CONVERTERS, "conllu", (_from_conllu, to_conllu))
+    files = [[filename], [filename], None]
+    expected = [s.ID for s in evaluate_all(evaluate, files, format="conllu", quiet=True, progress=False)]
+    assert len(expected) == 5
+    for index in range(1, num_shards + 1):
+        converted.clear()
+        ids = [s.ID for s in evaluate_all(evaluate, files, format="conllu", quiet=True, progress=False,
+                                          shard=(index, num_shards))]
+        assert ids == expected[index - 1::num_shards]
+        assert sorted(converted) == sorted(2 * ids)  # guessed and reference
+
+
+def test_merge_raw_counts(tmpdir):
+    """Test that merging raw counts from separate runs gives the same summary as a single run"""
+    scores = list(evaluate_test_conllu()) * 3
+    filenames = [str(tmpdir.join("raw%d.csv" % i)) for i in range(2)]
+    write_csv(filenames[0], raw_counts(Scores(scores[:1])))
+    write_csv(filenames[1], raw_counts(Scores(scores[1:])))
+    expected, actual = Scores(scores), merge_raw_counts(filenames)
+    assert actual.titles(LABELED, counts=True) == expected.titles(LABELED, counts=True)
+    assert actual.fields(LABELED, counts=True) == expected.fields(LABELED, counts=True)
+    assert actual.fields(LABELED) == expected.fields(LABELED)
+
+
+def evaluate_test_conllu():
+    with open("test_files/UD_English.conllu") as f:
+        for passage, ref, _ in from_conllu(f, return_original=True):
+            yield evaluate(to_conllu(passage), ref)
@@ -0,0 +1,37 @@
+"""Testing code for filtering word vectors, unit-testing only."""
+
+import numpy as np
+import pytest
+from ucca.textutil import read_word_vectors
+
+from semstr.scripts.filter_word_vectors import filter_word_vectors, write_text, write_npy, load_npy
+
+VECTORS = {"the": [0.1, -0.2, 0.3], "cat": [1.5, 2.0, -3.25], "sat": [0.0, 0.5, 1.0], "on": [4.0, 5.0, 6.0]}
+
+
+@pytest.mark.parametrize("header", (True, False), ids=("header", "no_header"))
+def test_filter_word_vectors(tmpdir, header):
+    """Test that filtered vectors are read back the same from text and from a memory-mapped NumPy file"""
+    filename = str(tmpdir.join("vectors.txt"))
+    with open(filename, "w", encoding="utf-8") as f:
+        if header:
+            print(len(VECTORS) + 1, 3, file=f)
+        for word, vector in VECTORS.items():
+            print(word, *vector, file=f)
+        print("cat 9 9 9", file=f)  # duplicate: only the first is kept
+    words = {"cat", "on", "dog"}
+    expected = [(w, v) for w, v in VECTORS.items() if w in words]
+    it = filter_word_vectors(filename, words)
+    nr_row, nr_dim = next(it)
+    assert (nr_row, nr_dim) == ((len(VECTORS) + 1) if header else None, 3)
+    out = filename + ".filtered"
+    assert write_text(out, it, nr_row, nr_dim) == len(expected)
+    it = read_word_vectors(None, None, out)
+    assert next(it) == (len(expected), 3)
+    assert [(w, list(v)) for w, v in it] == expected
+    it = filter_word_vectors(filename, words)
+    next(it)
+    assert write_npy(out, it, nr_dim) == len(expected)
+    vocab, matrix = load_npy(out)
+    assert isinstance(matrix, np.memmap) and matrix.dtype == np.float32 and matrix.shape == (len(expected), 3)
+    assert [(w, matrix[vocab[w]].tolist()) for w, _ in expected] == expected
@@ -0,0 +1,109 @@
+"""Testing code for the find database, unit-testing only."""
+
+import sqlite3
+
+import pytest
+
+from ucca import layer0
+
+from semstr.convert import iter_passages
+from semstr.scripts import create_find_db
+from semstr.scripts.create_find_db import write_db, to_rows, INDEXED_COLUMNS
+from semstr.scripts.find_load_test import sample_queries, query_local, load_test
+from semstr.util.find_db import ConnectionPool, build_query, page_end, find_rows, is_under
+
+
+def passage_rows(pid, words, dep="dep"):
+    return pid, [(pid, "0.%d" % i, word, "C", "1.%d" % i, dep, i) for i, word in enumerate(words, start=1)], \
+        [(pid, "1.%d" % i, "H", i - 1, i) for i, _ in enumerate(words, start=1)]
+
+
+@pytest.mark.parametrize("bulk", (False, True), ids=("commit", "bulk"))
+def test_write_db(tmpdir, bulk):
+    """Test creating a new database, then updating some passages by ID and adding others"""
+    filename = str(tmpdir.join("find.db"))
+    rows = [passage_rows(str(i), ["a", "b", "c"][:i]) for i in range(1, 4)]
+    assert write_db(filename, rows, bulk=bulk, transaction_size=2) == 3
+    assert write_db(filename, [passage_rows("2", ["x"], dep="new"), passage_rows("4", ["d"])], bulk=bulk,
+                    update=True) == 2
+    conn = sqlite3.connect(filename)
+    try:
+        assert sorted(conn.execute("SELECT pid, text, dep FROM terminals")) == [
+            ("1", "a", "dep"), ("2", "x", "new"), ("3", "a", "dep"), ("3", "b", "dep"), ("3", "c", "dep"),
+            ("4", "d", "dep")]
+        indexes = {name for name, in conn.execute("SELECT name FROM sqlite_master WHERE type='index'")}
+        assert indexes == {"idx_terminals_" + column for column in INDEXED_COLUMNS + ("text_nocase",)} | {
+            "idx_units_pid_ftag"}
+        assert conn.execute("SELECT COUNT(*) FROM units WHERE pid='2'").fetchone()[0] == 1
+        assert conn.execute("PRAGMA journal_mode").fetchone()[0] == ("wal" if bulk else "delete")
+    finally:
+        conn.close()
+    assert write_db(filename, rows[:1], bulk=bulk) == 1  # overwrite
+    conn = sqlite3.connect(filename)
+    try:
+        assert list(conn.execute("SELECT pid, text FROM terminals")) == [("1", "a")]
+    finally:
+        conn.close()
+
+
+@pytest.fixture
+def db(tmpdir):
+    filename = str(tmpdir.join("find.db"))
+    write_db(filename, (passage_rows(str(i), ["w%d" % (j * i % 7) for j in range(10)], dep="dep%d" % (i % 3))
+                        for i in range(100)), bulk=True)
+    return filename
+
+
+@pytest.mark.parametrize("filters", ({"text": "w1"}, {"text": "W1"}, {"dep": "dep1", "text": "w3"}, {"pid": "5"}, {}),
+                         ids=("text", "nocase", "dep_text", "pid", "all"))
+def test_find_pages(db, filters):
+    """Test that only the given filters are queried, using an index, and that reading page by page gives all rows"""
+    pool = ConnectionPool(db, size=2)
+    with pool.connection() as conn:
+        sql, params = build_query(filters, nocase=True)
+        plan = " ".join(str(step) for step in conn.execute("EXPLAIN QUERY PLAN " + sql, params))
+        assert "IS NULL" not in sql and ("INDEX" in plan if filters else "SCAN" in plan), plan
+        expected = list(find_rows(conn, filters, nocase=True))
+        assert expected
+        pages = []
+        cursor = None
+        while True:
+            end = page_end(conn, filters, nocase=True, limit=7, cursor=cursor)
+            pages.append(list(find_rows(conn, filters, nocase=True, cursor=cursor, end=end, limit=7)))
+            if end is None:
+                break
+            cursor = end
+    assert all(len(page) == 7 for page in pages[:-1]) and len(pages[-1]) <= 7
+    assert [row for page in pages for row in page] == expected
+    with pytest.raises(Exception):  # read-only
+        with pool.connection() as conn:
+            conn.execute("DELETE FROM terminals")
+    pool.close()
+
+
+def test_find_load(db):
+    """Test that concurrent queries sharing a small pool all succeed"""
+    pool = ConnectionPool(db, size=2)
+    queries = sample_queries(db, 50)
+    expected = sum(query_local(pool, filters) for filters in queries)
+    latencies, rows, errors, _ = load_test(lambda filters: query_local(pool, filters, limit=5), queries, threads=8)
+    assert (len(latencies), rows, errors) == (50, expected, 0)
+    assert pool.opened <= 2
+    pool.close()
+
+
+@pytest.mark.parametrize("under", (("H",), ("P",), ("H", "P"), ("H", "A"), ("H", "A", "C"), ("A", "H")),
+                         ids="/".join)
+def test_find_under(tmpdir, monkeypatch, under):
+    """Test that structural queries on the index give the same terminals as checking the passages' ancestors"""
+    monkeypatch.setattr(create_find_db, "get_annotation", lambda t, udpipe=None: "dep%d" % (t.position % 2))
+    passages = list(iter_passages(["test_files/504.xml", "test_files/25650000.xml"]))
+    filename = str(tmpdir.join("find.db"))
+    write_db(filename, map(to_rows, passages), bulk=True)
+    expected = [(p.ID, t.ID) for p in passages for t in p.layer(layer0.LAYER_ID).all
+                if is_under(t, under) and t.position % 2]
+    assert expected or under == ("A", "H")  # no H inside an A in these passages
+    with ConnectionPool(filename, size=1).connection() as conn:
+        sql, params = build_query(dict(dep="dep1"), under=under)
+        assert "INDEX idx_units_pid_ftag" in " ".join(str(s) for s in conn.execute("EXPLAIN QUERY PLAN " + sql, params))
+        assert sorted((row[0], row[1]) for row in find_rows(conn, dict(dep="dep1"), under=under)) == sorted(expected)
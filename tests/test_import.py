@@ -0,0 +1,55 @@
+"""Testing code for import time, unit-testing only."""
+
+import subprocess
+import sys
+from collections import namedtuple
+from types import SimpleNamespace
+
+import pytest
+
+HEAVY_MODULES = ("spotlight", "requests", "word2number", "src.amr", "penman", "spacy")
+
+
+@pytest.mark.parametrize("module", ("semstr.convert", "semstr.validation", "semstr.evaluate",
+                                    "semstr.constraint.amr", "semstr.scripts.validate"))
+def test_import_time(module):
+    """Test that importing does not load dependencies that are only needed when using specific features"""
+    times = import_times(module)
+    assert module in times
+    loaded = [m for m in HEAVY_MODULES if m in times]
+    assert not loaded, "Importing %s loads %s (%s)" % (
+        module, ", ".join(loaded), ", ".join("%s: %.3fs" % (m, times[m]) for m in loaded))
+
+
+def test_lazy_amr_attributes(monkeypatch):
+    """Test that the attributes of semstr.util.amr that require the AMR library are still available, on first access"""
+    from semstr.util import amr
+    concept = namedtuple("Concept", "name")
+    monkeypatch.setattr(amr.get_amr_lib, "module", SimpleNamespace(Concept=concept))
+    monkeypatch.delitem(vars(amr), "EXTENSIONS", raising=False)
+    try:
+        assert amr.amr_lib is amr.get_amr_lib.module
+        assert amr.EXTENSIONS == {"wiki": (), "numbers": (), "urls": (concept("url-entity"),)}
+        assert amr.EXTENSIONS is amr.EXTENSIONS
+        with pytest.raises(AttributeError):
+            amr.missing
+    finally:
+        vars(amr).pop("EXTENSIONS", None)
+
+
+def import_times(module):
+    """
+    :param module: name of module to import in a new interpreter
+    :return: dict of module name -> cumulative import time in seconds, as reported by python -X importtime
+    """
+    process = subprocess.run([sys.executable, "-X", "importtime", "-c", "import " + module],
+                             stderr=subprocess.PIPE, universal_newlines=True, check=True)
+    times = {}
+    for line in process.stderr.splitlines():
+        if line.startswith("import time:") and "|" in line:
+            _, cumulative, name = line.split("|")
+            try:
+                times[name.strip()] = int(cumulative) / 1e6
+            except ValueError:  # header line
+                pass
+    return times
@@ -0,0 +1,48 @@
+"""Testing code for the model registry, unit-testing only."""
+
+import pytest
+
+from semstr.util import models
+from semstr.util.models import ModelRegistry, get_model
+
+
+@pytest.fixture
+def registry(monkeypatch):
+    registry = ModelRegistry(max_models=2)
+    monkeypatch.setattr(models, "REGISTRY", registry)
+    yield registry
+    registry.clear()
+
+
+def test_registry(registry):
+    """Test that each model is loaded only once while cached, and the least recently used one is evicted"""
+    loaded, unloaded = [], []
+    registry.register("test", lambda name, lang: loaded.append((name, lang)) or (name, lang),
+                      lambda name, lang: unloaded.append((name, lang)))
+    assert get_model("test", "a") == ("a", None)
+    assert get_model("test", "a") == ("a", None)
+    assert get_model("test", "b", lang="en") == ("b", "en")
+    assert get_model("test", "a") == ("a", None)  # "b" becomes least recently used
+    assert get_model("test", "c") == ("c", None)
+    assert loaded == [("a", None), ("b", "en"), ("c", None)]
+    assert unloaded == [("b", "en")]
+    assert get_model("test", "b", lang="en") == ("b", "en")
+    assert loaded[-1] == ("b", "en") and unloaded[-1] == ("a", None)
+    stats = registry.stats[("test", "a", None)]
+    assert (stats.loads, stats.hits, stats.evictions) == (1, 2, 1)
+    assert registry.stats[("test", "b", "en")].loads == 2
+    registry.clear()
+    assert not registry.models
+    with pytest.raises(ValueError):
+        get_model("no-such-backend")
+
+
+def test_set_max_models(registry):
+    """Test that lowering the limit of the registry unloads the least recently used models right away"""
+    unloaded = []
+    registry.register("test", lambda name, lang: name, lambda name, lang: unloaded.append(name))
+    for name in "ab":
+        get_model("test", name)
+    assert ModelRegistry(max_models=1).max_models == 1 and registry.max_models == 2  # not shared between instances
+    registry.set_max_models(1)
+    assert unloaded == ["a"] and list(registry.models) == [("test", "b", None)]
@@ -0,0 +1,42 @@
+"""Testing code for UDPipe annotation, unit-testing only."""
+
+import pytest
+from ucca import layer0
+
+from semstr.convert import iter_passages
+from semstr.scripts.udpipe import annotate_udpipe, batches
+
+
+def test_batches():
+    assert list(batches(range(5), 2)) == [[0, 1], [2, 3], [4]]
+    assert list(batches(range(5))) == [list(range(5))]
+    assert list(batches([], 2)) == []
+
+
+@pytest.mark.parametrize("batch_size", (None, 1, 3))
+def test_annotate_streaming(batch_size):
+    """Test that passages are annotated as each batch is parsed, rather than after reading all of them"""
+    passages = list(iter_passages(["test_files/UD_English.conllu", "test_files/UD_German.conllu",
+                                   "test_files/20001001.sdp", "test_files/504.xml", "test_files/25650000.xml"]))
+    read = []
+    parsed = []
+
+    def _read():
+        for passage in passages:
+            read.append(passage)
+            yield passage
+
+    def _parser(sentences, *args, batch_size=None, **kwargs):
+        del args, kwargs
+        for batch in batches(sentences, batch_size):
+            parsed.append(len(batch))
+            yield from (line for lines in batch for line in lines)  # echo the input, as if it was parsed
+
+    for i, passage in enumerate(annotate_udpipe(_read(), "model", as_extra=False, parser=_parser,
+                                                batch_size=batch_size), start=1):
+        assert passage is passages[i - 1]
+        assert passage.layer(layer0.LAYER_ID).docs()[0]
+        if batch_size:
+            assert len(read) <= i + batch_size
+    assert len(read) == len(passages)
+    assert len(parsed) == (1 if batch_size is None else -(-sum(parsed) // batch_size))
@@ -0,0 +1,101 @@
+"""Testing code for passage validation, unit-testing only."""
+
+from collections import Counter
+
+import pytest
+from ucca import layer0, layer1
+from ucca.layer1 import EdgeTags
+
+from semstr.convert import iter_passages
+from semstr.validation import validate, IncrementalValidator, get_constraints, detect_cycles, check_orphan_terminals, \
+    check_root_terminal_children, check_multiple_incoming, check_top_level_allowed, check_multigraph, \
+    check_implicit_children, check_top_level_only, check_required_outgoing, check_tag_rules
+
+PASSAGES = {
+    None: ["test_files/504.xml"],
+    "sdp": ["test_files/20001001.sdp"],
+    "conllu": ["test_files/UD_English.conllu"],
+}
+
+
+@pytest.mark.parametrize("passage_format", PASSAGES, ids=lambda f: f or "ucca")
+def test_validate(passage_format):
+    """Test that the single-pass validation gives the same errors as running each check separately"""
+    for passage in iter_passages(PASSAGES[passage_format]):
+        add_violations(passage)
+        timing = {}
+        errors = list(validate(passage, output_format=passage_format, timing=timing))
+        assert errors == list(validate_separately(passage, passage_format))
+        assert errors
+        assert "check_tag_rules" in timing
+
+
+@pytest.mark.parametrize("passage_format", PASSAGES, ids=lambda f: f or "ucca")
+def test_incremental(passage_format):
+    """Test that incremental validation after each change gives the same errors as validating from scratch"""
+    for passage in iter_passages(PASSAGES[passage_format]):
+        validator = IncrementalValidator(passage, output_format=passage_format)
+        assert_same_errors(validator, passage, passage_format)
+        valid = validator.valid
+        if passage_format == "conllu":  # Elsewhere the cycle violates tag rules, but nodes in it cannot be printed
+            l1 = passage.layer(layer1.LAYER_ID)
+            edge = next(e for n in l1.all if n not in l1.heads for e in n if e.child.tag == n.tag)
+            cycle = edge.child.add(EdgeTags.Participant, edge.parent, edge_attrib={"remote": True})
+            validator.add_edge(cycle)
+            assert any(m.startswith("Detected cycle") for m in validator.update())
+            assert_same_errors(validator, passage, passage_format)
+            validator.remove_edge(cycle)
+            cycle.parent.remove(cycle)
+            assert validator.valid == valid
+        edges = add_violations(passage, validator)
+        node = passage.layer(layer1.LAYER_ID).add_fnode(edges[0].parent, EdgeTags.Function)
+        validator.add_node(node)
+        assert_same_errors(validator, passage, passage_format)
+        validator.remove_node(node)
+        node.destroy()
+        assert_same_errors(validator, passage, passage_format)
+        for edge in reversed(edges):
+            validator.remove_edge(edge)
+            edge.parent.remove(edge)
+            assert_same_errors(validator, passage, passage_format)
+        assert validator.valid == valid
+
+
+def assert_same_errors(validator, passage, passage_format):
+    errors = list(validator.errors())
+    expected = list(validate(passage, output_format=passage_format))
+    assert Counter(m for m in errors if not m.startswith("Detected cycle")) == \
+        Counter(m for m in expected if not m.startswith("Detected cycle"))
+    assert any(m.startswith("Detected cycle") for m in errors) == any(detect_cycles(passage))
+    assert validator.valid == (not errors)
+
+
+def add_violations(passage, validator=None):
+    nodes = [n for n in passage.layer(layer1.LAYER_ID).all if n.tag == layer1.NodeTags.Foundational]
+    tags = [EdgeTags.Function, EdgeTags.Process, EdgeTags.State, EdgeTags.LinkRelation]
+    edges = []
+    for i, node in enumerate(nodes[1:6]):
+        for tag in tags[i % len(tags):]:
+            edges.append(node.add(tag, nodes[(i + 3) % len(nodes)]))
+            if validator is not None:
+                validator.add_edge(edges[-1])
+    return edges
+
+
+def validate_separately(passage, passage_format):
+    constraints = get_constraints(passage_format)
+    yield from detect_cycles(passage)
+    l0 = passage.layer(layer0.LAYER_ID)
+    l1 = passage.layer(layer1.LAYER_ID)
+    for terminal in l0.all:
+        yield from check_orphan_terminals(constraints, terminal)
+        yield from check_root_terminal_children(constraints, l1, terminal)
+        yield from check_multiple_incoming(constraints, terminal)
+    yield from check_top_level_allowed(constraints, l1)
+    for node in l1.all:
+        yield from check_multigraph(constraints, node)
+        yield from check_implicit_children(constraints, node)
+        yield from check_multiple_incoming(constraints, node)
+        yield from check_top_level_only(constraints, l1, node)
+        yield from check_required_outgoing(constraints, node)
+        yield from check_tag_rules(constraints, node)